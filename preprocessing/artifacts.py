@@ -0,0 +1,92 @@
+# Precompressed copies of output.bin for static hosting, so the host can
+# serve output.bin.gz / output.bin.br directly instead of compressing the
+# file again on every request
+#
+# Alongside them, output.artifacts.json records the size and SHA-256 of each
+# file and how many bytes every section of output.bin takes, raw and
+# gzipped on its own, to show where the bytes go.
+
+import gzip
+import hashlib
+import json
+import os
+
+import brotli
+
+from binary_format import HEADER, SECTION, read_sections
+
+
+def merge_ranges(ranges):
+    """Sorts (offset, length) ranges, joining the ones that touch."""
+    merged = []
+    for offset, length in sorted(ranges):
+        if merged and merged[-1][0] + merged[-1][1] == offset:
+            merged[-1][1] += length
+        else:
+            merged.append([offset, length])
+    return [tuple(r) for r in merged]
+
+
+def v2_sections(data):
+    """Byte ranges of a v2 file: the header with its section index, then
+    every section."""
+    _, sections = read_sections(data)
+    ranges = {"header": [(0, HEADER.size + SECTION.size * len(sections))]}
+    for name, (offset, size) in sections.items():
+        ranges[name] = [(offset, size)]
+    return ranges
+
+
+def describe(data):
+    return {"bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def compressors():
+    """(suffix, compress function) for every available encoding, at maximum
+    compression. gzip output has no timestamp so builds are reproducible."""
+    return [
+        (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+        (".br", lambda data: brotli.compress(data, quality=11)),
+    ]
+
+
+def write_artifacts(fn, sections, stages):
+    """Writes compressed copies of fn next to it, given its sections as
+    {name: [(offset, length), ...]}, and returns the manifest."""
+    with open(fn, "rb") as f:
+        data = f.read()
+
+    manifest = {os.path.basename(fn): describe(data), "sections": {}}
+    for suffix, compress in compressors():
+        with stages.stage("compress") as stage:
+            compressed = compress(data)
+            stage.items += 1
+            stage.bytes += len(compressed)
+        with open(fn + suffix, "wb") as f:
+            f.write(compressed)
+        manifest[os.path.basename(fn) + suffix] = describe(compressed)
+
+    with stages.stage("section_sizes") as stage:
+        for name, ranges in sections.items():
+            section = b"".join(
+                data[offset : offset + length]
+                for offset, length in merge_ranges(ranges)
+            )
+            manifest["sections"][name] = {
+                "bytes": len(section),
+                "gzip_bytes": len(gzip.compress(section, compresslevel=9, mtime=0)),
+            }
+            stage.items += 1
+
+    manifest_fn = os.path.join(os.path.dirname(fn), "output.artifacts.json")
+    with open(manifest_fn, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def print_manifest(manifest):
+    for name, info in manifest.items():
+        if name != "sections":
+            print(f"{name:>24} {info['bytes']:>10} {info['sha256'][:12]}")
+    for name, info in manifest["sections"].items():
+        print(f"{name:>24} {info['bytes']:>10} {info['gzip_bytes']:>10} gzipped")
@@ -0,0 +1,381 @@
+# Benchmarks the preprocessing pipeline (download -> nyt_process -> process)
+# on synthetic NYT-format CSVs and GeoJSON of configurable size, e.g.
+#
+#   python bench.py --counties 3000 --days 2000
+#   python bench.py --compare bench_results/a.json bench_results/b.json
+#
+# Each stage's wall time and peak traced memory are written as JSON to
+# bench_results/ so runs can be compared across commits.
+
+import contextlib
+import csv
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+import fixture_server
+from download import download
+from nyt_process import START_DATE, nyt_process
+from process import process
+
+RESULTS_DIR = "bench_results"
+
+# States used for synthetic places, by FIPS
+STATES = {
+    "01": "Alabama",
+    "02": "Alaska",
+    "04": "Arizona",
+    "05": "Arkansas",
+    "06": "California",
+    "08": "Colorado",
+    "09": "Connecticut",
+    "10": "Delaware",
+    "11": "District of Columbia",
+    "12": "Florida",
+    "13": "Georgia",
+    "15": "Hawaii",
+    "16": "Idaho",
+    "17": "Illinois",
+    "18": "Indiana",
+    "19": "Iowa",
+    "20": "Kansas",
+    "21": "Kentucky",
+    "22": "Louisiana",
+    "23": "Maine",
+    "24": "Maryland",
+    "25": "Massachusetts",
+    "26": "Michigan",
+    "27": "Minnesota",
+    "28": "Mississippi",
+    "29": "Missouri",
+    "30": "Montana",
+    "31": "Nebraska",
+    "32": "Nevada",
+    "33": "New Hampshire",
+    "34": "New Jersey",
+    "35": "New Mexico",
+    "36": "New York",
+    "37": "North Carolina",
+    "38": "North Dakota",
+    "39": "Ohio",
+    "40": "Oklahoma",
+    "41": "Oregon",
+    "42": "Pennsylvania",
+    "44": "Rhode Island",
+    "45": "South Carolina",
+    "46": "South Dakota",
+    "47": "Tennessee",
+    "48": "Texas",
+    "49": "Utah",
+    "50": "Vermont",
+    "51": "Virginia",
+    "53": "Washington",
+    "54": "West Virginia",
+    "55": "Wisconsin",
+    "56": "Wyoming",
+}
+
+# Counties process() always combines, so they must exist in the census data
+COMBINED_COUNTIES = [
+    "36081",
+    "36047",
+    "36085",
+    "36005",
+    "36061",
+    "02060",
+    "02164",
+    "02282",
+    "02105",
+]
+
+
+def synthetic_places(num_counties):
+    state_fips = sorted(STATES)
+    per_state = math.ceil(num_counties / len(state_fips))
+    if per_state > 999:
+        raise ValueError("At most 999 counties per state are supported")
+    places = []
+    for i in range(num_counties):
+        state = state_fips[i % len(state_fips)]
+        county = f"{i // len(state_fips) + 1:03d}"
+        places.append((f"County {state}{county}", STATES[state], state + county))
+    return places
+
+
+def ring(cx, cy, radius, vertices):
+    coords = [
+        [
+            cx + radius * math.cos(2 * math.pi * i / vertices),
+            cy + radius * math.sin(2 * math.pi * i / vertices),
+        ]
+        for i in range(vertices)
+    ]
+    return coords + [coords[0]]
+
+
+def write_geojson(path, features):
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def generate(working_dir, num_counties, num_days, vertices, seed=0):
+    """Writes a synthetic preprocessing working directory, returning the
+    directory of files to serve to download()."""
+    rng = random.Random(seed)
+    places = synthetic_places(num_counties)
+    county_fips = sorted({fips for _, _, fips in places} | set(COMBINED_COUNTIES))
+
+    os.makedirs(os.path.join(working_dir, "geo"), exist_ok=True)
+    os.makedirs(os.path.join(working_dir, "population"), exist_ok=True)
+    os.makedirs(os.path.join(working_dir, "../public"), exist_ok=True)
+
+    # Lay states out on a grid and scatter their counties inside each cell
+    grid = math.ceil(math.sqrt(len(STATES)))
+    cell = 100
+    state_features = []
+    for i, state in enumerate(sorted(STATES)):
+        x, y = (i % grid) * cell, (i // grid) * cell
+        state_features.append(
+            {
+                "type": "Feature",
+                "id": i,
+                "properties": {"STATE": state, "NAME": STATES[state]},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [[x, y], [x + cell, y], [x + cell, y + cell], [x, y + cell]]
+                    ],
+                },
+            }
+        )
+    write_geojson(os.path.join(working_dir, "geo/states.json"), state_features)
+
+    county_features = []
+    for i, fips in enumerate(county_fips):
+        state_index = sorted(STATES).index(fips[:2])
+        x = (state_index % grid) * cell + rng.uniform(5, cell - 5)
+        y = (state_index // grid) * cell + rng.uniform(5, cell - 5)
+        county_features.append(
+            {
+                "type": "Feature",
+                "id": i,
+                "properties": {"STATE": fips[:2], "COUNTY": fips[2:], "NAME": fips},
+                "geometry": {
+                    "type": "MultiPolygon",
+                    "coordinates": [
+                        [ring(x, y, 4, vertices), ring(x, y, 1, vertices // 4 + 3)]
+                    ],
+                },
+            }
+        )
+    write_geojson(os.path.join(working_dir, "geo/counties.json"), county_features)
+
+    # Census population estimates, with the columns process() reads
+    with open(
+        os.path.join(working_dir, "population/co-est2018-alldata.csv"),
+        "w",
+        newline="",
+        encoding="latin-1",
+    ) as f:
+        writer = csv.writer(f)
+        writer.writerow(["SUMLEV", "", "", "STATE", "COUNTY", "STNAME"] + [""] * 12)
+        for state in sorted(STATES):
+            writer.writerow(
+                ["040", "", "", state, "000", STATES[state]]
+                + [""] * 11
+                + [str(rng.randrange(500000, 40000000))]
+            )
+        for fips in county_fips:
+            writer.writerow(
+                ["050", "", "", fips[:2], fips[2:], STATES[fips[:2]]]
+                + [""] * 11
+                + [str(rng.randrange(1000, 1000000))]
+            )
+
+    with open(os.path.join(working_dir, "last_updated.txt"), "w") as f:
+        f.write("Jan 1, 2020 at 12:00 AM EST")
+
+    # Source files served to download()
+    source_dir = os.path.join(working_dir, "sources")
+    os.makedirs(source_dir, exist_ok=True)
+    totals = [[0, 0] for _ in places]
+    with open(os.path.join(source_dir, "historical.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "county", "state", "fips", "cases", "deaths"])
+        for day in range(num_days - 1):
+            timestamp = (START_DATE + timedelta(days=day)).isoformat()
+            for i, (county, state, fips) in enumerate(places):
+                total = totals[i]
+                total[0] += rng.randrange(0, 50)
+                total[1] += rng.randrange(0, 2)
+                if total[0] > 0:
+                    writer.writerow([timestamp, county, state, fips] + total)
+
+    with open(os.path.join(source_dir, "live.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "county", "state", "fips", "cases", "deaths"])
+        timestamp = (START_DATE + timedelta(days=num_days - 1)).isoformat()
+        for total, (county, state, fips) in zip(totals, places):
+            writer.writerow([timestamp, county, state, fips] + total)
+
+    with open(os.path.join(source_dir, "commits.json"), "w") as f:
+        json.dump([{"commit": {"committer": {"date": "2020-01-01T05:00:00Z"}}}], f)
+
+    return source_dir
+
+
+def measure(fn, trace_memory=True):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        fn()
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(num_counties, num_days, vertices, trace_memory=True, latency=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        working_dir = os.path.join(tmp, "preprocessing")
+        start = time.perf_counter()
+        source_dir = generate(working_dir, num_counties, num_days, vertices)
+        generate_seconds = time.perf_counter() - start
+
+        server = fixture_server.serve(source_dir, latency=latency)
+        base = f"http://127.0.0.1:{server.server_port}"
+        try:
+            stages = {
+                "download": measure(
+                    lambda: download(
+                        working_dir,
+                        live_url=base + "/live.csv",
+                        historical_url=base + "/historical.csv",
+                        last_updated_url=base + "/commits.json",
+                    ),
+                    trace_memory,
+                ),
+            }
+        finally:
+            server.shutdown()
+
+        stages["nyt_process"] = measure(
+            lambda: nyt_process(working_dir, "npy"), trace_memory
+        )
+        stages["process"] = measure(
+            lambda: process(working_dir, nyt_format="npy"), trace_memory
+        )
+        # Second build reuses the geometry cached by the first
+        stages["process_cached_geometry"] = measure(
+            lambda: process(working_dir, nyt_format="npy"), trace_memory
+        )
+        output_bytes = os.path.getsize(os.path.join(tmp, "public/output.bin"))
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {
+            "counties": num_counties,
+            "days": num_days,
+            "vertices": vertices,
+            "trace_memory": trace_memory,
+            "latency": latency,
+        },
+        "generate_seconds": generate_seconds,
+        "output_bytes": output_bytes,
+        "stages": stages,
+    }
+
+
+def compare(before_fn, after_fn):
+    with open(before_fn) as f:
+        before = json.load(f)
+    with open(after_fn) as f:
+        after = json.load(f)
+    print(f"{before['commit']} -> {after['commit']}")
+    for stage, result in after["stages"].items():
+        previous = before["stages"].get(stage)
+        if previous is None:
+            continue
+        line = f"{stage:>24}: {previous['seconds']:8.2f}s -> {result['seconds']:8.2f}s"
+        line += f" ({result['seconds'] / previous['seconds']:.2f}x)"
+        if previous["peak_bytes"] and result["peak_bytes"]:
+            line += (
+                f", peak {previous['peak_bytes'] / 1e6:.1f}MB"
+                f" -> {result['peak_bytes'] / 1e6:.1f}MB"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing stages")
+    parser.add_argument("--counties", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=500)
+    parser.add_argument(
+        "--vertices", type=int, default=64, help="Vertices per county outline"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Simulated download latency"
+    )
+    parser.add_argument(
+        "--no-trace-memory",
+        action="store_true",
+        help="Skip tracemalloc, which slows the stages down considerably",
+    )
+    parser.add_argument("--output", help="Results file (default: bench_results/)")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two results"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    results = run(
+        args.counties,
+        args.days,
+        args.vertices,
+        trace_memory=not args.no_trace_memory,
+        latency=args.latency,
+    )
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{results['timestamp']}-{results['commit'] or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for stage, result in results["stages"].items():
+        peak = result["peak_bytes"]
+        print(
+            f"{stage:>24}: {result['seconds']:8.2f}s"
+            + (f", peak {peak / 1e6:.1f}MB" if peak else "")
+        )
+    print(f"Wrote {output}")
@@ -0,0 +1,318 @@
+# Version 2 of output.bin: a little-endian binary layout with a section
+# index, so readers can jump straight to any region instead of scanning the
+# whole file line by line like the v1 format.
+#
+#   header    magic b"C19M", uint16 version, uint16 section count,
+#             uint32 record count, uint32 day count
+#   sections  one (16-byte ASCII name, uint32 offset, uint32 size) entry per
+#             section, every section 8-byte aligned
+#
+# Sections:
+#
+#   meta      JSON object with lastUpdated, firstDate, lodTolerances,
+#             geometry ("polygons" or "arcs"), series ("int32" or "varint"),
+#             metrics (the names of the metric sections), scales and noRate
+#             (see derived.metric_meta) and attributes
+#   strings   UTF-8 names and FIPS codes referenced by the records
+#   records   one RECORD entry per state/county, in the v1 order: each state
+#             followed by its counties
+#   lod0...   simplified polygons, one section per entry in lodTolerances,
+#             coarsest first: a uint32 (offset, length) pair per record, like
+#             the record's own polygon fields, followed by the polygons
+#   polygons  uint16 (x, y) pairs at full detail, as packed for v1
+#
+# or, when geometry is "arcs", the full-detail polygons as shared arcs (see
+# topology.py), with each record's polygon offset and length pointing at the
+# bytes of its arc references in shapes:
+#
+#   arcs      the arc table written by topology.encode_arcs
+#   shapes    varint arc references per record, as topology.encode_shape
+#
+#   cases     int32 [series][day], one row per county (record.series_index)
+#   deaths    same layout as cases, as is every other metric listed in meta
+#             (e.g. the ones in derived.py)
+#
+# or, when series is "varint", each metric as a column of delta-encoded
+# series (see varints.py):
+#
+#   cases     uint32 byte offsets of every series (plus a final end offset),
+#             relative to the end of the offsets, followed by the varints
+#   deaths    same layout as cases
+#
+# and, when the records come with precomputed labels (see labels.py):
+#
+#   labels    one LABEL entry per record: the float32 label point (pole of
+#             inaccessibility) and its distance to the outline, then the
+#             uint16 bounding box, all NaN/0 for records without a polygon
+#   parts     a uint32 (offset, length) pair per record like the lod tables,
+#             pointing at uint32 values: for each polygon of the record its
+#             ring count followed by the length of each ring in vertices
+#
+# and, when meta lists attributes (see demographics.py):
+#
+#   attributes  int32 [record][attribute], -1 where unknown
+
+import json
+import struct
+
+import numpy as np
+
+from derived import metric_meta
+from topology import build_topology, encode_arcs, encode_shape
+from varints import encode_series
+
+MAGIC = b"C19M"
+VERSION = 2
+
+HEADER = struct.Struct("<4sHHII")
+SECTION = struct.Struct("<16sII")
+# kind, name length, name offset, parent record, fips length, fips offset,
+# population, polygon offset, polygon length (in uint16 values), series index
+RECORD = struct.Struct("<BxHIIHxxIiIII")
+# label x, label y, label distance, bounding box x/y min, x/y max
+LABEL = struct.Struct("<fffHHHH")
+
+STATE = 0
+COUNTY = 1
+
+NO_POPULATION = -1
+NO_SERIES = 0xFFFFFFFF
+
+ALIGNMENT = 8
+
+
+def align(position, alignment=ALIGNMENT):
+    return (position + alignment - 1) // alignment * alignment
+
+
+def pack_polygons(polygons, polygon):
+    """Appends a packed polygon to a bytearray, 4-byte aligned like v1,
+    returning its offset and length in uint16 values."""
+    polygons.extend(b"\0" * (align(len(polygons), 4) - len(polygons)))
+    offset = len(polygons)
+    values = np.frombuffer(polygon, dtype=np.uint16)
+    polygons.extend(values.astype("<u2").tobytes())
+    return offset, len(values)
+
+
+def encode_metric(rows, series_encoding="int32"):
+    """Packs a (series, day) matrix as a metric section."""
+    if len(rows) == 0:
+        return b""
+    if series_encoding == "varint":
+        data, series_offsets = encode_series(rows)
+        return series_offsets.astype("<u4").tobytes() + data
+    if series_encoding == "int32":
+        return np.asarray(rows).astype("<i4").tobytes()
+    raise ValueError(f"Unknown series encoding {series_encoding}")
+
+
+def layout(sizes):
+    """Section offsets for {name: size}, in order after the header and the
+    section index."""
+    offsets = {}
+    position = align(HEADER.size + SECTION.size * len(sizes))
+    for name, size in sizes.items():
+        offsets[name] = position
+        position = align(position + size)
+    return offsets
+
+
+def write_file(fn, contents, num_records, num_days, offsets=None):
+    """Writes {name: bytes} sections to fn, returning the bytes written."""
+    if offsets is None:
+        offsets = layout({name: len(data) for name, data in contents.items()})
+    with open(fn, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(contents), num_records, num_days))
+        for name, data in contents.items():
+            f.write(SECTION.pack(name.encode("ascii"), offsets[name], len(data)))
+        for name, data in contents.items():
+            f.write(b"\0" * (offsets[name] - f.tell()))
+            f.write(data)
+        return f.tell()
+
+
+def write_v2(
+    fn,
+    last_updated,
+    first_date,
+    records,
+    lod_tolerances=(),
+    geometry_encoding="polygons",
+    metrics=("cases", "deaths"),
+    series_encoding="int32",
+    attributes=(),
+):
+    """Writes records (dicts with type, name, fips, population, polygon, a
+    list of simplified polygons matching lod_tolerances as lods, optionally a
+    labels.region_label result as label, a value per name in attributes as
+    attributes and, for counties, a series per metric) to fn, returning the
+    bytes written.
+
+    geometry_encoding is "polygons" to write every polygon in full or "arcs" to store
+    borders shared between regions only once, and series_encoding is "int32"
+    for a plain matrix per metric or "varint" for delta-encoded columns."""
+    strings = bytearray()
+    string_offsets = {}
+
+    def add_string(s):
+        encoded = s.encode("utf8")
+        if encoded not in string_offsets:
+            string_offsets[encoded] = len(strings)
+            strings.extend(encoded)
+        return string_offsets[encoded], len(encoded)
+
+    polygons = bytearray()
+    if geometry_encoding == "arcs":
+        arcs, shapes = build_topology([record["polygon"] for record in records])
+    elif geometry_encoding != "polygons":
+        raise ValueError(f"Unknown geometry encoding {geometry_encoding}")
+    if series_encoding not in ("int32", "varint"):
+        raise ValueError(f"Unknown series encoding {series_encoding}")
+    lod_tables = [[] for _ in lod_tolerances]
+    lod_polygons = [bytearray() for _ in lod_tolerances]
+    has_labels = any("label" in record for record in records)
+    labels = bytearray()
+    parts_table = []
+    parts = bytearray()
+    series = {metric: [] for metric in metrics}
+    num_series = 0
+    # Record fields, with polygon offsets relative to the polygons section
+    record_fields = []
+    state_index = None
+    for i, record in enumerate(records):
+        name_offset, name_length = add_string(record["name"])
+        fips_offset, fips_length = add_string(record["fips"])
+
+        if geometry_encoding == "arcs":
+            shape = encode_shape(shapes[i])
+            polygon_offset, polygon_length = len(polygons), len(shape)
+            polygons.extend(shape)
+        else:
+            polygon_offset, polygon_length = pack_polygons(polygons, record["polygon"])
+        for level, polygon in enumerate(record.get("lods", [])):
+            lod_tables[level].append(pack_polygons(lod_polygons[level], polygon))
+        if has_labels:
+            label = record.get("label")
+            if label is None:
+                labels.extend(LABEL.pack(*[float("nan")] * 3, 0, 0, 0, 0))
+                parts_table.append((len(parts), 0))
+            else:
+                labels.extend(LABEL.pack(*label["label"], *label["bbox"]))
+                values = []
+                for rings in label["parts"]:
+                    values.append(len(rings))
+                    values.extend(rings)
+                parts_table.append((len(parts), len(values)))
+                parts.extend(np.array(values, dtype="<u4").tobytes())
+
+        if record["type"] == "state":
+            state_index = i
+            kind = STATE
+            series_index = NO_SERIES
+        else:
+            kind = COUNTY
+            series_index = num_series
+            num_series += 1
+            for metric in metrics:
+                series[metric].append(np.asarray(record[metric]))
+
+        population = record.get("population")
+        record_fields.append(
+            [
+                kind,
+                name_length,
+                name_offset,
+                state_index,
+                fips_length,
+                fips_offset,
+                NO_POPULATION if population is None else population,
+                polygon_offset,
+                polygon_length,
+                series_index,
+            ]
+        )
+
+    num_days = 0
+    if metrics and series[metrics[0]]:
+        num_days = len(series[metrics[0]][0])
+    contents = {
+        "meta": json.dumps(
+            {
+                "lastUpdated": last_updated,
+                "firstDate": first_date,
+                "lodTolerances": list(lod_tolerances),
+                "geometry": geometry_encoding,
+                "series": series_encoding,
+                "metrics": list(metrics),
+                **metric_meta(metrics),
+                "attributes": list(attributes),
+            }
+        ).encode("utf8"),
+        "strings": bytes(strings),
+        "records": None,
+    }
+    # Coarse levels come before the full polygons, so a client can fetch and
+    # draw the smallest one first
+    for level in range(len(lod_tolerances)):
+        contents[f"lod{level}"] = None
+    if geometry_encoding == "arcs":
+        contents["arcs"] = encode_arcs(arcs)
+        contents["shapes"] = bytes(polygons)
+    else:
+        contents["polygons"] = bytes(polygons)
+    for metric, rows in series.items():
+        contents[metric] = encode_metric(
+            np.stack(rows) if rows else [], series_encoding
+        )
+    if has_labels:
+        contents["labels"] = bytes(labels)
+        contents["parts"] = None
+    if attributes:
+        values = [record["attributes"] for record in records]
+        contents["attributes"] = np.array(values, dtype="<i4").tobytes()
+
+    # Lay sections out after the header and section index
+    sizes = {name: len(data or b"") for name, data in contents.items()}
+    sizes["records"] = RECORD.size * len(records)
+    table_size = align(8 * len(records))
+    for level, lod in enumerate(lod_polygons):
+        sizes[f"lod{level}"] = table_size + len(lod)
+    if has_labels:
+        sizes["parts"] = table_size + len(parts)
+    offsets = layout(sizes)
+
+    records_section = bytearray()
+    for fields in record_fields:
+        fields[7] += offsets["shapes" if geometry_encoding == "arcs" else "polygons"]
+        records_section.extend(RECORD.pack(*fields))
+    contents["records"] = bytes(records_section)
+
+    for level, table in enumerate(lod_tables):
+        name = f"lod{level}"
+        index = np.array(table, dtype=np.int64).reshape(-1, 2)
+        index[:, 0] += offsets[name] + table_size
+        contents[name] = index.astype("<u4").tobytes().ljust(table_size, b"\0")
+        contents[name] += bytes(lod_polygons[level])
+    if has_labels:
+        index = np.array(parts_table, dtype=np.int64).reshape(-1, 2)
+        index[:, 0] += offsets["parts"] + table_size
+        contents["parts"] = index.astype("<u4").tobytes().ljust(table_size, b"\0")
+        contents["parts"] += bytes(parts)
+
+    return write_file(fn, contents, len(records), num_days, offsets)
+
+
+def read_sections(buffer):
+    """Returns (header fields, {section name: (offset, size)}) for a v2 file."""
+    magic, version, num_sections, num_records, num_days = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a v2 output.bin")
+    if version != VERSION:
+        raise ValueError(f"Unsupported output.bin version {version}")
+    sections = {}
+    for i in range(num_sections):
+        name, offset, size = SECTION.unpack_from(buffer, HEADER.size + SECTION.size * i)
+        sections[name.rstrip(b"\0").decode("ascii")] = (offset, size)
+    header = {"version": version, "records": num_records, "days": num_days}
+    return header, sections
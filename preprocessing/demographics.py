@@ -0,0 +1,209 @@
+# Census population estimates and ACS household income, compiled once into
+# a columnar table keyed by sorted FIPS codes
+#
+#   table = load_demographics(working_dir)  # compiles it if needed
+#   populations = dict(zip(table["fips"], table["population"]))
+#
+# Rows are the states (2-digit FIPS) and counties (5-digit FIPS, renamed as
+# in RENAMES) plus the composite regions process() uses: New York City,
+# Puerto Rico as a whole and the two merged Alaska areas. A composite's
+# population and households are the sums of its parts, its mean income the
+# household-weighted mean, and its median income the household-weighted mean
+# of the parts' medians, an approximation. State incomes are combined from
+# their counties the same way. Missing values are MISSING.
+#
+# The table is saved as an uncompressed .npz next to the sources, with their
+# sizes and modification times, and recompiled when any of them change.
+
+import csv
+import os
+
+import numpy as np
+
+# FIPS renaming
+RENAMES = {
+    "02270": "02158",
+    "46113": "46102",
+}
+
+# Special key for 5 boroughs combined
+NYC = "36NYC"
+# Special key for Puerto Rico
+PR = "72PR"
+# Alaska FIPS merges
+BRISTOL_BAY_LAKE_PENINSULA = "02997"  # 02060 and 02164
+YAKUTAT_CITY_HOONAH_ANGOON = "02998"  # 02282 and 02105
+
+# Puerto Rico isn't in the census county estimates
+PR_POPULATION = 3325001
+
+COMPOSITES = {
+    NYC: ["36081", "36047", "36085", "36005", "36061"],
+    BRISTOL_BAY_LAKE_PENINSULA: ["02060", "02164"],
+    YAKUTAT_CITY_HOONAH_ANGOON: ["02282", "02105"],
+}
+
+POPULATION_CSV = "population/co-est2018-alldata.csv"
+INCOME_CSV = "economic/ACSST5Y2018.S1901_data_with_overlays_2020-04-02T151830.csv"
+COMPILED = "population/demographics.npz"
+
+# ACS S1901 columns: total households, median and mean household income
+HOUSEHOLDS = "S1901_C01_001E"
+MEDIAN_INCOME = "S1901_C01_012E"
+MEAN_INCOME = "S1901_C01_013E"
+
+# Attributes that can be written per region (see process.py)
+ATTRIBUTES = ("households", "median_income", "mean_income")
+
+MISSING = -1
+
+
+def lpad(s, desired_length):
+    return "0" * max(desired_length - len(s), 0) + s
+
+
+def int_convert(num):
+    if num == " ":
+        num = "0"
+    return int(num.replace(",", ""))
+
+
+def read_populations(fn):
+    """Returns ({fips: population}, {state fips: state name})."""
+    populations = {}
+    names = {}
+    with open(fn, "r", encoding="latin-1") as f:
+        csvreader = csv.reader(f)
+        next(csvreader)  # Skip header
+        for row in csvreader:
+            state_fips = lpad(row[3], 2)
+            county_fips = lpad(row[4], 3)
+            population = int_convert(row[17])
+            if county_fips == "000":
+                populations[state_fips] = population
+                names[state_fips] = row[5]
+            else:
+                combined_fips = state_fips + county_fips
+                populations[RENAMES.get(combined_fips, combined_fips)] = population
+    return populations, names
+
+
+def read_incomes(fn):
+    """Returns {fips: (households, median income, mean income)}."""
+
+    def value(s):
+        return int(s) if s.isdigit() else MISSING
+
+    incomes = {}
+    if not os.path.exists(fn):
+        # Incomes are optional, populations aren't
+        return incomes
+    with open(fn, "r", encoding="utf8") as f:
+        csvreader = csv.reader(f)
+        header = next(csvreader)
+        next(csvreader)  # Skip column descriptions
+        columns = [header.index(c) for c in (HOUSEHOLDS, MEDIAN_INCOME, MEAN_INCOME)]
+        for row in csvreader:
+            fips = row[0][-5:]
+            incomes[RENAMES.get(fips, fips)] = tuple(value(row[c]) for c in columns)
+    return incomes
+
+
+def combine_incomes(parts, incomes):
+    rows = [incomes.get(fips, (MISSING,) * 3) for fips in parts]
+    if not rows or any(MISSING in row or row[0] == 0 for row in rows):
+        return (MISSING,) * 3
+    households = sum(row[0] for row in rows)
+    median = round(sum(row[0] * row[1] for row in rows) / households)
+    mean = round(sum(row[0] * row[2] for row in rows) / households)
+    return households, median, mean
+
+
+def compile_demographics(working_dir=""):
+    """Reads the census and ACS CSVs into {column: array} with rows sorted
+    by FIPS code."""
+    populations, names = read_populations(os.path.join(working_dir, POPULATION_CSV))
+    incomes = read_incomes(os.path.join(working_dir, INCOME_CSV))
+
+    rows = {}
+    for fips, population in populations.items():
+        rows[fips] = (population, incomes.get(fips, (MISSING,) * 3))
+    for fips, parts in COMPOSITES.items():
+        population = sum(populations[part] for part in parts)
+        rows[fips] = (population, combine_incomes(parts, incomes))
+    municipios = sorted(fips for fips in incomes if fips.startswith("72"))
+    rows[PR] = rows["72"] = (PR_POPULATION, combine_incomes(municipios, incomes))
+    names["72"] = "Puerto Rico"
+    # The ACS table only has counties, so states get their counties combined
+    for state in names:
+        if state != "72":
+            counties = [fips for fips in incomes if fips[:2] == state]
+            rows[state] = (rows[state][0], combine_incomes(counties, incomes))
+
+    fips = sorted(rows)
+    return {
+        "fips": np.array(fips),
+        "name": np.array([names.get(code, "") for code in fips]),
+        "population": np.array([rows[code][0] for code in fips], dtype=np.int64),
+        **{
+            attribute: np.array([rows[code][1][i] for code in fips], dtype=np.int64)
+            for i, attribute in enumerate(ATTRIBUTES)
+        },
+    }
+
+
+def sources_signature(working_dir):
+    signature = []
+    for fn in (POPULATION_CSV, INCOME_CSV):
+        try:
+            stat = os.stat(os.path.join(working_dir, fn))
+            signature += [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            signature += [-1, -1]
+    return np.array(signature, dtype=np.int64)
+
+
+def load_demographics(working_dir=""):
+    """Loads the compiled table, compiling it first if it's missing or older
+    than its sources."""
+    path = os.path.join(working_dir, COMPILED)
+    signature = sources_signature(working_dir)
+    try:
+        with np.load(path) as data:
+            if np.array_equal(data["signature"], signature):
+                return {name: data[name] for name in data.files if name != "signature"}
+    except (OSError, KeyError, ValueError):
+        pass
+
+    table = compile_demographics(working_dir)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, signature=signature, **table)
+    os.replace(tmp_path, path)
+    return table
+
+
+def lookup(table, fips):
+    """Row index of a FIPS code in the table, or None."""
+    i = np.searchsorted(table["fips"], fips)
+    if i < len(table["fips"]) and table["fips"][i] == fips:
+        return int(i)
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    working_dir = sys.argv[1] if len(sys.argv) > 1 else ""
+    table = compile_demographics(working_dir)
+    np.savez(
+        os.path.join(working_dir, COMPILED),
+        signature=sources_signature(working_dir),
+        **table,
+    )
+    start = time.perf_counter()
+    table = load_demographics(working_dir)
+    print(f"{len(table['fips'])} rows, loaded in {time.perf_counter() - start:.4f}s")
+    for fips in [NYC, PR, "72", "36", "02997", "06037"]:
+        i = lookup(table, fips)
+        print(fips, {name: table[name][i].item() for name in table if name != "fips"})
@@ -0,0 +1,85 @@
+# Metrics derived from the cumulative cases/deaths series at build time, so
+# clients don't have to work them out for every place on load
+#
+# Everything is computed on a (place, day) matrix at once. Series are stored
+# as integers, so the fractional metrics are written in hundredths (SCALE):
+#
+#   new_cases, new_deaths              day-over-day change (negative when a
+#                                      count was revised down)
+#   new_cases_avg7, new_deaths_avg7    trailing 7-day mean of the above, days
+#                                      before the first date counting as 0
+#   cases_per_100k, deaths_per_100k    cumulative count per 100,000 people,
+#                                      or NO_RATE without a population
+#
+# metric_meta describes the scaling to readers, in the meta section of the
+# output.
+
+import numpy as np
+
+DERIVED_METRICS = (
+    "new_cases",
+    "new_deaths",
+    "new_cases_avg7",
+    "new_deaths_avg7",
+    "cases_per_100k",
+    "deaths_per_100k",
+)
+
+# Fractional metrics are stored as round(value * SCALE)
+SCALE = 100
+SCALED_METRICS = (
+    "new_cases_avg7",
+    "new_deaths_avg7",
+    "cases_per_100k",
+    "deaths_per_100k",
+)
+WINDOW = 7
+# Stored for rates of places without a population
+NO_RATE = -1
+RATE_METRICS = ("cases_per_100k", "deaths_per_100k")
+
+
+def daily(totals):
+    return np.diff(totals, axis=1, prepend=0)
+
+
+def rolling_mean(values, window=WINDOW):
+    sums = np.cumsum(values, axis=1)
+    sums[:, window:] -= sums[:, :-window].copy()
+    return sums / window
+
+
+def per_100k(totals, populations):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = totals * 100000 / populations[:, None]
+    return np.where(np.isfinite(rates), np.rint(rates * SCALE), NO_RATE)
+
+
+def metric_meta(metrics):
+    """Returns {"scales": {metric: SCALE}, "noRate": {metric: NO_RATE}} for the
+    scaled and rate metrics among metrics."""
+    return {
+        "scales": {metric: SCALE for metric in metrics if metric in SCALED_METRICS},
+        "noRate": {metric: NO_RATE for metric in metrics if metric in RATE_METRICS},
+    }
+
+
+def derive_metrics(cases, deaths, populations):
+    """Returns {metric: int64 (place, day) matrix} for the cumulative cases
+    and deaths matrices, given each place's population (None if unknown)."""
+    cases = np.asarray(cases, dtype=np.int64)
+    deaths = np.asarray(deaths, dtype=np.int64)
+    populations = np.array(
+        [np.nan if p is None or p <= 0 else p for p in populations], dtype=np.float64
+    )
+    new_cases = daily(cases)
+    new_deaths = daily(deaths)
+    metrics = {
+        "new_cases": new_cases,
+        "new_deaths": new_deaths,
+        "new_cases_avg7": np.rint(rolling_mean(new_cases) * SCALE),
+        "new_deaths_avg7": np.rint(rolling_mean(new_deaths) * SCALE),
+        "cases_per_100k": per_100k(cases, populations),
+        "deaths_per_100k": per_100k(deaths, populations),
+    }
+    return {name: values.astype(np.int64) for name, values in metrics.items()}
@@ -1,6 +1,13 @@
-import urllib.request
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import http.client
 import json
 import os
+import threading
+import time
+import urllib.parse
 import dateutil.parser
 from pytz import timezone
 
@@ -10,10 +17,112 @@ historical_url = (
 )
 last_updated_url = "https://api.github.com/repos/nytimes/covid-19-data/commits?path=live&page=1&per_page=1"
 
+CHUNK_SIZE = 1 << 16
 
-def get_last_updated():
-    with urllib.request.urlopen(last_updated_url) as f:
-        contents = json.loads(f.read())
+# Per-source socket timeouts in seconds
+LIVE_TIMEOUT = 30
+HISTORICAL_TIMEOUT = 120
+LAST_UPDATED_TIMEOUT = 15
+
+RETRIES = 3
+BACKOFF = 0.5
+MAX_REDIRECTS = 5
+
+USER_AGENT = "covid19map.us-preprocessing"
+
+
+class DownloadError(Exception):
+    def __init__(self, url, status):
+        super().__init__(f"{url} returned HTTP {status}")
+        self.url = url
+        self.status = status
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections shared between download threads, keyed
+    by scheme and host."""
+
+    def __init__(self):
+        self.idle = collections.defaultdict(list)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self, scheme, netloc, timeout):
+        with self.lock:
+            idle = self.idle[(scheme, netloc)]
+            conn = idle.pop() if idle else None
+        if conn is None:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(netloc, timeout=timeout)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        with self.lock:
+            self.idle[(scheme, netloc)].append(conn)
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle.clear()
+
+    @contextlib.contextmanager
+    def get(self, url, headers=None, timeout=None):
+        """Yields the response to a GET request, following redirects. The
+        body must be read fully inside the with block."""
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            with self.connection(parts.scheme, parts.netloc, timeout) as conn:
+                conn.request(
+                    "GET", path, headers={"User-Agent": USER_AGENT, **(headers or {})}
+                )
+                response = conn.getresponse()
+                location = response.getheader("Location")
+                if response.status in (301, 302, 303, 307, 308) and location:
+                    response.read()
+                    url = urllib.parse.urljoin(url, location)
+                    continue
+                yield response
+                # Drain anything left so the connection can be reused
+                response.read()
+                return
+        raise DownloadError(url, "redirect loop")
+
+
+def retry(fn, retries=RETRIES, backoff=BACKOFF):
+    """Calls fn(attempt), retrying connection errors and 5xx responses with
+    exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return fn(attempt)
+        except (OSError, http.client.HTTPException, DownloadError) as e:
+            if isinstance(e, DownloadError) and not (
+                isinstance(e.status, int) and e.status >= 500
+            ):
+                raise
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+
+
+def get_last_updated(url=last_updated_url, pool=None, timeout=LAST_UPDATED_TIMEOUT):
+    pool = pool or ConnectionPool()
+    with pool.get(url, timeout=timeout) as response:
+        if response.status != 200:
+            raise DownloadError(url, response.status)
+        contents = json.loads(response.read())
     return (
         dateutil.parser.parse(contents[0]["commit"]["committer"]["date"])
         .astimezone(timezone("US/Eastern"))
@@ -22,16 +131,164 @@ def get_last_updated():
     )
 
 
-def download(working_dir=""):
-    with open(os.path.join(working_dir, "live.csv"), "wb") as f:
-        f.write(urllib.request.urlopen(live_url).read())
+def metadata_path(path):
+    return path + ".meta.json"
+
+
+def load_metadata(path):
+    try:
+        with open(metadata_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
 
-    with open(os.path.join(working_dir, "historical.csv"), "wb") as f:
-        f.write(urllib.request.urlopen(historical_url).read())
+def fetch(url, path, conditional=False, pool=None, timeout=None):
+    """Streams url to path in chunks.
 
-    with open(os.path.join(working_dir, "last_updated.txt"), "w") as f:
-        f.write(get_last_updated().strip())
+    With conditional=True, the ETag/Last-Modified of the previous download
+    are sent back so an unchanged file is not transferred again, and the
+    returned metadata records whether the new file only appended to the old
+    one (prefix_size/prefix_sha256), which nyt_process uses to parse just
+    the new rows."""
+    pool = pool or ConnectionPool()
+    previous = load_metadata(path) if conditional and os.path.exists(path) else None
+
+    headers = {}
+    if previous is not None:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    previous_size = previous["size"] if previous is not None else None
+    total = hashlib.sha256()
+    prefix_sha256 = None
+    size = 0
+
+    tmp_path = path + ".tmp"
+    with pool.get(url, headers, timeout) as response:
+        if response.status == 304 and previous is not None:
+            return {**previous, "changed": False}
+        if response.status != 200:
+            raise DownloadError(url, response.status)
+
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                end = size + len(chunk)
+                if previous_size is not None and size < previous_size <= end:
+                    # Snapshot the hash at the old file's length to tell
+                    # whether the new file starts with exactly the old contents
+                    split = previous_size - size
+                    total.update(chunk[:split])
+                    prefix_sha256 = total.hexdigest()
+                    total.update(chunk[split:])
+                else:
+                    total.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        etag = response.getheader("ETag")
+        last_modified = response.getheader("Last-Modified")
+    os.replace(tmp_path, path)
+
+    if previous_size == 0:
+        prefix_sha256 = hashlib.sha256().hexdigest()
+    appended = previous is not None and prefix_sha256 == previous["sha256"]
+
+    metadata = {
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "size": size,
+        "sha256": total.hexdigest(),
+        "prefix_size": previous_size if appended else None,
+        "prefix_sha256": prefix_sha256 if appended else None,
+    }
+    with open(metadata_path(path), "w") as f:
+        json.dump(metadata, f)
+    return {**metadata, "changed": True}
+
+
+def download(
+    working_dir="",
+    incremental=False,
+    live_url=live_url,
+    historical_url=historical_url,
+    last_updated_url=last_updated_url,
+    retries=RETRIES,
+    backoff=BACKOFF,
+):
+    """Fetches the live CSV, historical CSV and last updated time concurrently
+    over a shared connection pool, returning per-source timings."""
+    pool = ConnectionPool()
+
+    def fetch_last_updated(attempt):
+        last_updated = get_last_updated(last_updated_url, pool, LAST_UPDATED_TIMEOUT)
+        with open(os.path.join(working_dir, "last_updated.txt"), "w") as f:
+            f.write(last_updated.strip())
+        return {"changed": True}
+
+    sources = {
+        "live": lambda attempt: fetch(
+            live_url,
+            os.path.join(working_dir, "live.csv"),
+            pool=pool,
+            timeout=LIVE_TIMEOUT,
+        ),
+        "historical": lambda attempt: fetch(
+            historical_url,
+            os.path.join(working_dir, "historical.csv"),
+            conditional=incremental,
+            pool=pool,
+            timeout=HISTORICAL_TIMEOUT,
+        ),
+        "last_updated": fetch_last_updated,
+    }
+
+    def timed(name):
+        attempts = 0
+
+        def attempt_fn(attempt):
+            nonlocal attempts
+            attempts = attempt + 1
+            return sources[name](attempt)
+
+        start = time.perf_counter()
+        result = retry(attempt_fn, retries, backoff)
+        return {
+            "seconds": time.perf_counter() - start,
+            "attempts": attempts,
+            "bytes": result.get("size"),
+            "changed": result["changed"],
+        }
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(len(sources)) as executor:
+            futures = {name: executor.submit(timed, name) for name in sources}
+            timings = {name: future.result() for name, future in futures.items()}
+    finally:
+        pool.close()
+
+    for name, timing in timings.items():
+        print(
+            f"{name}: {timing['seconds']:.2f}s, {timing['attempts']} attempt(s)"
+            + ("" if timing["changed"] else ", not modified")
+        )
+    return timings
 
 
 if __name__ == "__main__":
-    download()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download the NYT CSVs")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Use conditional requests and record whether historical.csv only grew",
+    )
+    args = parser.parse_args()
+
+    download(incremental=args.incremental)
@@ -0,0 +1,121 @@
+# Local stand-in for the NYT/GitHub hosts, serving fixture files from a
+# directory with ETag/Last-Modified support so download.py can be exercised
+# offline, e.g.
+#
+#   python fixture_server.py fixtures/ --port 8000 --latency 0.5
+#   download(live_url="http://localhost:8000/live.csv", ...)
+#
+# Artificial latency and a number of initial 503 failures per path can be
+# configured to exercise the concurrent downloader's timeouts and retries.
+
+import collections
+import email.utils
+import hashlib
+import http.server
+import os
+import threading
+import time
+
+
+class FixtureHandler(http.server.SimpleHTTPRequestHandler):
+    latency = 0
+    failures = 0
+    failure_counts = None
+
+    def send_head(self):
+        time.sleep(self.latency)
+
+        request_path = self.path.split("?", 1)[0]
+        with self.server.lock:
+            failed = self.failure_counts[request_path]
+            self.failure_counts[request_path] += 1
+        if failed < self.failures:
+            self.send_error(503)
+            return None
+
+        path = self.translate_path(request_path)
+        if not os.path.isfile(path):
+            return super().send_head()
+
+        with open(path, "rb") as f:
+            contents = f.read()
+        etag = '"' + hashlib.sha256(contents).hexdigest()[:16] + '"'
+        last_modified = email.utils.formatdate(os.path.getmtime(path), usegmt=True)
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(len(contents)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        return _BytesFile(contents)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _BytesFile:
+    # Minimal file object for SimpleHTTPRequestHandler.copyfile
+    def __init__(self, contents):
+        self.contents = contents
+
+    def read(self, size=-1):
+        contents, self.contents = self.contents, b""
+        return contents
+
+    def close(self):
+        pass
+
+
+def serve(directory, port=0, latency=0, failures=0):
+    """Starts a fixture server in a background thread, returning the server.
+    Its base URL is f"http://127.0.0.1:{server.server_port}".
+
+    Every request is delayed by latency seconds, and the first failures
+    requests to each path get a 503."""
+    handler_class = type(
+        "Handler",
+        (FixtureHandler,),
+        {
+            "latency": latency,
+            "failures": failures,
+            "failure_counts": collections.Counter(),
+        },
+    )
+
+    def handler(*args, **kwargs):
+        return handler_class(*args, directory=directory, **kwargs)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve fixture files over HTTP")
+    parser.add_argument("directory")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds to delay each response"
+    )
+    parser.add_argument(
+        "--failures", type=int, default=0, help="Initial 503s to return per path"
+    )
+    args = parser.parse_args()
+
+    server = serve(args.directory, args.port, args.latency, args.failures)
+    print(f"Serving {args.directory} at http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,74 +1,78 @@
+import functools
 import json
 import shapely.geometry
 
+# Synthetic regions, each replacing a set of (STATE, COUNTY) features with
+# their union under a new (STATE, COUNTY) key and name
+MERGES = [
+    {
+        "sources": [("02", "060"), ("02", "164")],
+        "key": ("02", "997"),
+        "name": "Bristol Bay plus Lake and Peninsula",
+    },
+    {
+        "sources": [("02", "282"), ("02", "105")],
+        "key": ("02", "998"),
+        "name": "Yakutat plus Hoonah-Angoon",
+    },
+]
 
-def merge_geojson():
-    with open("counties.geo.json", "r") as f:
-        geo = json.load(f)
-    features = geo["features"]
 
-    # merges
-    merges = [
-        [
-            ("02", "060"),
-            ("02", "164"),
-            "Bristol Bay plus Lake and Peninsula",
-            ("02", "997"),
-        ],
-        [
-            ("02", "282"),
-            ("02", "105"),
-            "Yakutat plus Hoonah-Angoon",
-            ("02", "998"),
-        ],
-    ]
+def feature_key(feature):
+    return (feature["properties"]["STATE"], feature["properties"]["COUNTY"])
 
-    def lookup(state_fips, county_fips):
-        feature = [
-            x
-            for x in features
-            if x["properties"]["STATE"] == state_fips
-            and x["properties"]["COUNTY"] == county_fips
-        ]
-        assert len(feature) == 1, f"{feature}, {state_fips}, {county_fips}"
-        return feature[0]
 
+def index_features(features):
+    index = {}
+    for i, feature in enumerate(features):
+        index.setdefault(feature_key(feature), []).append(i)
+    return index
+
+
+def apply_merges(features, merges=MERGES):
+    """Returns features with every merge in merges applied in one pass: the
+    source features are dropped and each merged feature appended, keeping
+    the id and properties of its first source."""
+    index = index_features(features)
+    merged_away = set()
+    merged_features = []
     for merge in merges:
-        place1 = lookup(*merge[0])
-        place2 = lookup(*merge[1])
-        shape1 = shapely.geometry.asShape(place1["geometry"])
-        shape2 = shapely.geometry.asShape(place2["geometry"])
-        merged_shape = shape1.union(shape2)
-        new_geometry = json.dumps(shapely.geometry.mapping(merged_shape))
-        new_feature = {
-            "id": place1["id"],
-            "type": "Feature",
-            "properties": {
-                **place1["properties"],
-                "STATE": merge[3][0],
-                "COUNTY": merge[3][1],
-                "NAME": merge[2],
-            },
-            "geometry": new_geometry,
-        }
+        sources = []
+        for key in merge["sources"]:
+            matches = index.get(key, [])
+            assert len(matches) == 1, f"{matches}, {key[0]}, {key[1]}"
+            sources.append(matches[0])
+        merged_away.update(sources)
+
+        first = features[sources[0]]
+        merged_shape = functools.reduce(
+            lambda a, b: a.union(b),
+            [shapely.geometry.shape(features[i]["geometry"]) for i in sources],
+        )
+        merged_features.append(
+            {
+                "id": first["id"],
+                "type": "Feature",
+                "properties": {
+                    **first["properties"],
+                    "STATE": merge["key"][0],
+                    "COUNTY": merge["key"][1],
+                    "NAME": merge["name"],
+                },
+                "geometry": shapely.geometry.mapping(merged_shape),
+            }
+        )
 
-        # Filter out old features
-        features = [
-            x
-            for x in features
-            if (
-                x["properties"]["STATE"] != merge[0][0]
-                or x["properties"]["COUNTY"] != merge[0][1]
-            )
-            and (
-                x["properties"]["STATE"] != merge[1][0]
-                or x["properties"]["COUNTY"] != merge[1][1]
-            )
-        ]
-        # Add in new feature
-        features.append(new_feature)
+    return [
+        feature for i, feature in enumerate(features) if i not in merged_away
+    ] + merged_features
+
+
+def merge_geojson():
+    with open("counties.geo.json", "r") as f:
+        geo = json.load(f)
 
-    geo["features"] = features
+    geo["features"] = apply_merges(geo["features"])
 
     with open("counties.geo.json", "w") as f:
         f.write(json.dumps(geo))
@@ -1,13 +1,13 @@
-from topojson2geojson import topojson_to_geojson
 import os
 
-topojson_to_geojson("states.topo.json", "states.geo.json")
-topojson_to_geojson("counties.topo.json", "counties.geo.json")
+from topojson2geojson import topojson_to_geojson
+from projection import project_file
 
-os.system(
-    "cat counties-processed.geo.json | node_modules/d3-geo-projection/bin/geoproject -r projection=./geoAlbersUsaPr.js -n 'projection().scale(1300).translate([487.5, 305])' > counties.json"
-)
+if __name__ == "__main__":
+    # The guard keeps conversion worker processes from re-running the build
+    workers = os.cpu_count() or 1
+    topojson_to_geojson("states.topo.json", "states.geo.json", workers)
+    topojson_to_geojson("counties.topo.json", "counties.geo.json", workers)
 
-os.system(
-    "cat states.geo.json | node_modules/d3-geo-projection/bin/geoproject -r projection=./geoAlbersUsaPr.js -n 'projection().scale(1300).translate([487.5, 305])' > states.json"
-)
+    project_file("counties-processed.geo.json", "counties.json")
+    project_file("states.geo.json", "states.json")
@@ -0,0 +1,329 @@
+"""
+projection.py
+In-process port of geoAlbersUsaPr.js with
+projection().scale(1300).translate([487.5, 305]), as applied to GeoJSON by
+d3-geo-projection's geoproject, so the geo build no longer has to pipe the
+maps through Node.
+
+Coordinates are projected a whole ring at a time with NumPy. Like d3, every
+ring goes through all four insets (lower 48, Alaska, Hawaii, Puerto Rico),
+each clipped to its own extent, so a ring only survives in the inset it
+falls into. Edges long enough to need d3's adaptive resampling are
+subdivided the same way. Rings crossing an inset's extent are clipped with
+Sutherland-Hodgman, which matches d3's clipping geometrically but not
+vertex for vertex; no ring in the US maps does.
+"""
+
+import json
+import math
+
+import numpy as np
+
+SCALE = 1300
+TRANSLATE = (487.5, 305)
+
+# d3's default projection precision (delta2 = precision^2) and resampling
+# limits
+DELTA2 = 0.5
+MAX_DEPTH = 16
+COS_MIN_DISTANCE = math.cos(math.radians(30))
+EPSILON = 1e-6
+
+
+class ConicEqualArea:
+    """d3.geoConicEqualArea with rotate([lambda, 0]), center, parallels,
+    scale, translate and clipExtent."""
+
+    def __init__(self, rotate, center, parallels, scale, translate, extent):
+        self.rotate = math.radians(rotate)
+        phi0, phi1 = map(math.radians, parallels)
+        sy0 = math.sin(phi0)
+        self.n = (sy0 + math.sin(phi1)) / 2
+        self.c = 1 + sy0 * (2 * self.n - sy0)
+        self.r0 = math.sqrt(self.c) / self.n
+        self.scale = scale
+        cx, cy = self.raw(
+            np.array([math.radians(center[0])]), np.array([math.radians(center[1])])
+        )
+        self.dx = translate[0] - cx[0] * scale
+        self.dy = translate[1] + cy[0] * scale
+        self.extent = extent
+
+    def raw(self, lam, phi):
+        r = np.sqrt(self.c - 2 * self.n * np.sin(phi)) / self.n
+        return r * np.sin(lam * self.n), self.r0 - r * np.cos(lam * self.n)
+
+    def rotated(self, coords):
+        """Rotated (lambda, phi) in radians for (n, 2) degree coordinates."""
+        lam = np.radians(coords[:, 0]) + self.rotate
+        lam = np.where(lam > math.pi, lam - 2 * math.pi, lam)
+        lam = np.where(lam < -math.pi, lam + 2 * math.pi, lam)
+        return lam, np.radians(coords[:, 1])
+
+    def project_rotated(self, lam, phi):
+        x, y = self.raw(lam, phi)
+        return x * self.scale + self.dx, self.dy - y * self.scale
+
+    def resample(self, lam, phi, x, y):
+        """Inserts d3's adaptive resampling points along each edge of a ring,
+        returning the (n, 2) projected ring."""
+        cos_phi = np.cos(phi)
+        a, b, c = cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)
+        n = len(x)
+        following = np.arange(1, n + 1)
+        following[-1] = 0
+        d2 = (x[following] - x) ** 2 + (y[following] - y) ** 2
+        # Only edges longer than twice the precision can need new points
+        long_edges = np.flatnonzero(d2 > 4 * DELTA2)
+        if len(long_edges) == 0:
+            return np.stack([x, y], axis=1)
+
+        inserted = {}
+        for i in long_edges:
+            j = following[i]
+            points = []
+            self.resample_line(
+                (x[i], y[i], lam[i], a[i], b[i], c[i]),
+                (x[j], y[j], lam[j], a[j], b[j], c[j]),
+                MAX_DEPTH,
+                points,
+            )
+            if points:
+                inserted[i] = points
+        result = []
+        for i in range(n):
+            result.append((x[i], y[i]))
+            result.extend(inserted.get(i, []))
+        return np.array(result, dtype=np.float64)
+
+    def resample_line(self, start, end, depth, points):
+        # Port of resampleLineTo from d3-geo's projection/resample.js
+        x0, y0, lam0, a0, b0, c0 = start
+        x1, y1, lam1, a1, b1, c1 = end
+        dx, dy = x1 - x0, y1 - y0
+        d2 = dx * dx + dy * dy
+        if not (d2 > 4 * DELTA2 and depth):
+            return
+        depth -= 1
+        a, b, c = a0 + a1, b0 + b1, c0 + c1
+        m = math.sqrt(a * a + b * b + c * c)
+        c /= m
+        phi2 = math.asin(c)
+        lam2 = (
+            (lam0 + lam1) / 2
+            if abs(abs(c) - 1) < EPSILON or abs(lam0 - lam1) < EPSILON
+            else math.atan2(b, a)
+        )
+        x2, y2 = (
+            float(v[0])
+            for v in self.project_rotated(np.array([lam2]), np.array([phi2]))
+        )
+        dx2, dy2 = x2 - x0, y2 - y0
+        dz = dy * dx2 - dx * dy2
+        if (
+            dz * dz / d2 > DELTA2
+            or abs((dx * dx2 + dy * dy2) / d2 - 0.5) > 0.3
+            or a0 * a1 + b0 * b1 + c0 * c1 < COS_MIN_DISTANCE
+        ):
+            middle = (x2, y2, lam2, a / m, b / m, c)
+            self.resample_line(start, middle, depth, points)
+            points.append((x2, y2))
+            self.resample_line(middle, end, depth, points)
+
+    def project_ring(self, coords):
+        """Projects an (n, 2) ring of degree coordinates without its closing
+        vertex, returning the part inside the extent (or None)."""
+        lam, phi = self.rotated(coords)
+        x, y = self.project_rotated(lam, phi)
+        ring = self.resample(lam, phi, x, y)
+        (x_min, y_min), (x_max, y_max) = self.extent
+        inside = (
+            (ring[:, 0] >= x_min)
+            & (ring[:, 0] <= x_max)
+            & (ring[:, 1] >= y_min)
+            & (ring[:, 1] <= y_max)
+        )
+        if inside.all():
+            return ring
+        if not inside.any() and not self.crosses_extent(ring):
+            return None
+        clipped = clip_ring(ring, self.extent)
+        return clipped if len(clipped) > 2 else None
+
+    def crosses_extent(self, ring):
+        # A ring with every vertex outside can still surround or cut across
+        # the extent; check its bounding box against the extent
+        (x_min, y_min), (x_max, y_max) = self.extent
+        return not (
+            ring[:, 0].max() < x_min
+            or ring[:, 0].min() > x_max
+            or ring[:, 1].max() < y_min
+            or ring[:, 1].min() > y_max
+        )
+
+
+def clip_ring(ring, extent):
+    """Sutherland-Hodgman clipping of a ring (without closing vertex) to a
+    rectangular extent."""
+    (x_min, y_min), (x_max, y_max) = extent
+    points = [tuple(p) for p in ring]
+    for axis, bound, keep_below in [
+        (0, x_min, False),
+        (0, x_max, True),
+        (1, y_min, False),
+        (1, y_max, True),
+    ]:
+        if not points:
+            break
+
+        def inside(p):
+            return p[axis] <= bound if keep_below else p[axis] >= bound
+
+        clipped = []
+        previous = points[-1]
+        for point in points:
+            if inside(point) != inside(previous):
+                t = (bound - previous[axis]) / (point[axis] - previous[axis])
+                crossing = [
+                    previous[k] + t * (point[k] - previous[k]) for k in range(2)
+                ]
+                crossing[axis] = bound
+                clipped.append(tuple(crossing))
+            if inside(point):
+                clipped.append(point)
+            previous = point
+        points = clipped
+    return np.array(points, dtype=np.float64).reshape(-1, 2)
+
+
+def albers_usa_pr(scale=SCALE, translate=TRANSLATE):
+    """The four insets of geoAlbersUsaPr, in the order d3 streams them."""
+    k = scale
+    x, y = translate
+    return [
+        ConicEqualArea(
+            96,
+            (-0.6, 38.7),
+            (29.5, 45.5),
+            k,
+            (x, y),
+            ((x - 0.455 * k, y - 0.238 * k), (x + 0.455 * k, y + 0.238 * k)),
+        ),
+        ConicEqualArea(
+            154,
+            (-2, 58.5),
+            (55, 65),
+            k * 0.35,
+            (x - 0.307 * k, y + 0.201 * k),
+            (
+                (x - 0.425 * k + EPSILON, y + 0.120 * k + EPSILON),
+                (x - 0.214 * k - EPSILON, y + 0.234 * k - EPSILON),
+            ),
+        ),
+        ConicEqualArea(
+            157,
+            (-3, 19.9),
+            (8, 18),
+            k,
+            (x - 0.205 * k, y + 0.212 * k),
+            (
+                (x - 0.214 * k + EPSILON, y + 0.166 * k + EPSILON),
+                (x - 0.115 * k - EPSILON, y + 0.234 * k - EPSILON),
+            ),
+        ),
+        ConicEqualArea(
+            66,
+            (0, 18),
+            (8, 18),
+            k,
+            (x + 0.350 * k, y + 0.224 * k),
+            ((x + 0.320 * k, y + 0.204 * k), (x + 0.380 * k, y + 0.234 * k)),
+        ),
+    ]
+
+
+def planar_ring_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.sum(np.roll(x, 1) * y - np.roll(y, 1) * x)) / 2
+
+
+def ring_contains(ring, point):
+    # Even-odd point in polygon test
+    x, y = ring[:, 0], ring[:, 1]
+    px, py = point
+    x0, y0 = np.roll(x, 1), np.roll(y, 1)
+    crosses = (y > py) != (y0 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        at = (x0 - x) * (py - y) / (y0 - y) + x
+    return bool(np.count_nonzero(crosses & (px < at)) % 2)
+
+
+def project_geometry(geometry, insets):
+    """Projects a Polygon or MultiPolygon like geoproject: every projected
+    ring is closed again, then rings are regrouped into polygons by their
+    planar winding, holes joining the first polygon containing them."""
+    if geometry is None:
+        return None
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise ValueError(f"Unsupported geometry type {geometry['type']}")
+
+    rings = []
+    for inset in insets:
+        for polygon in polygons:
+            for coords in polygon:
+                coords = np.asarray(coords, dtype=np.float64)
+                # d3 streams rings without their closing vertex
+                if len(coords) > 1 and (coords[0] == coords[-1]).all():
+                    coords = coords[:-1]
+                if len(coords) == 0:
+                    continue
+                ring = inset.project_ring(coords)
+                if ring is not None:
+                    rings.append(np.concatenate([ring, ring[:1]]))
+
+    exteriors = []
+    holes = []
+    for ring in rings:
+        if planar_ring_area(ring) > 0:
+            exteriors.append([ring])
+        else:
+            holes.append(ring)
+    for hole in holes:
+        for polygon in exteriors:
+            if ring_contains(polygon[0], hole[0]):
+                polygon.append(hole)
+                break
+        else:
+            exteriors.append([hole])
+
+    coordinates = [[ring.tolist() for ring in polygon] for polygon in exteriors]
+    if not coordinates:
+        return None
+    if len(coordinates) == 1:
+        return {"type": "Polygon", "coordinates": coordinates[0]}
+    return {"type": "MultiPolygon", "coordinates": coordinates}
+
+
+def project_features(features, scale=SCALE, translate=TRANSLATE):
+    insets = albers_usa_pr(scale, translate)
+    return [
+        {
+            "type": "Feature",
+            "id": feature.get("id"),
+            "properties": feature["properties"],
+            "geometry": project_geometry(feature["geometry"], insets),
+        }
+        for feature in features
+    ]
+
+
+def project_file(source_path, projected_path, scale=SCALE, translate=TRANSLATE):
+    with open(source_path, "r") as f:
+        geo = json.load(f)
+    geo["features"] = project_features(geo["features"], scale, translate)
+    with open(projected_path, "w") as f:
+        f.write(json.dumps(geo, separators=(",", ":")))
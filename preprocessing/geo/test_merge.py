@@ -0,0 +1,90 @@
+# Tests for the merge table, on hand-made squares and on the real counties
+# the merges apply to (counties.topo.json, from before merging)
+
+import json
+import os
+
+import pytest
+import shapely.geometry
+
+from merge import MERGES, apply_merges, feature_key
+from topojson import geometry
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def square_feature(i, state, county, x):
+    return {
+        "id": i,
+        "type": "Feature",
+        "properties": {"STATE": state, "COUNTY": county, "NAME": f"County {i}"},
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[x, 0], [x + 1, 0], [x + 1, 1], [x, 1], [x, 0]]],
+        },
+    }
+
+
+MERGE = {"sources": [("01", "003"), ("01", "001")], "key": ("01", "999"), "name": "M"}
+
+
+def test_apply_merges():
+    features = [
+        square_feature(0, "01", "001", 0),
+        square_feature(1, "01", "002", 5),
+        square_feature(2, "01", "003", 1),
+        square_feature(3, "02", "001", 9),
+    ]
+    merged = apply_merges(features, [MERGE])
+    # Untouched features keep their order, merged ones come last
+    assert merged[:2] == [features[1], features[3]]
+    assert len(merged) == 3
+    feature = merged[2]
+    assert feature["id"] == 2
+    assert feature["properties"] == {"STATE": "01", "COUNTY": "999", "NAME": "M"}
+    shape = shapely.geometry.shape(feature["geometry"])
+    assert shape.geom_type == "Polygon"
+    assert shape.area == 2
+    assert shape.bounds == (0, 0, 2, 1)
+
+
+@pytest.mark.parametrize("counties", [["001"], ["001", "003", "003"]])
+def test_sources_must_match_once(counties):
+    features = [square_feature(i, "01", county, i) for i, county in enumerate(counties)]
+    with pytest.raises(AssertionError):
+        apply_merges(features, [MERGE])
+
+
+def test_merges_apply_to_counties():
+    with open(os.path.join(HERE, "counties.topo.json")) as f:
+        topology = json.load(f)
+    transform = topology["transform"]
+    sources = {key for merge in MERGES for key in merge["sources"]}
+    features = []
+    for i, obj in enumerate(topology["objects"]["counties"]["geometries"]):
+        properties = obj["properties"]
+        if (properties["STATE"], properties["COUNTY"]) in sources:
+            features.append(
+                {
+                    "id": i,
+                    "type": "Feature",
+                    "properties": properties,
+                    "geometry": geometry(
+                        obj,
+                        topology["arcs"],
+                        transform["scale"],
+                        transform["translate"],
+                    ),
+                }
+            )
+    assert len(features) == len(sources)
+
+    merged = apply_merges(features)
+    assert [feature_key(f) for f in merged] == [merge["key"] for merge in MERGES]
+    shapes = {feature_key(f): shapely.geometry.shape(f["geometry"]) for f in features}
+    for merge, feature in zip(MERGES, merged):
+        assert feature["properties"]["NAME"] == merge["name"]
+        shape = shapely.geometry.shape(feature["geometry"])
+        # The sources border each other, so nothing is lost or doubled
+        area = sum(shapes[key].area for key in merge["sources"])
+        assert shape.area == pytest.approx(area, rel=1e-6)
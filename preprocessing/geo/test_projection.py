@@ -0,0 +1,142 @@
+# Checks the in-process projection against the maps geoproject produced,
+# which are kept in the repository as fixtures (states.json), and on its own
+# for the insets, regrouping and resampling
+
+import json
+import os
+
+import numpy as np
+
+from projection import (
+    SCALE,
+    TRANSLATE,
+    albers_usa_pr,
+    planar_ring_area,
+    project_features,
+    ring_contains,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOLERANCE = 1e-6
+
+
+def all_rings(geometry):
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return geometry["coordinates"]
+    return [ring for polygon in geometry["coordinates"] for ring in polygon]
+
+
+def test_states_match_geoproject():
+    with open(os.path.join(HERE, "states.geo.json")) as f:
+        source = json.load(f)
+    with open(os.path.join(HERE, "states.json")) as f:
+        expected = json.load(f)
+
+    projected = project_features(source["features"])
+    assert len(projected) == len(expected["features"])
+    for ours, theirs in zip(projected, expected["features"]):
+        ours_rings = all_rings(ours["geometry"])
+        theirs_rings = all_rings(theirs["geometry"])
+        assert [len(r) for r in ours_rings] == [len(r) for r in theirs_rings]
+        for a, b in zip(ours_rings, theirs_rings):
+            assert np.abs(np.array(a) - np.array(b)).max() <= TOLERANCE
+
+
+def square(lon, lat, size=0.1):
+    """A clockwise ring, the winding d3 expects of outer rings."""
+    return [
+        [lon - size, lat - size],
+        [lon - size, lat + size],
+        [lon + size, lat + size],
+        [lon + size, lat - size],
+        [lon - size, lat - size],
+    ]
+
+
+def project(*polygons):
+    geometry = {"type": "MultiPolygon", "coordinates": list(polygons)}
+    return project_features([{"properties": {}, "geometry": geometry}])[0]["geometry"]
+
+
+def test_inset_centers():
+    # Each inset's rotated center lands on its translate exactly
+    k, (x, y) = SCALE, TRANSLATE
+    centers = [(-96.6, 38.7), (-156, 58.5), (-160, 19.9), (-66, 18)]
+    translates = [
+        (x, y),
+        (x - 0.307 * k, y + 0.201 * k),
+        (x - 0.205 * k, y + 0.212 * k),
+        (x + 0.350 * k, y + 0.224 * k),
+    ]
+    for inset, center, expected in zip(albers_usa_pr(), centers, translates):
+        point = inset.project_ring(np.array([center], dtype=np.float64))
+        assert np.abs(point[0] - expected).max() <= TOLERANCE
+
+
+def test_rings_land_in_one_inset():
+    # Kansas City, Anchorage, Honolulu and San Juan
+    places = [(-94.6, 39.1), (-149.9, 61.2), (-157.86, 21.3), (-66.1, 18.4)]
+    for inset, (lon, lat) in zip(albers_usa_pr(), places):
+        geometry = project([square(lon, lat)])
+        assert geometry["type"] == "Polygon"
+        assert len(geometry["coordinates"]) == 1
+        ring = np.array(geometry["coordinates"][0])
+        (x_min, y_min), (x_max, y_max) = inset.extent
+        assert ((ring >= (x_min, y_min)) & (ring <= (x_max, y_max))).all()
+    # London falls in none of them
+    assert project([square(-0.1, 51.5)]) is None
+
+
+def test_polygons_and_holes_are_regrouped():
+    outer = square(-100, 40, 1)
+    hole = square(-100, 40, 0.5)[::-1]
+    geometry = project([outer, hole], [square(-157.86, 21.3)])
+    assert geometry["type"] == "MultiPolygon"
+    assert [len(polygon) for polygon in geometry["coordinates"]] == [2, 1]
+    ring, projected_hole = map(np.array, geometry["coordinates"][0])
+    assert planar_ring_area(ring) > 0 > planar_ring_area(projected_hole)
+    assert ring_contains(ring, projected_hole[0])
+
+
+def test_equal_areas():
+    areas = [
+        planar_ring_area(np.array(project([square(lon, 40, 0.5)])["coordinates"][0]))
+        for lon in (-110, -100, -85)
+    ]
+    assert np.allclose(areas, areas[0], rtol=1e-3)
+
+
+def test_long_edges_follow_great_circles():
+    inset = albers_usa_pr()[0]
+    corners = np.array([[-120, 45], [-75, 45], [-75, 35], [-120, 35]], dtype=np.float64)
+    ring = inset.project_ring(corners)
+    assert len(ring) > len(corners)
+
+    # Densely sampled great circles between the corners stay within about
+    # a pixel of the resampled outline
+    lam, phi = inset.rotated(corners)
+    vectors = np.stack(
+        [np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)], axis=1
+    )
+    t = np.linspace(0, 1, 200)[:, None]
+    dense = []
+    for a, b in zip(vectors, np.roll(vectors, -1, axis=0)):
+        omega = np.arccos(a @ b)
+        points = (np.sin((1 - t) * omega) * a + np.sin(t * omega) * b) / np.sin(omega)
+        dense.append(
+            np.stack(
+                inset.project_rotated(
+                    np.arctan2(points[:, 1], points[:, 0]), np.arcsin(points[:, 2])
+                ),
+                axis=1,
+            )
+        )
+    dense = np.concatenate(dense)
+    starts, ends = ring, np.roll(ring, -1, axis=0)
+    direction = ends - starts
+    offsets = dense[:, None] - starts[None]
+    s = np.clip((offsets * direction).sum(axis=2) / (direction**2).sum(axis=1), 0, 1)
+    distances = np.hypot(*(offsets - s[..., None] * direction).transpose(2, 0, 1))
+    assert distances.min(axis=1).max() < 1
@@ -6,6 +6,8 @@ Author: Sean Gillies (https://github.com/sgillies)
 
 from itertools import chain
 
+import numpy as np
+
 
 def rel2abs(arc, scale=None, translate=None):
     """Yields absolute coordinate tuples from a delta-encoded arc.
@@ -22,6 +24,49 @@ def rel2abs(arc, scale=None, translate=None):
             yield x, y
 
 
+class ArcCache:
+    """Absolute coordinates of every arc in a topology, decoded once.
+
+    Delta-encoded arcs are decoded up-front with a single NumPy cumsum over
+    all arcs; each arc is then turned into a list of coordinate tuples (and
+    its reverse) the first time a feature references it, so arcs shared by
+    neighbouring features are only decoded and materialized once."""
+
+    def __init__(self, topology_arcs, scale=None, translate=None):
+        lengths = [len(arc) for arc in topology_arcs]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        coords = np.fromiter(
+            chain.from_iterable(chain.from_iterable(topology_arcs)), dtype=np.float64
+        ).reshape(-1, 2)
+        if scale and translate and len(coords):
+            # Per-arc running sums: one cumsum over every arc, minus the
+            # running total reached before each arc starts
+            totals = np.cumsum(coords, axis=0)
+            lengths = np.array([n for n in lengths if n])
+            ends = np.cumsum(lengths)
+            before = np.concatenate(
+                [np.zeros((1, 2), totals.dtype), totals[ends[:-1] - 1]]
+            )
+            coords = totals - np.repeat(before, lengths, axis=0)
+            coords = coords * np.asarray(scale) + np.asarray(translate)
+        # Plain float lists make building each arc's tuples cheap
+        self.xs = coords[:, 0].tolist()
+        self.ys = coords[:, 1].tolist()
+        self.forward = {}
+        self.backward = {}
+
+    def arc(self, arc):
+        """The coordinate tuples of an arc index, ~i being arc i reversed."""
+        if arc >= 0:
+            if arc not in self.forward:
+                start, end = self.offsets[arc], self.offsets[arc + 1]
+                self.forward[arc] = list(zip(self.xs[start:end], self.ys[start:end]))
+            return self.forward[arc]
+        if arc not in self.backward:
+            self.backward[arc] = self.arc(~arc)[::-1]
+        return self.backward[arc]
+
+
 def coordinates(arcs, topology_arcs, scale=None, translate=None):
     """Return GeoJSON coordinates for the sequence(s) of arcs.
     
@@ -31,18 +76,22 @@ def coordinates(arcs, topology_arcs, scale=None, translate=None):
     such sequences -- describing a polygon, or a sequence of polygon arcs.
     
     The topology_arcs parameter is a list of the shared, absolute or
-    delta-encoded arcs in the dataset.
+    delta-encoded arcs in the dataset, or an ArcCache of them.
     The scale and translate parameters are used to convert from delta-encoded
     to absolute coordinates. They are 2-tuples and are usually provided by
     a TopoJSON dataset. 
     """
     if isinstance(arcs[0], int):
-        coords = [
-            list(rel2abs(topology_arcs[arc if arc >= 0 else ~arc], scale, translate))[
-                :: arc >= 0 or -1
-            ][i > 0 :]
-            for i, arc in enumerate(arcs)
-        ]
+        if isinstance(topology_arcs, ArcCache):
+            arc_coords = topology_arcs.arc
+        else:
+
+            def arc_coords(arc):
+                return list(
+                    rel2abs(topology_arcs[arc if arc >= 0 else ~arc], scale, translate)
+                )[:: arc >= 0 or -1]
+
+        coords = [arc_coords(arc)[i > 0 :] for i, arc in enumerate(arcs)]
         return list(chain.from_iterable(coords))
     elif isinstance(arcs[0], (list, tuple)):
         return list(coordinates(arc, topology_arcs, scale, translate) for arc in arcs)
@@ -12,11 +12,36 @@ requires:
 Next steps: how can this be generalized to a robust CLI converter?
 """
 import json
-from topojson import geometry
-from shapely.geometry import asShape
+from concurrent.futures import ProcessPoolExecutor
+from topojson import ArcCache, geometry
+from shapely.geometry import shape
 
+# Decoded arcs shared by every feature, set up once per worker process
+arc_cache = None
 
-def topojson_to_geojson(topojson_path, geojson_path):
+
+def init_topology(arcs, scale, trans):
+    global arc_cache
+    arc_cache = ArcCache(arcs, scale, trans)
+
+
+def convert_feature(args):
+    """Returns the GeoJSON text of one (id, topology geometry) pair."""
+    id, tf = args
+    f = {"id": id, "type": "Feature"}
+    f["properties"] = tf["properties"].copy()
+
+    geommap = geometry(tf, arc_cache)
+    geom = shape(geommap).buffer(0)
+    assert geom.is_valid
+    f["geometry"] = geom.__geo_interface__
+    return json.dumps(f)
+
+
+def topojson_to_geojson(topojson_path, geojson_path, workers=1):
+    """With workers > 1, features are converted in a pool of processes that
+    each receive the arcs once. Features are written to geojson_path in
+    order as they are converted, rather than built up in memory first."""
     with open(topojson_path, "r") as fh:
         f = fh.read()
         topology = json.loads(f)
@@ -25,21 +50,32 @@ def topojson_to_geojson(topojson_path, geojson_path):
     layername = list(topology["objects"].keys())[0]
 
     features = topology["objects"][layername]["geometries"]
-    scale = topology["transform"]["scale"]
-    trans = topology["transform"]["translate"]
+    initargs = (
+        topology["arcs"],
+        topology["transform"]["scale"],
+        topology["transform"]["translate"],
+    )
 
     with open(geojson_path, "w") as dest:
-        fc = {"type": "FeatureCollection", "features": []}
-
-        for id, tf in enumerate(features):
-            f = {"id": id, "type": "Feature"}
-            f["properties"] = tf["properties"].copy()
-
-            geommap = geometry(tf, topology["arcs"], scale, trans)
-            geom = asShape(geommap).buffer(0)
-            assert geom.is_valid
-            f["geometry"] = geom.__geo_interface__
+        # Same text as json.dumps of the whole FeatureCollection
+        dest.write('{"type": "FeatureCollection", "features": [')
+        if workers > 1:
+            with ProcessPoolExecutor(
+                workers, initializer=init_topology, initargs=initargs
+            ) as executor:
+                chunksize = max(1, len(features) // (workers * 8))
+                converted = executor.map(
+                    convert_feature, enumerate(features), chunksize=chunksize
+                )
+                write_features(dest, converted)
+        else:
+            init_topology(*initargs)
+            write_features(dest, map(convert_feature, enumerate(features)))
+        dest.write("]}")
 
-            fc["features"].append(f)
 
-        dest.write(json.dumps(fc))
+def write_features(dest, converted):
+    for i, feature in enumerate(converted):
+        if i > 0:
+            dest.write(", ")
+        dest.write(feature)
@@ -0,0 +1,373 @@
+# Single-pass GeoJSON loading for the packer
+#
+# Each map file is parsed once into a flat (n, 2) coordinate array plus
+# offset indexes: ring_offsets[i]:ring_offsets[i + 1] are the vertices of
+# ring i, and feature_offsets[j]:feature_offsets[j + 1] are the rings of
+# feature j. Bounds and packing then work on whole arrays at a time.
+#
+# Packed polygons (as written to output.bin) are closed loops of uint16
+# (x, y) pairs scaled into the map bounds, MAX_COORD spanning the larger side.
+# Outer rings are forced clockwise and holes counter-clockwise so the client
+# can split multipolygons back apart.
+
+import json
+
+import numpy as np
+
+MAX_COORD = 256 * 256 - 1
+
+
+def depth(l):
+    if not isinstance(l, list) or len(l) == 0:
+        return 0
+    return 1 + depth(l[0])
+
+
+class MapGeometry:
+    def __init__(self, features, coords, ring_offsets, ring_holes, feature_offsets):
+        # GeoJSON features with their coordinates removed
+        self.features = features
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.ring_holes = ring_holes
+        self.feature_offsets = feature_offsets
+
+    def feature_rings(self, i):
+        start, end = self.feature_offsets[i], self.feature_offsets[i + 1]
+        return [
+            self.coords[self.ring_offsets[r] : self.ring_offsets[r + 1]]
+            for r in range(start, end)
+        ]
+
+
+def geometry_rings(coords, is_hole=False):
+    """Yields (ring, is_hole) pairs of nested GeoJSON coordinates, the first
+    ring of each polygon being its outer ring."""
+    if depth(coords) > 2:
+        for i, coord in enumerate(coords):
+            yield from geometry_rings(coord, i != 0)
+    else:
+        yield coords, is_hole
+
+
+def geojson_rings(geometry):
+    # Use the geometry type to avoid probing the nesting depth of every ring
+    if geometry["type"] == "Polygon":
+        return [(ring, i != 0) for i, ring in enumerate(geometry["coordinates"])]
+    if geometry["type"] == "MultiPolygon":
+        return [
+            (ring, i != 0)
+            for polygon in geometry["coordinates"]
+            for i, ring in enumerate(polygon)
+        ]
+    return list(geometry_rings(geometry["coordinates"]))
+
+
+def load_map(path):
+    with open(path) as f:
+        contents = json.load(f)
+
+    features = []
+    rings = []
+    ring_offsets = [0]
+    ring_holes = []
+    feature_offsets = [0]
+    for feature in contents["features"]:
+        geometry = feature["geometry"]
+        if geometry is not None:
+            for ring, is_hole in geojson_rings(geometry):
+                if len(ring) == 0:
+                    continue
+                rings.append(ring)
+                ring_offsets.append(ring_offsets[-1] + len(ring))
+                ring_holes.append(is_hole)
+            feature = {
+                **feature,
+                "geometry": {"type": geometry["type"]},
+            }
+        features.append(feature)
+        feature_offsets.append(len(ring_holes))
+
+    if rings:
+        coords = np.concatenate([np.asarray(ring, dtype=np.float64) for ring in rings])
+    else:
+        coords = np.empty((0, 2), dtype=np.float64)
+    return MapGeometry(
+        features,
+        coords,
+        np.array(ring_offsets, dtype=np.int64),
+        np.array(ring_holes, dtype=bool),
+        np.array(feature_offsets, dtype=np.int64),
+    )
+
+
+def get_bounds(maps):
+    coords = np.concatenate([m.coords for m in maps])
+    x_min, y_min = coords.min(axis=0)
+    x_max, y_max = coords.max(axis=0)
+    return [float(x_min), float(x_max), float(y_min), float(y_max)]
+
+
+def pack_map(geometry, bounds):
+    """Packs every feature of a MapGeometry as described above,
+    returning a list of bytes per feature (None for features without
+    geometry)."""
+    [x_min, x_max, y_min, y_max] = bounds
+    max_scale = max(x_max - x_min, y_max - y_min)
+    coords = geometry.coords
+    starts = geometry.ring_offsets[:-1]
+    ends = geometry.ring_offsets[1:]
+    if len(starts) == 0:
+        return [None if f["geometry"] is None else b"" for f in geometry.features]
+
+    # Orientation of every ring at once: shoelace terms with each ring's last
+    # vertex wrapping back to its first
+    following = np.arange(1, len(coords) + 1)
+    following[ends - 1] = starts
+    x, y = coords[:, 0], coords[:, 1]
+    terms = (x[following] - x) * (y[following] + y)
+    clockwise = np.add.reduceat(terms, starts) >= 0
+    # Outer rings are clockwise, holes counter-clockwise
+    reverse = clockwise == geometry.ring_holes
+    closed = (coords[starts] == coords[ends - 1]).all(axis=1)
+
+    scaled = np.empty(coords.shape, dtype=np.float64)
+    scaled[:, 0] = (x - x_min) / max_scale * MAX_COORD
+    scaled[:, 1] = (y - y_min) / max_scale * MAX_COORD
+    quantized = np.floor(scaled).astype(np.uint16)
+
+    # Gather all rings in output order, then slice the result per feature
+    indexes = []
+    ring_lengths = []
+    for start, end, is_reversed, is_closed in zip(starts, ends, reverse, closed):
+        ring = (
+            np.arange(end - 1, start - 1, -1) if is_reversed else np.arange(start, end)
+        )
+        if not is_closed:
+            ring = np.append(ring, ring[0])
+        indexes.append(ring)
+        ring_lengths.append(len(ring))
+    packed = quantized[np.concatenate(indexes)].tobytes() if indexes else b""
+    byte_offsets = np.concatenate([[0], np.cumsum(ring_lengths, dtype=np.int64) * 4])
+
+    results = []
+    for i, feature in enumerate(geometry.features):
+        if feature["geometry"] is None:
+            results.append(None)
+            continue
+        start = byte_offsets[geometry.feature_offsets[i]]
+        end = byte_offsets[geometry.feature_offsets[i + 1]]
+        results.append(packed[start:end])
+    return results
+
+
+# Levels of detail written alongside the full-resolution polygons, as
+# simplification tolerances in projected map units, coarsest first
+LOD_TOLERANCES = (1.0, 0.25)
+
+
+def segment_distances(points, a, b):
+    """Distances from each of points to the segment a-b."""
+    direction = b - a
+    length_squared = direction @ direction
+    if length_squared == 0:
+        return np.hypot(*(points - a).T)
+    t = np.clip((points - a) @ direction / length_squared, 0, 1)
+    return np.hypot(*(points - a - t[:, None] * direction).T)
+
+
+def douglas_peucker(points, tolerance):
+    """Returns a mask of the points kept when simplifying the polyline,
+    always keeping both ends."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distances = segment_distances(
+            points[start + 1 : end], points[start], points[end]
+        )
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            i += start + 1
+            keep[i] = True
+            stack.append((start, i))
+            stack.append((i, end))
+    return keep
+
+
+def ring_stretches(rings):
+    """Splits rings (vertex arrays without a closing vertex) into stretches
+    between junctions, the vertices where the set of rings sharing the edges
+    on either side changes, so a border shared by two rings splits the same
+    way in both.
+
+    Returns (ids, shared, stretches), each with an entry per ring: an id per
+    vertex, equal for coincident vertices, the number of rings sharing each
+    edge from a vertex to the next, and a list of index arrays into the ring
+    running from one junction to the next in ring order, wrapping around the
+    end."""
+    lengths = [len(ring) for ring in rings]
+    num_rings = len(rings)
+    if sum(lengths) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return [empty] * num_rings, [empty] * num_rings, [[] for _ in rings]
+    ring_of = np.repeat(np.arange(num_rings), lengths)
+    _, vertex_ids = np.unique(
+        np.concatenate([ring for ring in rings if len(ring)]),
+        axis=0,
+        return_inverse=True,
+    )
+    vertex_ids = vertex_ids.reshape(-1).astype(np.int64)
+    num_vertices = vertex_ids.max() + 1
+
+    # Every edge from a vertex to the next one in its ring, wrapping around,
+    # identified regardless of direction
+    ring_starts = np.concatenate([[0], np.cumsum(lengths)])
+    following = np.arange(1, len(vertex_ids) + 1)
+    ends = ring_starts[1:][np.array(lengths) > 0]
+    following[ends - 1] = ring_starts[:-1][np.array(lengths) > 0]
+    a, b = vertex_ids, vertex_ids[following]
+    _, edge_ids = np.unique(
+        np.minimum(a, b) * num_vertices + np.maximum(a, b), return_inverse=True
+    )
+    edge_ids = edge_ids.reshape(-1)
+
+    # Which rings share each edge: a count plus the lowest and highest ring
+    # identify the set exactly whenever fewer than three rings meet
+    num_edges = edge_ids.max() + 1
+    pairs = np.unique(edge_ids * num_rings + ring_of)
+    pair_edges, pair_rings = pairs // num_rings, pairs % num_rings
+    counts = np.bincount(pair_edges, minlength=num_edges)
+    lowest = np.full(num_edges, num_rings)
+    np.minimum.at(lowest, pair_edges, pair_rings)
+    highest = np.full(num_edges, -1)
+    np.maximum.at(highest, pair_edges, pair_rings)
+    signatures = np.stack([counts, lowest, highest], axis=1)
+    # Sets of three or more rings sharing an edge are rare enough to always
+    # split around
+    signatures[counts >= 3, 1:] = -np.arange(1, (counts >= 3).sum() + 1)[:, None]
+
+    all_ids, all_shared, all_stretches = [], [], []
+    for r, points in enumerate(rings):
+        ring_edges = edge_ids[ring_starts[r] : ring_starts[r + 1]]
+        ids = vertex_ids[ring_starts[r] : ring_starts[r + 1]]
+        all_ids.append(ids)
+        all_shared.append(counts[ring_edges])
+        if len(ids) == 0:
+            all_stretches.append([])
+            continue
+
+        # A junction is where the edge arriving at a vertex and the edge
+        # leaving it are shared by different rings
+        signature = signatures[ring_edges]
+        junctions = (signature != np.roll(signature, 1, axis=0)).any(axis=1)
+        pinned = list(np.flatnonzero(junctions))
+        if len(pinned) < 2:
+            # Closed loops have no natural ends, so split them at the lowest
+            # vertex id and the vertex farthest from it
+            anchor = pinned[0] if pinned else int(np.argmin(ids))
+            offsets = points.astype(np.float64) - points[anchor]
+            distances = np.hypot(*offsets.T)
+            farthest = np.lexsort((ids, -distances))[0]
+            pinned = sorted({anchor, int(farthest)})
+
+        stretches = []
+        for i, start in enumerate(pinned):
+            end = pinned[(i + 1) % len(pinned)]
+            stretches.append(
+                np.arange(start, end + 1)
+                if end > start
+                else np.concatenate([np.arange(start, len(ids)), np.arange(0, end + 1)])
+            )
+        all_stretches.append(stretches)
+    return all_ids, all_shared, all_stretches
+
+
+def is_reversed(ids, stretch):
+    """Whether a stretch runs against the direction shared by every ring
+    containing it, which is fixed by the ids of its vertices."""
+    first, last = ids[stretch[0]], ids[stretch[-1]]
+    if first != last:
+        return first > last
+    return ids[stretch].tolist()[::-1] < ids[stretch].tolist()
+
+
+def simplify_maps(maps, tolerance):
+    """Simplifies every ring of the given MapGeometry objects with
+    Douglas-Peucker, returning new MapGeometry objects.
+
+    Borders are simplified topologically (see ring_stretches): each stretch
+    between junctions is simplified the same way in every ring containing
+    it, so neighbouring regions of a map still meet. The state and county
+    maps share no vertices, so state outlines don't follow the simplified
+    county borders exactly. Every ring keeps at least a triangle."""
+    rings = []
+    closed = []
+    for m in maps:
+        for r in range(len(m.ring_holes)):
+            ring = m.coords[m.ring_offsets[r] : m.ring_offsets[r + 1]]
+            # Drop the closing vertex so shared vertices are only counted once
+            is_closed = len(ring) > 1 and (ring[0] == ring[-1]).all()
+            rings.append(ring[:-1] if is_closed else ring)
+            closed.append(is_closed)
+    ids, _, stretches = ring_stretches(rings)
+
+    keep = []
+    # Vertices every ring containing them has to keep
+    pinned = []
+    for r, points in enumerate(rings):
+        ring_keep = np.zeros(len(points), dtype=bool)
+        if len(points) < 4:
+            ring_keep[:] = True
+        for stretch in stretches[r] if len(points) >= 4 else []:
+            # Walk every stretch in the same direction whichever ring it
+            # belongs to, so ties break identically
+            if is_reversed(ids[r], stretch):
+                stretch = stretch[::-1]
+            ring_keep[stretch[douglas_peucker(points[stretch], tolerance)]] = True
+
+        # Grow rings that collapsed below a triangle back to one, adding the
+        # vertices farthest from what's kept
+        distinct = len(np.unique(ids[r]))
+        while len(np.unique(ids[r][ring_keep])) < min(3, distinct):
+            kept = np.flatnonzero(ring_keep)
+            distances = segment_distances(points, points[kept[0]], points[kept[-1]])
+            distances[ring_keep] = -1
+            added = np.argmax(distances)
+            ring_keep[added] = True
+            pinned.append(ids[r][added])
+        keep.append(ring_keep)
+
+    # Neighbours keep the vertices added above too, so borders still match
+    pinned = np.array(pinned, dtype=np.int64)
+    simplified = [
+        points[ring_keep | np.isin(ids[r], pinned)]
+        for r, (points, ring_keep) in enumerate(zip(rings, keep))
+    ]
+
+    # Rebuild each map from the kept vertices, closing every ring again
+    results = []
+    ring_index = 0
+    for m in maps:
+        ring_coords = []
+        ring_offsets = [0]
+        for _ in range(len(m.ring_holes)):
+            ring = simplified[ring_index]
+            if closed[ring_index]:
+                ring = np.concatenate([ring, ring[:1]])
+            ring_coords.append(ring)
+            ring_offsets.append(ring_offsets[-1] + len(ring))
+            ring_index += 1
+        results.append(
+            MapGeometry(
+                m.features,
+                np.concatenate(ring_coords) if ring_coords else m.coords[:0],
+                np.array(ring_offsets, dtype=np.int64),
+                m.ring_holes,
+                m.feature_offsets,
+            )
+        )
+    return results
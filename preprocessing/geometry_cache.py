@@ -0,0 +1,69 @@
+# Content-hashed cache of packed map geometry, so that data-only refreshes
+# can skip parsing and packing the (unchanging) GeoJSON files
+
+import hashlib
+import os
+import pickle
+
+# Bump whenever the packed polygon format or the simplification of the
+# levels of detail changes to invalidate old entries
+CACHE_VERSION = 6
+
+CACHE_DIR = "geo_cache"
+
+
+def cache_key(paths):
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}".encode("utf8"))
+    for path in paths:
+        h.update(os.path.basename(path).encode("utf8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(working_dir, key):
+    return os.path.join(working_dir, CACHE_DIR, f"geometry-{key}.pickle")
+
+
+def load(working_dir, key):
+    try:
+        with open(cache_path(working_dir, key), "rb") as f:
+            entry = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if entry.get("key") != key:
+        return None
+    return entry
+
+
+def save(working_dir, key, bounds, states_poly, county_poly, lods, labels=None):
+    """lods maps each simplification tolerance to (states_poly, county_poly)
+    and labels, if computed, is a (states, counties) pair of dicts mapping
+    FIPS codes to labels.region_label results."""
+    path = cache_path(working_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temporary file first so an interrupted build never leaves a
+    # truncated cache entry behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(
+            {
+                "key": key,
+                "bounds": bounds,
+                "states_poly": states_poly,
+                "county_poly": county_poly,
+                "lods": lods,
+                "labels": labels,
+            },
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmp_path, path)
+
+    # Only the latest geometry is ever needed
+    for fn in os.listdir(os.path.dirname(path)):
+        if fn.startswith("geometry-") and fn != os.path.basename(path):
+            os.remove(os.path.join(os.path.dirname(path), fn))
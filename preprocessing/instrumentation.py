@@ -0,0 +1,70 @@
+# Named, nestable timing stages for the build, e.g.
+#
+#   stages = Stages(hook=lambda stage: print(stage.name, stage.seconds))
+#   with stages.stage("pack_counties") as stage:
+#       stage.items += 1
+#       stage.bytes += len(packed)
+#
+# Entering the same stage again accumulates into it. Time spent in nested
+# stages is subtracted from the parent's self_seconds.
+
+import collections
+import contextlib
+import time
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.child_seconds = 0.0
+        self.items = 0
+        self.bytes = 0
+
+    @property
+    def self_seconds(self):
+        return self.seconds - self.child_seconds
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "self_seconds": self.self_seconds,
+            "items": self.items,
+            "bytes": self.bytes,
+        }
+
+
+class Stages:
+    def __init__(self, hook=None):
+        """hook, if given, is called with the Stage each time one finishes."""
+        self.hook = hook
+        self.stages = collections.OrderedDict()
+        self.stack = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(name)
+        self.stack.append(stage)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            stage.calls += 1
+            stage.seconds += elapsed
+            if self.stack:
+                self.stack[-1].child_seconds += elapsed
+            if self.hook is not None:
+                self.hook(stage)
+
+    def report(self):
+        return {
+            "total_seconds": sum(stage.self_seconds for stage in self.stages.values()),
+            "stages": [stage.to_dict() for stage in self.stages.values()],
+        }
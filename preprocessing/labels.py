@@ -0,0 +1,159 @@
+# Label points, bounding boxes and ring partitioning for packed polygons,
+# computed at build time so clients don't have to run polylabel on every
+# region when the page loads
+#
+# Packed polygons are split into rings the way the client reads them (see
+# topology.polygon_rings), and grouped into polygons with the same rule as
+# getCentroid in src/processing/processCovidData.js, so labels come out where
+# the client would have put them: every counter-clockwise ring starts a new
+# polygon and the clockwise rings after it join it. With the winding
+# geometry.pack_map gives the rings, that means a region's outer rings are
+# grouped together and each hole becomes a polygon of its own.
+
+import heapq
+import math
+
+import numpy as np
+
+from topology import polygon_rings
+
+# Same default precision as the client's polylabel
+PRECISION = 1.0
+
+# Cells subdivided per vectorized distance computation
+BATCH_SIZE = 16
+
+
+def is_clockwise(ring):
+    x, y = ring[:, 0].astype(np.float64), ring[:, 1].astype(np.float64)
+    return np.sum((np.roll(x, -1) - x) * (np.roll(y, -1) + y)) >= 0
+
+
+def partition(rings):
+    """Groups ring indexes into polygons like the client: [[i, ...], ...]."""
+    polygons = []
+    for i, ring in enumerate(rings):
+        if not is_clockwise(ring) or not polygons:
+            polygons.append([i])
+        else:
+            polygons[-1].append(i)
+    return polygons
+
+
+class PolygonDistance:
+    """Signed distances from points to a polygon's outline, positive inside,
+    like pointToPolygonDist in src/thirdparty/polylabel.js."""
+
+    def __init__(self, rings):
+        a = np.concatenate(rings).astype(np.float64)
+        # Each vertex paired with the previous one in its ring
+        b = np.concatenate([np.roll(ring, 1, axis=0) for ring in rings])
+        self.ax, self.ay = a[:, 0], a[:, 1]
+        self.bx, self.by = b[:, 0].astype(np.float64), b[:, 1].astype(np.float64)
+        self.dx, self.dy = self.bx - self.ax, self.by - self.ay
+        self.length_squared = self.dx * self.dx + self.dy * self.dy
+
+    def __call__(self, xs, ys):
+        x = np.asarray(xs, dtype=np.float64)[:, None]
+        y = np.asarray(ys, dtype=np.float64)[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing = (self.ay > y) != (self.by > y)
+            at = self.dx * (y - self.ay) / (self.by - self.ay) + self.ax
+            inside = np.count_nonzero(crossing & (x < at), axis=1) % 2 == 1
+
+            t = (
+                (x - self.ax) * self.dx + (y - self.ay) * self.dy
+            ) / self.length_squared
+        t = np.where(self.length_squared > 0, np.clip(t, 0, 1), 0)
+        nearest_x = self.ax + self.dx * t
+        nearest_y = self.ay + self.dy * t
+        distances = np.sqrt(((x - nearest_x) ** 2 + (y - nearest_y) ** 2).min(axis=1))
+        return np.where(inside, distances, -distances)
+
+
+def centroid(ring):
+    x, y = ring[:, 0].astype(np.float64), ring[:, 1].astype(np.float64)
+    px, py = np.roll(x, 1), np.roll(y, 1)
+    f = x * py - px * y
+    area = np.sum(f) * 3
+    if area == 0:
+        return x[0], y[0]
+    return np.sum((x + px) * f) / area, np.sum((y + py) * f) / area
+
+
+def polylabel(rings, precision=PRECISION):
+    """Pole of inaccessibility of a polygon given as [outer, hole, ...] rings
+    of (n, 2) arrays, returning (x, y, distance) like the client's polylabel."""
+    outer = rings[0]
+    min_x, min_y = outer.min(axis=0).astype(np.float64)
+    max_x, max_y = outer.max(axis=0).astype(np.float64)
+    width, height = max_x - min_x, max_y - min_y
+    cell_size = min(width, height)
+    if cell_size == 0:
+        return float(min_x), float(min_y), 0.0
+    distance = PolygonDistance(rings)
+
+    queue = []
+    counter = 0
+
+    def push(xs, ys, hs):
+        nonlocal counter
+        ds = distance(xs, ys)
+        for x, y, h, d in zip(xs, ys, hs, ds.tolist()):
+            heapq.heappush(queue, (-(d + h * math.sqrt(2)), counter, x, y, h, d))
+            counter += 1
+
+    # Cover the polygon with initial cells
+    h = cell_size / 2
+    xs, ys = np.meshgrid(
+        np.arange(min_x, max_x, cell_size), np.arange(min_y, max_y, cell_size)
+    )
+    push((xs.ravel() + h).tolist(), (ys.ravel() + h).tolist(), [h] * xs.size)
+
+    # Take the centroid as the first best guess, then the middle of the bbox
+    cx, cy = centroid(outer)
+    best = (float(cx), float(cy), float(distance([cx], [cy])[0]))
+    bx, by = min_x + width / 2, min_y + height / 2
+    bbox_distance = float(distance([bx], [by])[0])
+    if bbox_distance > best[2]:
+        best = (float(bx), float(by), bbox_distance)
+
+    # Expand the most promising cells a batch at a time so the distances of
+    # all their children are computed in one go
+    while queue:
+        batch = []
+        while queue and len(batch) < BATCH_SIZE:
+            negative_max, _, x, y, h, d = heapq.heappop(queue)
+            if d > best[2]:
+                best = (x, y, d)
+            # Don't drill down further if there's no chance of a better solution
+            if -negative_max - best[2] > precision:
+                batch.append((x, y, h / 2))
+        if batch:
+            xs, ys, hs = [], [], []
+            for x, y, h in batch:
+                xs += [x - h, x + h, x - h, x + h]
+                ys += [y - h, y - h, y + h, y + h]
+                hs += [h] * 4
+            push(xs, ys, hs)
+    return best
+
+
+def region_label(polygon):
+    """Returns the label point (x, y, distance) of the polygon part with the
+    largest one, the (x_min, y_min, x_max, y_max) bounding box and the ring
+    lengths of each part, or None for a polygon without vertices."""
+    rings = polygon_rings(polygon)
+    if not rings:
+        return None
+    points = np.concatenate(rings)
+    parts = partition(rings)
+    label = max(
+        (polylabel([rings[i] for i in part]) for part in parts),
+        key=lambda candidate: candidate[2],
+    )
+    return {
+        "label": tuple(float(v) for v in label),
+        "bbox": tuple(int(v) for v in [*points.min(axis=0), *points.max(axis=0)]),
+        "parts": [[len(rings[i]) for i in part] for part in parts],
+    }
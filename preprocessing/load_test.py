@@ -0,0 +1,174 @@
+# Load test for query_server.py, reporting request latency percentiles
+#
+#   python load_test.py ../public/output.bin --requests 20000 --concurrency 32
+#   python load_test.py --url http://127.0.0.1:8001
+#
+# Without --url a server is started on the given output in a subprocess.
+# Requests are a mix of the dashboards' queries: a region with its series,
+# one series as binary, the counties of a state, and a share of repeats that
+# revalidate with If-None-Match.
+
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+
+
+async def request(reader, writer, host, target, etag=None):
+    """Sends a GET on a keep-alive connection, returning (status, headers,
+    body)."""
+    lines = [f"GET {target} HTTP/1.1", f"Host: {host}"]
+    if etag is not None:
+        lines.append(f"If-None-Match: {etag}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin1"))
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+async def fetch_json(url, target):
+    parts = urllib.parse.urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+    try:
+        status, _, body = await request(reader, writer, parts.netloc, target)
+    finally:
+        writer.close()
+    if status != 200:
+        raise RuntimeError(f"{target}: HTTP {status}")
+    return json.loads(body)
+
+
+async def targets(url):
+    """Request targets to sample from, discovered through the server."""
+    states = await fetch_json(url, "/states")
+    counties = []
+    for state in states:
+        name = urllib.parse.quote(state["name"])
+        counties += await fetch_json(url, f"/states/{name}/counties")
+    fips = [c["fips"] for c in counties if c["fips"]]
+    if not fips:
+        raise RuntimeError("No FIPS codes to query; serve a v2 output.bin")
+
+    result = []
+    for code in fips:
+        result.append(f"/regions/{code}")
+        result.append(f"/regions/{code}/series/cases?format=bin")
+    for state in states:
+        result.append(f"/states/{urllib.parse.quote(state['name'])}/counties")
+    return result
+
+
+async def run(url, num_requests, concurrency, revalidate=0.2, seed=0):
+    parts = urllib.parse.urlsplit(url)
+    pool = await targets(url)
+    rng = random.Random(seed)
+    latencies = []
+    statuses = {}
+    remaining = num_requests
+
+    async def client():
+        nonlocal remaining
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+        etags = {}
+        try:
+            while remaining > 0:
+                remaining -= 1
+                target = rng.choice(pool)
+                etag = etags.get(target) if rng.random() < revalidate else None
+                start = time.perf_counter()
+                status, headers, _ = await request(
+                    reader, writer, parts.netloc, target, etag
+                )
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+                if "etag" in headers:
+                    etags[target] = headers["etag"]
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(50) * 1000,
+        "p90_ms": percentile(90) * 1000,
+        "p99_ms": percentile(99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "statuses": statuses,
+    }
+
+
+def start_server(output):
+    """Starts query_server.py on a free port, returning (process, url)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, "query_server.py", output, "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.time() > deadline:
+                process.kill()
+                raise RuntimeError("query_server.py did not start")
+            time.sleep(0.1)
+    return process, f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test query_server.py")
+    parser.add_argument("output", nargs="?", default="../public/output.bin")
+    parser.add_argument("--url", help="Test a running server instead")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--revalidate",
+        type=float,
+        default=0.2,
+        help="Share of repeated requests sent with If-None-Match",
+    )
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args.output)
+    try:
+        results = asyncio.run(
+            run(url, args.requests, args.concurrency, args.revalidate)
+        )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(json.dumps(results, indent=2))
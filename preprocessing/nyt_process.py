@@ -1,25 +1,99 @@
 # Special processing to convert NYT format into appropriate JSON format
 
 import csv
-import collections
+import io
 import json
 import os
 from datetime import date
 
+import numpy as np
 
-def nyt_process(working_dir=""):
-    historical_fn = os.path.join(working_dir, "historical.csv")
-    live_fn = os.path.join(working_dir, "live.csv")
+from download import load_metadata
 
-    counts = collections.defaultdict(collections.Counter)
-    places = collections.OrderedDict()
+START_DATE = date(2020, 1, 21)
 
-    start_date = date(2020, 1, 21)
-    max_day = 0
+# Parsed historical data, reused when historical.csv has only been appended to
+HISTORICAL_CACHE_DIR = "nyt_cache"
 
-    with open(historical_fn) as f:
-        reader = csv.reader(f)
-        next(reader)
+# Initial matrix capacity; grown by doubling as rows/days are seen
+INITIAL_PLACES = 4096
+INITIAL_DAYS = 512
+
+
+class SeriesMatrix:
+    """Places x days int32 matrices for cases and deaths, with each place
+    assigned a row index on first sight."""
+
+    def __init__(self):
+        self.places = []
+        self.rows = {}
+        self.num_days = 0
+        self.cases = np.zeros((INITIAL_PLACES, INITIAL_DAYS), dtype=np.int32)
+        self.deaths = np.zeros((INITIAL_PLACES, INITIAL_DAYS), dtype=np.int32)
+
+    def _grow(self, num_places, num_days):
+        places_capacity, days_capacity = self.cases.shape
+        if num_places <= places_capacity and num_days <= days_capacity:
+            return
+        # A matrix loaded from an empty cache can have a capacity of 0
+        while places_capacity < num_places:
+            places_capacity = max(places_capacity, 1) * 2
+        while days_capacity < num_days:
+            days_capacity = max(days_capacity, 1) * 2
+        for name in ["cases", "deaths"]:
+            old = getattr(self, name)
+            new = np.zeros((places_capacity, days_capacity), dtype=np.int32)
+            new[: old.shape[0], : old.shape[1]] = old
+            setattr(self, name, new)
+
+    @classmethod
+    def from_data(cls, data):
+        matrix = cls()
+        matrix.places = list(data["places"])
+        matrix.rows = {key: i for i, key in enumerate(matrix.places)}
+        matrix.num_days = data["cases"].shape[1]
+        matrix.cases = np.array(data["cases"], dtype=np.int32)
+        matrix.deaths = np.array(data["deaths"], dtype=np.int32)
+        return matrix
+
+    def row(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.places)
+            self._grow(row + 1, self.num_days)
+            self.rows[key] = row
+            self.places.append(key)
+        return row
+
+    def extend_days(self, num_days):
+        if num_days > self.num_days:
+            self._grow(len(self.places), num_days)
+            self.num_days = num_days
+
+    def set(self, key, day, cases, deaths):
+        row = self.row(key)
+        self.extend_days(day + 1)
+        self.cases[row, day] = cases
+        self.deaths[row, day] = deaths
+
+    def finish(self):
+        num_places = len(self.places)
+        return {
+            "places": self.places,
+            "cases": self.cases[:num_places, : self.num_days].copy(),
+            "deaths": self.deaths[:num_places, : self.num_days].copy(),
+        }
+
+
+def read_historical(fn, matrix, offset=0, max_day=0):
+    """Reads historical rows starting at byte offset, returning the last day."""
+    date_offsets = {}
+
+    with open(fn, "rb") as raw:
+        raw.seek(offset)
+        reader = csv.reader(io.TextIOWrapper(raw, newline=""))
+        if offset == 0:
+            next(reader)
         for row in reader:
             timestamp, county, state, fips, cases, deaths = row
             if cases.strip() == "":
@@ -27,12 +101,95 @@ def nyt_process(working_dir=""):
             if deaths.strip() == "":
                 deaths = "0"
             cases, deaths = int(cases), int(deaths)
-            day_offset = (date(*map(int, timestamp.split("-"))) - start_date).days
+            day_offset = date_offsets.get(timestamp)
+            if day_offset is None:
+                day_offset = (date(*map(int, timestamp.split("-"))) - START_DATE).days
+                date_offsets[timestamp] = day_offset
             if day_offset > max_day:
                 max_day = day_offset
-            key = (county, state, fips)
-            places[key] = True
-            counts[key][day_offset] = (cases, deaths)
+            matrix.set((county, state, fips), day_offset, cases, deaths)
+
+    return max_day
+
+
+def load_historical_cache(working_dir, fn):
+    """Returns (matrix, max_day, offset) to resume parsing fn from, or None if
+    the cache does not match a prefix of the current file."""
+    metadata = load_metadata(fn)
+    cache_dir = os.path.join(working_dir, HISTORICAL_CACHE_DIR)
+    try:
+        with open(os.path.join(cache_dir, "state.json")) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if metadata is None:
+        return None
+
+    if state["sha256"] == metadata["sha256"]:
+        offset = metadata["size"]
+    elif state["sha256"] == metadata.get("prefix_sha256"):
+        offset = metadata["prefix_size"]
+    else:
+        return None
+
+    # Only resume on a line boundary
+    if offset > 0:
+        with open(fn, "rb") as f:
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                return None
+
+    matrix = SeriesMatrix.from_data(
+        {
+            "places": [tuple(place) for place in state["places"]],
+            "cases": np.load(os.path.join(cache_dir, "cases.npy")),
+            "deaths": np.load(os.path.join(cache_dir, "deaths.npy")),
+        }
+    )
+    return matrix, state["max_day"], offset
+
+
+def save_historical_cache(working_dir, fn, matrix, max_day):
+    metadata = load_metadata(fn)
+    if metadata is None:
+        return
+    data = matrix.finish()
+    cache_dir = os.path.join(working_dir, HISTORICAL_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, "cases.npy"), data["cases"])
+    np.save(os.path.join(cache_dir, "deaths.npy"), data["deaths"])
+    with open(os.path.join(cache_dir, "state.json"), "w") as f:
+        json.dump(
+            {
+                "places": data["places"],
+                "max_day": max_day,
+                "size": metadata["size"],
+                "sha256": metadata["sha256"],
+            },
+            f,
+        )
+
+
+def read_nyt(working_dir="", incremental=False):
+    """Streams the historical and live NYT CSVs into a dict of places
+    (county, state, fips) and matching int32 cases/deaths matrices.
+
+    With incremental=True, the parsed historical data is cached and, when
+    download.py reports that historical.csv only grew, just the new trailing
+    rows are parsed."""
+    historical_fn = os.path.join(working_dir, "historical.csv")
+    live_fn = os.path.join(working_dir, "live.csv")
+
+    cached = load_historical_cache(working_dir, historical_fn) if incremental else None
+    if cached is not None:
+        matrix, max_day, offset = cached
+        print(f"Resuming historical.csv at byte {offset}")
+    else:
+        matrix, max_day, offset = SeriesMatrix(), 0, 0
+
+    max_day = read_historical(historical_fn, matrix, offset, max_day)
+    if incremental:
+        save_historical_cache(working_dir, historical_fn, matrix, max_day)
 
     puerto_rico_totals = [0, 0]
 
@@ -56,34 +213,79 @@ def nyt_process(working_dir=""):
             else:
                 cases, deaths = int(cases), int(deaths)
             day_offset = max_day + 1
-            key = (county, state, fips)
-            places[key] = True
-            counts[key][day_offset] = (cases, deaths)
-
-    data = []
-    for key in places:
-        row_data = []
-        for i in range(max_day + 2):
-            value = counts[key][i]
-            if value == 0:
-                value = (0, 0)
-            row_data.append(value)
-        data.append(
-            {
-                "countyFIPS": key[2],
-                "county": key[0],
-                "state": key[1],
-                "confirmed": [x[0] for x in row_data],
-                "deaths": [x[1] for x in row_data],
-            }
-        )
-        # Fix Puerto Rico deaths if 0
-        if data[-1]["state"] == "Puerto Rico" and data[-1]["deaths"][-1] == 0:
-            data[-1]["deaths"][-1] = data[-1]["deaths"][-2]
+            matrix.set((county, state, fips), day_offset, cases, deaths)
+
+    matrix.extend_days(max_day + 2)
+    data = matrix.finish()
 
-    with open(os.path.join(working_dir, "nyt_data.json"), "w") as f:
-        json.dump(data, f)
+    # Fix Puerto Rico deaths if 0
+    for i, (county, state, fips) in enumerate(data["places"]):
+        if state == "Puerto Rico" and data["deaths"][i, -1] == 0:
+            data["deaths"][i, -1] = data["deaths"][i, -2]
+
+    return data
+
+
+def save_nyt_matrices(data, working_dir=""):
+    np.save(os.path.join(working_dir, "nyt_cases.npy"), data["cases"])
+    np.save(os.path.join(working_dir, "nyt_deaths.npy"), data["deaths"])
+    with open(os.path.join(working_dir, "nyt_places.json"), "w") as f:
+        json.dump(data["places"], f)
+
+
+def load_nyt_matrices(working_dir=""):
+    # Memory-mapped copy-on-write, so callers can patch values in place
+    # without touching the files on disk
+    with open(os.path.join(working_dir, "nyt_places.json")) as f:
+        places = [tuple(place) for place in json.load(f)]
+    return {
+        "places": places,
+        "cases": np.load(os.path.join(working_dir, "nyt_cases.npy"), mmap_mode="c"),
+        "deaths": np.load(os.path.join(working_dir, "nyt_deaths.npy"), mmap_mode="c"),
+    }
+
+
+def nyt_process(working_dir="", nyt_format="json", incremental=False):
+    data = read_nyt(working_dir, incremental)
+
+    if nyt_format == "npy":
+        save_nyt_matrices(data, working_dir)
+    elif nyt_format == "json":
+        rows = []
+        for i, key in enumerate(data["places"]):
+            rows.append(
+                {
+                    "countyFIPS": key[2],
+                    "county": key[0],
+                    "state": key[1],
+                    "confirmed": data["cases"][i].tolist(),
+                    "deaths": data["deaths"][i].tolist(),
+                }
+            )
+
+        with open(os.path.join(working_dir, "nyt_data.json"), "w") as f:
+            json.dump(rows, f)
+    elif nyt_format is not None:
+        raise ValueError(f"Unknown NYT output format {nyt_format}")
+
+    return data
 
 
 if __name__ == "__main__":
-    nyt_process()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert NYT CSVs for process.py")
+    parser.add_argument(
+        "--format",
+        choices=["json", "npy"],
+        default="json",
+        help="Write nyt_data.json, or nyt_{cases,deaths}.npy plus nyt_places.json",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only parse rows appended to historical.csv since the last run",
+    )
+    args = parser.parse_args()
+
+    nyt_process(nyt_format=args.format, incremental=args.incremental)
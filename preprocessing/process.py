@@ -1,27 +1,100 @@
-import csv
-import math
+import cProfile
 import collections
 import json
 import struct
 import os
-import pytz
-from pytz import timezone
 
+import geometry_cache
+from artifacts import print_manifest, v2_sections, write_artifacts
+from binary_format import write_v2
+from demographics import (
+    ATTRIBUTES,
+    MISSING,
+    NYC,
+    PR,
+    RENAMES,
+    load_demographics,
+    lookup,
+)
+from derived import DERIVED_METRICS, derive_metrics
+from geometry import LOD_TOLERANCES, get_bounds, load_map, pack_map, simplify_maps
+from instrumentation import Stages
+from labels import region_label
+from nyt_process import load_nyt_matrices
+from quality import print_summary, validate
+from runs import display_nums, encode_runs
+from split_output import MANIFEST, write_split
+
+
+def process(working_dir="", hook=None, profile=False, report=False, **options):
+    """Builds public/output.bin, passing options on to build().
+
+    Each step runs as a named stage (see instrumentation.py); hook is called
+    with every finished Stage. With report=True a JSON summary of the stages
+    and the data-quality checks is written next to output.bin as
+    output.report.json, and with profile=True a cProfile dump of the whole
+    build is written to process.prof."""
+    stages = Stages(hook)
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        last_updated, quality_summary = build(working_dir, stages, **options)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(working_dir, "process.prof"))
+
+    if report:
+        with open(os.path.join(working_dir, "../public/output.report.json"), "w") as f:
+            json.dump(
+                {**stages.report(), "quality": quality_summary},
+                f,
+                indent=2,
+            )
+    return last_updated
 
-def process(working_dir=""):
-    # FIP renaming
-    renames = {
-        "02270": "02158",
-        "46113": "46102",
-    }
 
-    # Special key for 5 boroughs combined
-    NYC = "36NYC"
-    # Special key for Puerto Rico
-    PR = "72PR"
-    # Alaska FIPS merges
-    BRISTOL_BAY_LAKE_PENINSULA = "02997"  # 02060 and 02164
-    YAKUTAT_CITY_HOONAH_ANGOON = "02998"  # 02282 and 02105
+def build(
+    working_dir,
+    stages,
+    use_geometry_cache=True,
+    nyt_format="json",
+    nyt_data=None,
+    output_format="v1",
+    lod_tolerances=LOD_TOLERANCES,
+    geometry_encoding="polygons",
+    series_encoding="int32",
+    compress=True,
+    split=False,
+    derived_metrics=False,
+    attributes=False,
+    quality_policies=None,
+):
+    """Builds the output, returning (last updated, data-quality summary).
+
+    output_format selects the line-oriented v1 output.bin read by the client
+    or the indexed v2 layout described in binary_format.py. v2 files also get
+    a simplified copy of every polygon per tolerance in lod_tolerances and
+    precomputed label points, bounding boxes and polygon parts, and with
+    geometry_encoding="arcs" store their full-detail borders as shared arcs.
+    series_encoding="varint" stores their time series as delta varints.
+
+    With compress=True, gzip and brotli copies of output.bin are written next
+    to it along with output.artifacts.json (see artifacts.py).
+
+    With split=True a v2 build is written as separate content-hashed geometry
+    and series files listed in output.manifest.json (see split_output.py)
+    instead of output.bin.
+
+    derived_metrics=True adds the series of derived.py (daily new counts,
+    7-day averages and per-100k rates) to v2 output, and attributes=True the
+    household income attributes of demographics.py.
+
+    The case and death series are checked and repaired as in quality.py,
+    with quality_policies choosing the repair for each check; the summary is
+    printed and returned."""
+    renames = RENAMES
 
     fips_for_state = {
         "Alabama": "01",
@@ -82,107 +155,9 @@ def process(working_dir=""):
         "Virgin Islands": "78",
     }
 
-    def depth(l):
-        if not isinstance(l, list) or len(l) == 0:
-            return 0
-        return 1 + depth(l[0])
-
-    def is_clockwise(coords):
-        # From https://stackoverflow.com/a/1165943
-        total = 0
-        for i in range(len(coords)):
-            x1 = coords[i]["x"]
-            x2 = coords[(i + 1) % len(coords)]["x"]
-            y1 = coords[i]["y"]
-            y2 = coords[(i + 1) % len(coords)]["y"]
-            total += (x2 - x1) * (y2 + y1)
-        return total >= 0
-
-    def pack_simple_coords(coords, bounds):
-        [x_min, x_max, y_min, y_max] = bounds
-        width = x_max - x_min
-        height = y_max - y_min
-        max_scale = max(width, height)
-
-        result = b""
-        for coord in coords:
-            x = math.floor((coord["x"] - x_min) / (max_scale) * (256 * 256 - 1))
-            y = math.floor((coord["y"] - y_min) / (max_scale) * (256 * 256 - 1))
-            result += struct.pack("2H", x, y)
-        return result
-
-    def pack_coords(coords, bounds, is_hole=False):
-        if depth(coords) > 2:
-            results = b""
-            for i, coord in enumerate(coords):
-                results = results + pack_coords(coord, bounds, is_hole=i != 0)
-            return results
-
-        results = []
-
-        for x, y in coords:
-            results.append({"x": x, "y": y})
-
-        if is_hole:
-            # Force hole to be CCW
-            if is_clockwise(results):
-                results = results[::-1]
-        else:
-            # Force non-hole to be CW
-            if not is_clockwise(results):
-                results = results[::-1]
-
-        # Ensure closed loop
-        if results[0]["x"] != results[-1]["x"] or results[0]["y"] != results[-1]["y"]:
-            results.append(results[0])
-
-        return pack_simple_coords(results, bounds)
-
-    def get_bounds(maps):
-        x_min = None
-        y_min = None
-        x_max = None
-        y_max = None
-
-        def process_coords(coords):
-            nonlocal x_min
-            nonlocal y_min
-            nonlocal x_max
-            nonlocal y_max
-
-            if depth(coords) > 2:
-                for coord in coords:
-                    process_coords(coord)
-                return
-
-            for x, y in coords:
-                if x_min is None or x < x_min:
-                    x_min = x
-                if x_max is None or x > x_max:
-                    x_max = x
-                if y_min is None or y < y_min:
-                    y_min = y
-                if y_max is None or y > y_max:
-                    y_max = y
-
-        for fn in maps:
-            with open(os.path.join(working_dir, fn)) as f:
-                contents = json.load(f)
-
-            for feature in contents["features"]:
-                if feature["geometry"] is None:
-                    continue
-                coords = feature["geometry"]["coordinates"]
-                process_coords(coords)
-
-        return [x_min, x_max, y_min, y_max]
-
-    def process_map(fn, bounds):
-        with open(os.path.join(working_dir, fn)) as f:
-            contents = json.load(f)
-
+    def process_map(geometry, bounds, stage):
         features_by_id = {}
-        for feature in contents["features"]:
+        for feature, packed in zip(geometry.features, pack_map(geometry, bounds)):
             fips_id = feature["properties"]["STATE"] + feature["properties"].get(
                 "COUNTY", ""
             )
@@ -195,60 +170,95 @@ def process(working_dir=""):
                 fips_id = renames[fips_id]
             if feature["geometry"] is None:
                 continue
-            coords = feature["geometry"]["coordinates"]
-            features_by_id[fips_id] = pack_coords(coords, bounds)
+            features_by_id[fips_id] = packed
+            stage.items += 1
+            stage.bytes += len(packed)
 
         return features_by_id
 
-    def int_convert(num):
-        if num == " ":
-            num = "0"
-        return int(num.replace(",", ""))
-
-    PR_POPULATION = 3325001
-    populations = {PR: PR_POPULATION}
-    state_populations = {"Puerto Rico": PR_POPULATION}
-
-    def lpad(s, desired_length):
-        return "0" * max(desired_length - len(s), 0) + s
-
-    # Process census populations
-    with open(
-        os.path.join(working_dir, "population/co-est2018-alldata.csv"),
-        "r",
-        encoding="latin-1",
-    ) as f:
-        csvreader = csv.reader(f)
-        next(csvreader)  # Skip header
-        for row in csvreader:
-            state_fips = lpad(row[3], 2)
-            county_fips = lpad(row[4], 3)
-            population = int_convert(row[17])
-            if county_fips == "000":
-                state_populations[row[5]] = population
-            else:
-                combined_fips = state_fips + county_fips
-                if combined_fips in renames:
-                    combined_fips = renames[combined_fips]
-                populations[combined_fips] = population
-        populations[NYC] = (
-            populations["36081"]
-            + populations["36047"]
-            + populations["36085"]
-            + populations["36005"]
-            + populations["36061"]
-        )
-        populations[BRISTOL_BAY_LAKE_PENINSULA] = (
-            populations["02060"] + populations["02164"]
-        )
-        populations[YAKUTAT_CITY_HOONAH_ANGOON] = (
-            populations["02282"] + populations["02105"]
-        )
-
-    bounds = get_bounds(["geo/states.json", "geo/counties.json"])
-
-    states_poly = process_map("geo/states.json", bounds)
-    county_poly = process_map("geo/counties.json", bounds)
+    # Census populations, compiled once along with the ACS incomes
+    with stages.stage("population") as stage:
+        demographics = load_demographics(working_dir)
+        stage.items = len(demographics["fips"])
+        fips_codes = demographics["fips"].tolist()
+        populations = dict(zip(fips_codes, demographics["population"].tolist()))
+        state_populations = {
+            name: populations[fips]
+            for fips, name in zip(fips_codes, demographics["name"].tolist())
+            if name
+        }
+
+    # Geometry only changes when the map files do, so reuse the packed
+    # polygons from the last build when possible
+    map_files = ["geo/states.json", "geo/counties.json"]
+    cache_key = geometry_cache.cache_key(
+        [os.path.join(working_dir, fn) for fn in map_files]
+    )
+    # Simplified levels of detail are only written to the v2 format
+    lod_tolerances = list(lod_tolerances) if output_format == "v2" else []
+    # and so are precomputed labels, which v1 clients work out themselves
+    with_labels = output_format == "v2"
+    cached = None
+    if use_geometry_cache:
+        with stages.stage("geometry_cache_load"):
+            cached = geometry_cache.load(working_dir, cache_key)
+        if cached is not None and not set(lod_tolerances) <= set(cached["lods"]):
+            cached = None
+        if cached is not None and with_labels and cached["labels"] is None:
+            cached = None
+    if cached is not None:
+        print("Using cached geometry", cache_key[:12])
+        bounds = cached["bounds"]
+        states_poly = cached["states_poly"]
+        county_poly = cached["county_poly"]
+        lods = cached["lods"]
+        labels = cached["labels"]
+    else:
+        # Parse each map file once, then reuse the flat arrays for both the
+        # bounds and the packing
+        with stages.stage("load_maps") as stage:
+            states_map, counties_map = [
+                load_map(os.path.join(working_dir, fn)) for fn in map_files
+            ]
+            stage.items = len(states_map.features) + len(counties_map.features)
+        with stages.stage("bounds") as stage:
+            bounds = get_bounds([states_map, counties_map])
+            stage.items = len(states_map.coords) + len(counties_map.coords)
+
+        with stages.stage("pack_states") as stage:
+            states_poly = process_map(states_map, bounds, stage)
+        with stages.stage("pack_counties") as stage:
+            county_poly = process_map(counties_map, bounds, stage)
+
+        # Coarser copies of both maps, simplified so neighbouring regions
+        # still line up, packed against the same bounds
+        lods = {}
+        for tolerance in lod_tolerances:
+            with stages.stage("simplify") as stage:
+                simplified = simplify_maps([states_map, counties_map], tolerance)
+                stage.items += sum(len(m.coords) for m in simplified)
+            with stages.stage("pack_lods") as stage:
+                lods[tolerance] = [process_map(m, bounds, stage) for m in simplified]
+
+        labels = None
+        if with_labels:
+            with stages.stage("labels") as stage:
+                labels = [
+                    {fips: region_label(polygon) for fips, polygon in polys.items()}
+                    for polys in [states_poly, county_poly]
+                ]
+                stage.items = len(states_poly) + len(county_poly)
+        if use_geometry_cache:
+            with stages.stage("geometry_cache_save"):
+                geometry_cache.save(
+                    working_dir,
+                    cache_key,
+                    bounds,
+                    states_poly,
+                    county_poly,
+                    lods,
+                    labels,
+                )
 
     # First COVID-19 case in the US
     first_date = "1/21/2020"
@@ -270,108 +280,58 @@ def process(working_dir=""):
             else:
                 obj[key]["data"][data_type] = [sum(x) for x in zip(previous_data, data)]
 
-    with open(os.path.join(working_dir, "nyt_data.json")) as f:
-        data = json.load(f)
-
-        for row in data:
-            county_fips = row["countyFIPS"]
-            county = row["county"]
-            state = row["state"]
-            cases = row["confirmed"]
-            deaths = row["deaths"]
-
-            key = (state, county, county_fips)
-            add_data(fips_map, key, state, county, cases, "cases")
-            add_data(fips_map, key, state, county, deaths, "deaths")
-
-    # Hack: Ensure strict less than relationship between deaths and cases
-    for key in fips_map:
-        data = fips_map[key]["data"]
-        for i in range(len(data["cases"])):
-            cases = data["cases"][i]
-            deaths = data["deaths"][i]
-            # Only show unmatched deaths on normal FIPS codes
-            if deaths > cases and key[2] != "":
-                # Assume it's an error
-                print(
-                    f"UNMATCHED DEATHS, {deaths} deaths > {cases} cases [{i}], {fips_map[key]['county']}, {fips_map[key]['state']}"
-                )
-                data["deaths"][i] = cases
-
-    # Organize into states/counties
-    states = collections.defaultdict(list)
-    for x in fips_map.values():
-        states[x["state"]].append(x)
-
-    with open(os.path.join(working_dir, "last_updated.txt"), "r") as f:
-        last_updated = f.read().strip()
-    print("Last Updated (rounded to nearest 30 mins)", last_updated)
-
-    def expand_runs(data):
-        result = []
-        for i in range(0, len(data), 2):
-            count, value = data[i], data[i + 1]
-            for _ in range(count):
-                result.append(value)
-        return result
-
-    def compress_runs(data):
-        for i in range(0, len(data), 2):
-            total = 0
-            for j in range(i, len(data), 2):
-                total += data[j]
-            if total + 1 < len(data) - i:
-                return data[:i] + [0] + expand_runs(data[i:])
-
-        return data
-
-    def process_runs(data):
-        run = []
-
-        runs = []
-
-        def push_run():
-            if len(run) == 0:
-                return
-            runs.append(len(run))
-            runs.append(run[0])
-
-        for datum in data:
-            if len(run) != 0 and datum != run[-1]:
-                push_run()
-                run = []
-            run.append(datum)
-
-        push_run()
-        return compress_runs(runs)
-
-    def display_nums(nums):
-        return ",".join([str(num) for num in nums])
-
-    SUFFIX = " County"
-
-    with open(os.path.join(working_dir, "../public/output.bin"), "wb") as f:
-        position = 0
-
-        def write(contents):
-            nonlocal position
-            f.write(contents)
-            position += len(contents)
+    with stages.stage("load_nyt") as stage:
+        if nyt_data is None and nyt_format == "npy":
+            nyt_data = load_nyt_matrices(working_dir)
 
-        def out_str(s):
-            write((s + "\n").encode("utf8"))
-
-        def out_poly(p, population=None):
-            while position % 4 != 0:
-                write(b" ")
-            write(struct.pack("i", len(p) // 2))
-            if len(p) > 0:
-                write(struct.pack("i", population))
-            write(p)
-            write(b"\n")
+        if nyt_data is not None:
+            # Columnar data from nyt_process, one matrix row per place
+            for i, (county, state, county_fips) in enumerate(nyt_data["places"]):
+                key = (state, county, county_fips)
+                add_data(fips_map, key, state, county, nyt_data["cases"][i], "cases")
+                add_data(fips_map, key, state, county, nyt_data["deaths"][i], "deaths")
+        else:
+            with open(os.path.join(working_dir, "nyt_data.json")) as f:
+                data = json.load(f)
+
+                for row in data:
+                    county_fips = row["countyFIPS"]
+                    county = row["county"]
+                    state = row["state"]
+                    cases = row["confirmed"]
+                    deaths = row["deaths"]
+
+                    key = (state, county, county_fips)
+                    add_data(fips_map, key, state, county, cases, "cases")
+                    add_data(fips_map, key, state, county, deaths, "deaths")
+        stage.items = len(fips_map)
+
+    # Check the whole matrices at once, e.g. keeping deaths at or below cases
+    with stages.stage("validate") as stage:
+        rows = list(fips_map.values())
+        cases, deaths, quality_summary = validate(
+            [row["data"]["cases"] for row in rows],
+            [row["data"]["deaths"] for row in rows],
+            [f"{row['county']}, {row['state']}" for row in rows],
+            # Only check places with a normal FIPS code
+            [key[2] != "" for key in fips_map],
+            quality_policies,
+        )
+        for row, row_cases, row_deaths in zip(rows, cases, deaths):
+            row["data"]["cases"] = row_cases
+            row["data"]["deaths"] = row_deaths
+        stage.items = sum(result["repaired"] for result in quality_summary.values())
+    print_summary(quality_summary)
 
-        out_str(last_updated)
-        out_str(first_date)
+    # Organize into states/counties
+    with stages.stage("organize") as stage:
+        states = collections.defaultdict(list)
+        for x in fips_map.values():
+            states[x["state"]].append(x)
+
+        # Flatten into output order: each state followed by its counties
+        SUFFIX = " County"
+        records = []
         for state in states:
             # Skip non-Puerto Rico territories for now
             if state in [
@@ -382,9 +342,21 @@ def process(working_dir=""):
                 continue
             counties = states[state]
             counties = sorted(counties, key=lambda x: x["county"])
-            out_str(">" + state + "-" + state)
-            population = state_populations[state]
-            out_poly(states_poly[fips_for_state[state]], population)
+            records.append(
+                {
+                    "type": "state",
+                    "name": state,
+                    "fips": fips_for_state[state],
+                    "population": state_populations[state],
+                    "polygon": states_poly[fips_for_state[state]],
+                    "lods": [
+                        lods[tolerance][0][fips_for_state[state]]
+                        for tolerance in lod_tolerances
+                    ],
+                }
+            )
+            if with_labels:
+                records[-1]["label"] = labels[0][fips_for_state[state]]
 
             for row in counties:
                 county = row["county"]
@@ -394,23 +366,261 @@ def process(working_dir=""):
                 if row["state"] == "Puerto Rico":
                     county_fips = PR
                     county = "Puerto Rico"
-                confirmed_data = row["data"]["cases"]
-                deaths_data = row["data"]["deaths"]
                 if county.endswith(SUFFIX):
                     county = county[: -len(SUFFIX)]
-                out_str(county)
+                records.append(
+                    {
+                        "type": "county",
+                        "name": county,
+                        "fips": county_fips,
+                        "population": populations[county_fips] if county_fips else None,
+                        "polygon": county_poly[county_fips] if county_fips else b"",
+                        "lods": [
+                            lods[tolerance][1][county_fips] if county_fips else b""
+                            for tolerance in lod_tolerances
+                        ],
+                        "cases": row["data"]["cases"],
+                        "deaths": row["data"]["deaths"],
+                    }
+                )
+                if with_labels:
+                    records[-1]["label"] = (
+                        labels[1][county_fips] if county_fips else None
+                    )
+        stage.items = len(records)
+
+    metrics = ("cases", "deaths")
+    if derived_metrics:
+        if output_format != "v2":
+            raise ValueError("Derived metrics need the v2 format")
+        with stages.stage("derived_metrics") as stage:
+            counties = [record for record in records if record["type"] == "county"]
+            derived = derive_metrics(
+                [record["cases"] for record in counties],
+                [record["deaths"] for record in counties],
+                [record["population"] for record in counties],
+            )
+            for metric, matrix in derived.items():
+                for record, row in zip(counties, matrix):
+                    record[metric] = row
+            stage.items = len(counties)
+        metrics += DERIVED_METRICS
+
+    attribute_names = ()
+    if attributes:
+        if output_format != "v2":
+            raise ValueError("Region attributes need the v2 format")
+        with stages.stage("attributes") as stage:
+            for record in records:
+                i = lookup(demographics, record["fips"]) if record["fips"] else None
+                record["attributes"] = [
+                    MISSING if i is None else int(demographics[name][i])
+                    for name in ATTRIBUTES
+                ]
+            stage.items = len(records)
+        attribute_names = ATTRIBUTES
 
-                if county_fips == "":
-                    out_poly(b"")
-                else:
-                    population = populations[county_fips]
-                    out_poly(county_poly[county_fips], population)
-                out_str(display_nums(process_runs(confirmed_data)))
-                out_str(display_nums(process_runs(deaths_data)))
+    with open(os.path.join(working_dir, "last_updated.txt"), "r") as f:
+        last_updated = f.read().strip()
+    print("Last Updated (rounded to nearest 30 mins)", last_updated)
+
+    output_fn = os.path.join(working_dir, "../public/output.bin")
+    # Written next to it and moved into place once complete, so anything
+    # reading output.bin (e.g. query_server.py) never sees a partial file
+    tmp_fn = output_fn + ".tmp"
+    sections = None
+    if split:
+        if output_format != "v2":
+            raise ValueError("Split output needs the v2 format")
+        with stages.stage("write") as stage:
+            manifest = write_split(
+                os.path.join(working_dir, "../public"),
+                last_updated,
+                first_date,
+                records,
+                lod_tolerances,
+                geometry_encoding,
+                series_encoding,
+                metrics,
+                compress=compress,
+                attributes=attribute_names,
+            )
+            stage.items = len(records)
+            stage.bytes = manifest["geometry"]["bytes"] + sum(
+                chunk["bytes"] for chunk in manifest["series"]
+            )
+        print("---\nSUCCESSFULLY WROTE", MANIFEST)
+        return last_updated, quality_summary
+    elif output_format == "v2":
+        with stages.stage("write") as stage:
+            stage.bytes = write_v2(
+                tmp_fn,
+                last_updated,
+                first_date,
+                records,
+                lod_tolerances,
+                geometry_encoding,
+                metrics,
+                series_encoding,
+                attribute_names,
+            )
+            stage.items = len(records)
+    elif output_format == "v1":
+        sections = write_v1(tmp_fn, last_updated, first_date, records, stages)
+    else:
+        raise ValueError(f"Unknown output format {output_format}")
+    os.replace(tmp_fn, output_fn)
 
     print("---\nSUCCESSFULLY WROTE output.bin")
-    return last_updated
+
+    if compress:
+        if sections is None:
+            with open(output_fn, "rb") as f:
+                sections = v2_sections(f.read())
+        print_manifest(write_artifacts(output_fn, sections, stages))
+    return last_updated, quality_summary
+
+
+def write_v1(fn, last_updated, first_date, records, stages):
+    """Writes the v1 output.bin, returning the byte ranges of each kind of
+    content as {name: [(offset, length), ...]}."""
+
+    def encode_series(data):
+        with stages.stage("encode_runs") as stage:
+            encoded = display_nums(encode_runs(data))
+            stage.items += 1
+            stage.bytes += len(encoded)
+        return encoded
+
+    sections = collections.defaultdict(list)
+    with stages.stage("write") as write_stage, open(fn, "wb") as f:
+        position = 0
+
+        def write(contents, section):
+            nonlocal position
+            f.write(contents)
+            sections[section].append((position, len(contents)))
+            position += len(contents)
+            write_stage.bytes += len(contents)
+
+        def out_str(s, section):
+            write((s + "\n").encode("utf8"), section)
+
+        def out_poly(p, population, section):
+            while position % 4 != 0:
+                write(b" ", section)
+            write(struct.pack("i", len(p) // 2), section)
+            if len(p) > 0:
+                write(struct.pack("i", population), section)
+            write(p, section)
+            write(b"\n", section)
+
+        out_str(last_updated, "header")
+        out_str(first_date, "header")
+        for record in records:
+            write_stage.items += 1
+            if record["type"] == "state":
+                out_str(">" + record["name"] + "-" + record["name"], "names")
+                out_poly(record["polygon"], record["population"], "state_polygons")
+            else:
+                out_str(record["name"], "names")
+                out_poly(record["polygon"], record["population"], "county_polygons")
+                out_str(encode_series(record["cases"]), "series")
+                out_str(encode_series(record["deaths"]), "series")
+    return dict(sections)
 
 
 if __name__ == "__main__":
-    process()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build public/output.bin")
+    parser.add_argument(
+        "--no-geometry-cache",
+        action="store_true",
+        help="Re-pack all map geometry instead of reusing the cached polygons",
+    )
+    parser.add_argument(
+        "--nyt-format",
+        choices=["json", "npy"],
+        default="json",
+        help="Read nyt_data.json, or the memory-mapped matrices from nyt_process",
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="Write per-stage timings to public/output.report.json",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write a cProfile dump of the build to process.prof",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["v1", "v2"],
+        default="v1",
+        help="output.bin layout: v1 (read by the client) or indexed binary v2",
+    )
+    parser.add_argument(
+        "--lod-tolerances",
+        type=float,
+        nargs="*",
+        default=LOD_TOLERANCES,
+        help="Simplification tolerances for the v2 levels of detail, coarsest first",
+    )
+    parser.add_argument(
+        "--geometry",
+        choices=["polygons", "arcs"],
+        default="polygons",
+        help="Store v2 borders per polygon or once as shared arcs",
+    )
+    parser.add_argument(
+        "--series",
+        choices=["int32", "varint"],
+        default="int32",
+        help="Store v2 time series as int32 rows or delta-encoded varints",
+    )
+    parser.add_argument(
+        "--no-compress",
+        action="store_true",
+        help="Skip writing the precompressed output.bin.gz and output.bin.br",
+    )
+    parser.add_argument(
+        "--split",
+        action="store_true",
+        help="Write v2 geometry and series chunks as separate content-hashed files",
+    )
+    parser.add_argument(
+        "--derived-metrics",
+        action="store_true",
+        help="Add daily new counts, 7-day averages and per-100k rates to v2 output",
+    )
+    parser.add_argument(
+        "--attributes",
+        action="store_true",
+        help="Add household counts and incomes per region to v2 output",
+    )
+    parser.add_argument(
+        "--quality-policy",
+        action="append",
+        default=[],
+        metavar="CHECK=POLICY",
+        help="Repair policy for a data-quality check, e.g. decreases=carry",
+    )
+    args = parser.parse_args()
+
+    process(
+        use_geometry_cache=not args.no_geometry_cache,
+        nyt_format=args.nyt_format,
+        report=args.report,
+        profile=args.profile,
+        output_format=args.format,
+        lod_tolerances=args.lod_tolerances,
+        geometry_encoding=args.geometry,
+        series_encoding=args.series,
+        compress=not args.no_compress,
+        split=args.split,
+        derived_metrics=args.derived_metrics,
+        attributes=args.attributes,
+        quality_policies=dict(policy.split("=", 1) for policy in args.quality_policy),
+    )
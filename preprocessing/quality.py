@@ -0,0 +1,237 @@
+# Data-quality checks and repairs on whole (place, day) matrices of
+# cumulative cases and deaths, replacing the per-element fixup loop
+#
+# Checks, each with a repair policy (POLICIES lists the choices, the first
+# being the default):
+#
+#   gaps               days missing from the source, which come through as
+#                      zero cases and deaths after a place has had cases.
+#                      "ignore" reports them; "fill" carries the last
+#                      reported counts forward.
+#   deaths_over_cases  more deaths than cases on a day. "clip" lowers deaths
+#                      to the case count, as the build always has; "ignore"
+#                      only reports them.
+#   decreases          a cumulative count going down from one day to the
+#                      next. "ignore" reports them; "carry" holds the highest
+#                      count so far instead.
+#   late_reports       at least QUIET_DAYS quiet days without new cases
+#                      ending in a backlog reported at once: at least
+#                      SPIKE_MINIMUM new cases and over BACKLOG_FACTOR times
+#                      the trailing week's average. "ignore" reports them;
+#                      "spread" spreads the backlog evenly over the quiet
+#                      days.
+#   spikes             other daily increases over SPIKE_FACTOR times the
+#                      trailing week's average (and at least SPIKE_MINIMUM),
+#                      only ever reported.
+#
+# Only places with a FIPS code are checked, as before; the rest ("Unknown"
+# counties) pass through untouched. validate() returns a single summary of
+# every check instead of printing each violation.
+
+import numpy as np
+
+from derived import daily
+
+POLICIES = {
+    "gaps": ("ignore", "fill"),
+    "deaths_over_cases": ("clip", "ignore"),
+    "decreases": ("ignore", "carry"),
+    "late_reports": ("ignore", "spread"),
+}
+
+QUIET_DAYS = 3
+SPIKE_FACTOR = 10
+SPIKE_MINIMUM = 50
+BACKLOG_FACTOR = 2
+WINDOW = 7
+
+# Worst offenders listed per check in the summary
+EXAMPLES = 5
+
+
+def resolve_policies(policies=None):
+    """Fills in defaults for {check: policy}, rejecting unknown ones."""
+    resolved = {check: choices[0] for check, choices in POLICIES.items()}
+    for check, policy in (policies or {}).items():
+        if check not in POLICIES:
+            raise ValueError(f"Unknown data-quality check {check}")
+        if policy not in POLICIES[check]:
+            raise ValueError(f"Unknown policy {policy} for {check}")
+        resolved[check] = policy
+    return resolved
+
+
+def summarize(mask, severity, places, policy=None, repaired=False):
+    """Summary of the cells flagged in mask, listing the places and days
+    with the highest severity."""
+    rows, days = np.nonzero(mask)
+    order = np.argsort(-severity[rows, days], kind="stable")[:EXAMPLES]
+    summary = {
+        "cells": int(len(rows)),
+        "places": int(len(np.unique(rows))),
+        "repaired": int(len(rows)) if repaired else 0,
+        "examples": [
+            {
+                "place": places[rows[i]],
+                "day": int(days[i]),
+                "amount": int(severity[rows[i], days[i]]),
+            }
+            for i in order
+        ],
+    }
+    if policy is not None:
+        summary["policy"] = policy
+    return summary
+
+
+def trailing_average(new):
+    """Average of the WINDOW days before each day, earlier days counting as 0."""
+    sums = np.cumsum(new, axis=1)
+    previous_week = np.zeros(new.shape, dtype=np.float64)
+    previous_week[:, 1:] = sums[:, :-1]
+    previous_week[:, WINDOW + 1 :] -= sums[:, : -WINDOW - 1]
+    return previous_week / WINDOW
+
+
+def find_gaps(cases, deaths, checked):
+    """Mask of the days reported as nothing at all after a place's first
+    case."""
+    started = np.maximum.accumulate(cases > 0, axis=1)
+    return checked[:, None] & started & (cases == 0) & (deaths == 0)
+
+
+def fill_gaps(totals, mask):
+    """Carries the counts of the last day before each gap over it."""
+    days = np.broadcast_to(np.arange(totals.shape[1]), totals.shape)
+    last = np.maximum.accumulate(np.where(mask, 0, days), axis=1)
+    return np.take_along_axis(totals, last, axis=1)
+
+
+def find_late_reports(totals, checked, gaps):
+    """Returns (mask of backlog days ending a quiet stretch, quiet days
+    before each). Stretches with unfilled gaps in them are skipped, as the
+    day after a gap jumps back up by the whole count."""
+    num_days = totals.shape[1]
+    new = daily(totals)
+    days = np.broadcast_to(np.arange(num_days), new.shape)
+    # Last day with new cases up to each day, -1 before the first
+    last_new = np.maximum.accumulate(np.where(new > 0, days, -1), axis=1)
+    # Days without new cases right before each day
+    quiet = np.zeros_like(new)
+    quiet[:, 1:] = days[:, 1:] - 1 - last_new[:, :-1]
+    started = np.zeros(new.shape, dtype=bool)
+    started[:, 1:] = last_new[:, :-1] >= 0
+    backlog = (new >= SPIKE_MINIMUM) & (new > BACKLOG_FACTOR * trailing_average(new))
+    # Gaps among the quiet days before each day
+    gap_counts = np.cumsum(gaps, axis=1)
+    before = np.take_along_axis(gap_counts, np.maximum(days - quiet - 1, 0), axis=1)
+    before[days - quiet - 1 < 0] = 0
+    no_gaps = np.zeros(new.shape, dtype=bool)
+    no_gaps[:, 1:] = (gap_counts[:, :-1] - before[:, 1:]) == 0
+    mask = checked[:, None] & started & backlog & (quiet >= QUIET_DAYS) & no_gaps
+    return mask, quiet
+
+
+def spread_late_reports(totals, mask, quiet):
+    """Spreads each flagged spike evenly over itself and the quiet days
+    before it, rebuilding the cumulative counts."""
+    new = daily(totals)
+    rows, ends = np.nonzero(mask)
+    lengths = quiet[rows, ends] + 1
+    amounts = new[rows, ends]
+    new[rows, ends] = 0
+    # One entry per day the spike is spread over
+    event = np.repeat(np.arange(len(rows)), lengths)
+    offset = np.arange(len(event)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    day = np.repeat(ends - lengths + 1, lengths) + offset
+    share = amounts[event] // lengths[event]
+    # The remainder goes on the spike day so totals still add up
+    share += np.where(offset == lengths[event] - 1, amounts[event] % lengths[event], 0)
+    np.add.at(new, (rows[event], day), share)
+    return np.cumsum(new, axis=1)
+
+
+def find_spikes(totals, checked, gaps):
+    new = daily(totals)
+    average = trailing_average(new)
+    # Counts coming back after an unfilled gap aren't spikes
+    after_gaps = np.zeros(gaps.shape, dtype=bool)
+    after_gaps[:, 1:] = gaps[:, :-1]
+    return (
+        checked[:, None]
+        & (new >= SPIKE_MINIMUM)
+        & (new > SPIKE_FACTOR * np.maximum(average, 1))
+        & ~after_gaps
+    )
+
+
+def validate(cases, deaths, places, checked, policies=None):
+    """Checks and repairs (place, day) matrices of cumulative cases and
+    deaths. places names each row for the summary and checked marks the rows
+    to look at. Returns (cases, deaths, summary) with repaired copies."""
+    policies = resolve_policies(policies)
+    cases = np.array(cases, dtype=np.int64)
+    deaths = np.array(deaths, dtype=np.int64)
+    checked = np.asarray(checked, dtype=bool)
+    summary = {}
+
+    # Days missing from the source, before they show up as decreases
+    mask = find_gaps(cases, deaths, checked)
+    repair = policies["gaps"] == "fill"
+    summary["gaps"] = summarize(
+        mask, np.ones(mask.shape), places, policies["gaps"], repair
+    )
+    if repair:
+        cases = fill_gaps(cases, mask)
+        deaths = fill_gaps(deaths, mask)
+    # Gaps left in the counts, which carrying decreases also fills
+    gaps = mask & (policies["gaps"] == "ignore") & (policies["decreases"] == "ignore")
+
+    # Cumulative counts that go down
+    for name, totals in [("cases", cases), ("deaths", deaths)]:
+        drops = -daily(totals)
+        mask = checked[:, None] & (drops > 0)
+        mask[:, 0] = False
+        repair = policies["decreases"] == "carry"
+        summary[f"{name}_decreases"] = summarize(
+            mask, drops, places, policies["decreases"], repair
+        )
+        if repair:
+            totals[checked] = np.maximum.accumulate(totals[checked], axis=1)
+
+    # Backlogs reported at once after a gap
+    mask, quiet = find_late_reports(cases, checked, gaps)
+    repair = policies["late_reports"] == "spread"
+    summary["late_reports"] = summarize(
+        mask, daily(cases), places, policies["late_reports"], repair
+    )
+    summary["late_reports"]["quiet_days"] = int(quiet[mask].sum())
+    if repair:
+        cases = spread_late_reports(cases, mask, quiet)
+
+    # Spikes other than backlogs that were left in place
+    spikes = find_spikes(cases, checked, gaps)
+    if not repair:
+        spikes &= ~mask
+    summary["spikes"] = summarize(spikes, daily(cases), places)
+
+    # Deaths over cases last, so it applies to the repaired counts
+    excess = deaths - cases
+    mask = checked[:, None] & (excess > 0)
+    repair = policies["deaths_over_cases"] == "clip"
+    summary["deaths_over_cases"] = summarize(
+        mask, excess, places, policies["deaths_over_cases"], repair
+    )
+    if repair:
+        deaths = np.where(mask, cases, deaths)
+
+    return cases, deaths, summary
+
+
+def print_summary(summary):
+    for check, result in summary.items():
+        policy = result.get("policy", "report")
+        print(
+            f"{check:>20} {result['cells']:>7} days in {result['places']:>5}"
+            f" places, {result['repaired']:>7} repaired ({policy})"
+        )
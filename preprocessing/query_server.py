@@ -0,0 +1,306 @@
+# Local HTTP service answering per-region queries from the build output,
+# for dashboards that need one county's series rather than the whole map:
+#
+#   python query_server.py ../public/output.bin --port 8001
+#
+#   GET /meta                        lastUpdated, firstDate, days, build and
+#                                    the scales and noRate of the metrics
+#   GET /states                      every state with its FIPS code
+#   GET /states/<state>/counties     the counties of a state (by name or FIPS)
+#   GET /regions/<fips>              a region with all of its series
+#   GET /regions/<fips>/series/<metric>[?format=bin]
+#   GET /regions/<fips>/polygon      the packed uint16 polygon
+#
+# FIPS codes are only stored in v2 builds; with a v1 output.bin states and
+# counties can still be listed by name. JSON is the default; format=bin
+# returns little-endian int32 series. Every response has an ETag derived
+# from the build and the request, so unchanged queries get 304s.
+#
+# The output is memory-mapped once (see reader.py) and checked for changes
+# every --interval seconds. A new build is fully indexed before it replaces
+# the current one, so requests see either the old or the new build, never a
+# mix, and a half-written file just keeps the old one serving.
+
+import asyncio
+import hashlib
+import json
+import os
+import struct
+import urllib.parse
+
+from reader import OutputReader
+
+# Seconds between checks for a new build
+RELOAD_INTERVAL = 2.0
+
+STATUS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class NotFound(Exception):
+    pass
+
+
+class Snapshot:
+    """One build of the output, indexed by FIPS code and state."""
+
+    def __init__(self, fn):
+        stat = os.stat(fn)
+        self.signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        self.reader = OutputReader(fn)
+        # Hash the mapping itself so the build id matches what's served
+        self.build = hashlib.sha256(self.reader.buffer).hexdigest()[:16]
+        self.fips = {}
+        self.counties = {}
+        for region in self.reader.regions:
+            if region["fips"] is not None:
+                self.fips[region["fips"]] = region
+            if region["type"] == "county":
+                self.counties.setdefault(region["state"], []).append(region)
+
+    def close(self):
+        self.reader.close()
+
+    def etag(self, target):
+        digest = hashlib.sha256(f"{self.build} {target}".encode("utf8"))
+        return f'"{digest.hexdigest()[:24]}"'
+
+    def region(self, fips):
+        if fips not in self.fips:
+            raise NotFound(fips)
+        return self.fips[fips]
+
+    def state(self, key):
+        if key in self.reader.states:
+            return self.reader.states[key]
+        region = self.fips.get(key)
+        if region is None or region["type"] != "state":
+            raise NotFound(key)
+        return region
+
+    def summary(self, region):
+        result = {
+            "type": region["type"],
+            "name": region["name"],
+            "state": region["state"],
+            "fips": region["fips"],
+            "population": region["population"],
+            **self.reader.attributes(region),
+        }
+        if region["series"] is not None:
+            for metric in self.reader.metrics:
+                series = self.reader.series(region, metric)
+                result[metric] = int(series[-1]) if len(series) else None
+        return result
+
+    def respond(self, path, query):
+        """Returns (content type, body) for a request path."""
+        parts = [urllib.parse.unquote(part) for part in path.strip("/").split("/")]
+        if parts == ["meta"]:
+            return json_body(
+                {
+                    "lastUpdated": self.reader.last_updated,
+                    "firstDate": self.reader.first_date,
+                    "days": self.reader.num_days,
+                    "build": self.build,
+                    "scales": self.reader.scales,
+                    "noRate": self.reader.no_rate,
+                }
+            )
+        if parts == ["states"]:
+            return json_body(
+                [
+                    {"name": region["name"], "fips": region["fips"]}
+                    for region in self.reader.states.values()
+                ]
+            )
+        if len(parts) == 3 and parts[0] == "states" and parts[2] == "counties":
+            state = self.state(parts[1])
+            return json_body(
+                [self.summary(r) for r in self.counties.get(state["name"], [])]
+            )
+        if len(parts) >= 2 and parts[0] == "regions":
+            region = self.region(parts[1])
+            if len(parts) == 2:
+                result = self.summary(region)
+                if region["series"] is not None:
+                    for metric in self.reader.metrics:
+                        result[metric] = self.reader.series(region, metric).tolist()
+                return json_body(result)
+            if (
+                len(parts) == 4
+                and parts[2] == "series"
+                and parts[3] in self.reader.metrics
+            ):
+                if region["series"] is None:
+                    raise NotFound(path)
+                series = self.reader.series(region, parts[3])
+                if query.get("format") == ["bin"]:
+                    return "application/octet-stream", series.astype("<i4").tobytes()
+                return json_body(series.tolist())
+            if parts[2:] == ["polygon"]:
+                polygon = self.reader.polygon(region)
+                return "application/octet-stream", polygon.astype("<u2").tobytes()
+        raise NotFound(path)
+
+
+def json_body(value):
+    return "application/json", json.dumps(value).encode("utf8")
+
+
+class QueryServer:
+    def __init__(self, fn, interval=RELOAD_INTERVAL):
+        self.fn = fn
+        self.interval = interval
+        self.snapshot = Snapshot(fn)
+
+    def reload(self):
+        """Swaps in a new build if the file changed, returning whether it
+        did."""
+        try:
+            stat = os.stat(self.fn)
+        except OSError:
+            return False
+        if (stat.st_ino, stat.st_size, stat.st_mtime_ns) == self.snapshot.signature:
+            return False
+        try:
+            snapshot = Snapshot(self.fn)
+        except (
+            OSError,
+            ValueError,
+            IndexError,
+            KeyError,
+            UnicodeDecodeError,
+            struct.error,
+        ):
+            # Most likely still being written; try again next time
+            return False
+        # Requests are answered without yielding to the event loop, so
+        # nothing is still reading the old build
+        old, self.snapshot = self.snapshot, snapshot
+        old.close()
+        print("Loaded build", snapshot.build)
+        return True
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.reload()
+            except Exception as e:
+                # Keep watching whatever a bad build looks like
+                print("Failed to load build:", repr(e))
+
+    def handle_request(self, method, target, headers):
+        """Returns (status, headers, body) for a parsed request."""
+        if method not in ("GET", "HEAD"):
+            return 405, {}, b""
+        url = urllib.parse.urlsplit(target)
+        snapshot = self.snapshot
+        etag = snapshot.etag(target)
+        if headers.get("if-none-match") == etag:
+            return 304, {"ETag": etag}, b""
+        try:
+            content_type, body = snapshot.respond(
+                url.path, urllib.parse.parse_qs(url.query)
+            )
+        except NotFound:
+            return 404, {}, b""
+        except Exception as e:
+            # A bad region or build shouldn't take the connection down
+            print(f"Failed to answer {target}:", repr(e))
+            body = b"" if method == "HEAD" else b"Internal Server Error\n"
+            return 500, {"Content-Type": "text/plain"}, body
+        response_headers = {
+            "Content-Type": content_type,
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+        }
+        return 200, response_headers, b"" if method == "HEAD" else body
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin1").split()
+                except ValueError:
+                    await self.send(writer, 400, {}, b"", keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                status, response_headers, body = self.handle_request(
+                    method, target, headers
+                )
+                await self.send(writer, status, response_headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, headers, body, keep_alive):
+        lines = [f"HTTP/1.1 {status} {STATUS[status]}"]
+        headers = {**headers, "Content-Length": str(len(body))}
+        if not keep_alive:
+            headers["Connection"] = "close"
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin1") + body)
+        await writer.drain()
+
+
+async def serve(fn, host="127.0.0.1", port=0, interval=RELOAD_INTERVAL):
+    """Starts serving fn, returning (QueryServer, asyncio server)."""
+    query_server = QueryServer(fn, interval)
+    server = await asyncio.start_server(query_server.handle_connection, host, port)
+    server.watch_task = asyncio.create_task(query_server.watch())
+    return query_server, server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve per-region queries")
+    parser.add_argument("output", nargs="?", default="../public/output.bin")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=RELOAD_INTERVAL,
+        help="Seconds between checks for a new build",
+    )
+    args = parser.parse_args()
+
+    async def main():
+        query_server, server = await serve(
+            args.output, args.host, args.port, args.interval
+        )
+        print(f"Serving {args.output} (build {query_server.snapshot.build})")
+        print(f"at http://{args.host}:{server.sockets[0].getsockname()[1]}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,270 @@
+# Reader for output.bin, in either the v1 layout read by the client or the
+# v2 layout of binary_format.py
+#
+#   with OutputReader("../public/output.bin") as reader:
+#       county = reader.find("Albany", state="New York")
+#       points = reader.polygon(county)  # (n, 2) uint16 view into the file
+#       cases = reader.series(county, "cases")
+#       rates = reader.values(county, "cases_per_100k")  # unscaled floats
+#
+# The file is memory-mapped and indexed in one pass over the records;
+# polygons are only looked at when asked for and come back as NumPy views
+# of the mapping (except for v2 arcs geometry, which has to be decoded),
+# and decoded series are kept in a small LRU cache. Views keep the mapping
+# alive, so drop them before closing the reader.
+
+import functools
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from binary_format import (
+    MAGIC,
+    NO_POPULATION,
+    NO_SERIES,
+    RECORD,
+    STATE,
+    read_sections,
+)
+from runs import decode_runs
+from topology import decode_arcs, decode_ring, decode_shape
+from varints import decode_series
+
+METRICS = ("cases", "deaths")
+
+# Decoded series kept per reader
+CACHE_SIZE = 256
+
+
+class OutputReader:
+    def __init__(self, fn, cache_size=CACHE_SIZE):
+        with open(fn, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.arcs = None
+        if self.buffer[: len(MAGIC)] == MAGIC:
+            self.version = 2
+            self.regions = self.index_v2()
+        else:
+            self.version = 1
+            self.regions = self.index_v1()
+        self.states = {
+            region["name"]: region
+            for region in self.regions
+            if region["type"] == "state"
+        }
+        self.decoded_series = functools.lru_cache(maxsize=cache_size)(
+            self.decode_series
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.decoded_series.cache_clear()
+        self.arcs = None
+        self.buffer.close()
+
+    def index_v1(self):
+        buffer = self.buffer
+
+        def read_line(position):
+            end = buffer.find(b"\n", position)
+            return buffer[position:end].decode("utf8"), end + 1
+
+        def skip_polygon(position):
+            # Space padding up to a 4-byte boundary, the number of uint16
+            # values, the population if there are any, then the values
+            position += -position % 4
+            (count,) = struct.unpack_from("<i", buffer, position)
+            position += 4
+            population = None
+            if count > 0:
+                (population,) = struct.unpack_from("<i", buffer, position)
+                position += 4
+            return (position, count), population, position + count * 2 + 1
+
+        self.last_updated, position = read_line(0)
+        self.first_date, position = read_line(position)
+        regions = []
+        state = None
+        num_series = 0
+        while position < len(buffer):
+            name, position = read_line(position)
+            polygon, population, position = skip_polygon(position)
+            region = {
+                "index": len(regions),
+                "name": name,
+                "fips": None,
+                "population": population,
+                "polygon": polygon,
+            }
+            if name.startswith(">"):
+                region["name"] = name[1:].split("-")[0]
+                region.update(type="state", state=region["name"], series=None)
+                state = region["name"]
+            else:
+                region.update(type="county", state=state, series=num_series)
+                num_series += 1
+                lines = {}
+                for metric in METRICS:
+                    start = position
+                    position = buffer.find(b"\n", position) + 1
+                    lines[metric] = (start, position - 1)
+                region["lines"] = lines
+            regions.append(region)
+        self.num_days = None
+        self.num_series = num_series
+        self.metrics = METRICS
+        self.scales = {}
+        self.no_rate = {}
+        self.attribute_names = ()
+        return regions
+
+    def index_v2(self):
+        buffer = self.buffer
+        header, self.sections = read_sections(buffer)
+        self.num_days = header["days"]
+        meta = json.loads(self.section("meta"))
+        self.last_updated = meta["lastUpdated"]
+        self.first_date = meta["firstDate"]
+        self.geometry = meta.get("geometry", "polygons")
+        self.series_encoding = meta.get("series", "int32")
+        self.metrics = tuple(meta.get("metrics", METRICS))
+        self.scales = meta.get("scales", {})
+        self.no_rate = meta.get("noRate", {})
+        self.attribute_names = tuple(meta.get("attributes", ()))
+
+        strings_offset = self.sections["strings"][0]
+
+        def string(offset, length):
+            start = strings_offset + offset
+            return buffer[start : start + length].decode("utf8")
+
+        records_offset = self.sections["records"][0]
+        self.num_series = 0
+        regions = []
+        for i in range(header["records"]):
+            fields = RECORD.unpack_from(buffer, records_offset + RECORD.size * i)
+            kind, name_length, name_offset, state_index = fields[:4]
+            fips_length, fips_offset, population = fields[4:7]
+            polygon_offset, polygon_length, series_index = fields[7:]
+            name = string(name_offset, name_length)
+            if series_index != NO_SERIES:
+                self.num_series += 1
+            regions.append(
+                {
+                    "index": i,
+                    "type": "state" if kind == STATE else "county",
+                    "name": name,
+                    "state": name if kind == STATE else regions[state_index]["name"],
+                    "fips": string(fips_offset, fips_length) or None,
+                    "population": None if population == NO_POPULATION else population,
+                    "polygon": (polygon_offset, polygon_length),
+                    "series": None if series_index == NO_SERIES else series_index,
+                }
+            )
+        return regions
+
+    def section(self, name):
+        offset, size = self.sections[name]
+        return self.buffer[offset : offset + size]
+
+    def region(self, region):
+        return self.regions[region] if isinstance(region, int) else region
+
+    def counties(self, state):
+        return [
+            region
+            for region in self.regions
+            if region["type"] == "county" and region["state"] == state
+        ]
+
+    def find(self, name, state=None):
+        """Returns the state called name, or with state given the county."""
+        if state is None:
+            return self.states[name]
+        for region in self.counties(state):
+            if region["name"] == name:
+                return region
+        raise KeyError((state, name))
+
+    def polygon(self, region):
+        """The packed polygon of a region as an (n, 2) uint16 array, a view
+        into the file unless the geometry is stored as arcs."""
+        offset, length = self.region(region)["polygon"]
+        if self.version == 2 and self.geometry == "arcs":
+            if self.arcs is None:
+                self.arcs = decode_arcs(self.section("arcs"))
+            shape = decode_shape(self.buffer[offset : offset + length])
+            rings = [decode_ring(self.arcs, refs, start) for refs, start in shape]
+            return np.concatenate(rings) if rings else np.empty((0, 2), np.uint16)
+        return np.frombuffer(
+            self.buffer, dtype="<u2", count=length, offset=offset
+        ).reshape(-1, 2)
+
+    def attributes(self, region):
+        """{attribute: value} for a region, empty unless the file has them."""
+        if not self.attribute_names:
+            return {}
+        offset, _ = self.sections["attributes"]
+        values = np.frombuffer(
+            self.buffer,
+            dtype="<i4",
+            count=len(self.attribute_names),
+            offset=offset
+            + 4 * len(self.attribute_names) * self.region(region)["index"],
+        )
+        return dict(zip(self.attribute_names, values.tolist()))
+
+    def series(self, region, metric="cases"):
+        """The daily values of a county's metric as an int64 array, or None
+        for states."""
+        series_index = self.region(region)["series"]
+        if series_index is None:
+            return None
+        return self.decoded_series(self.region(region)["index"], metric)
+
+    def values(self, region, metric="cases"):
+        """A county's metric as float64s divided by its scale, with NaN where
+        a rate is missing, or None for states."""
+        series = self.series(region, metric)
+        if series is None:
+            return None
+        values = series / self.scales.get(metric, 1)
+        if metric in self.no_rate:
+            values[series == self.no_rate[metric]] = np.nan
+        return values
+
+    def decode_series(self, index, metric):
+        region = self.regions[index]
+        if self.version == 1:
+            start, end = region["lines"][metric]
+            line = self.buffer[start:end].decode("ascii")
+            values = decode_runs([int(x) for x in line.split(",")] if line else [])
+            result = np.array(values, dtype=np.int64)
+        else:
+            offset, _ = self.sections[metric]
+            if self.series_encoding == "varint":
+                offsets = np.frombuffer(
+                    self.buffer, dtype="<u4", count=self.num_series + 1, offset=offset
+                )
+                start = offset + 4 * (self.num_series + 1)
+                data = self.buffer[
+                    start
+                    + offsets[region["series"]] : start
+                    + offsets[region["series"] + 1]
+                ]
+                result = decode_series(data, self.num_days)[0]
+            else:
+                row = offset + 4 * self.num_days * region["series"]
+                result = np.frombuffer(
+                    self.buffer, dtype="<i4", count=self.num_days, offset=row
+                ).astype(np.int64)
+        # Cached arrays are shared between callers
+        result.flags.writeable = False
+        return result
@@ -0,0 +1,96 @@
+# Run-length encoding of the time series, as read by readCases in
+# src/processing/processCovidData.js
+#
+# A series is written as (count, value) pairs. Once the remainder of the
+# series is shorter written out plainly, a 0 is emitted followed by the raw
+# values, e.g. [0, 0, 0, 1, 2, 3] -> [3, 0, 0, 1, 2, 3].
+
+import numpy as np
+
+
+def expand_runs(data):
+    result = []
+    for i in range(0, len(data), 2):
+        count, value = data[i], data[i + 1]
+        for _ in range(count):
+            result.append(value)
+    return result
+
+
+def compress_runs(data):
+    for i in range(0, len(data), 2):
+        total = 0
+        for j in range(i, len(data), 2):
+            total += data[j]
+        if total + 1 < len(data) - i:
+            return data[:i] + [0] + expand_runs(data[i:])
+
+    return data
+
+
+def process_runs_python(data):
+    # Reference implementation, kept to check encode_runs against
+    run = []
+
+    runs = []
+
+    def push_run():
+        if len(run) == 0:
+            return
+        runs.append(len(run))
+        runs.append(run[0])
+
+    for datum in data:
+        if len(run) != 0 and datum != run[-1]:
+            push_run()
+            run = []
+        run.append(datum)
+
+    push_run()
+    return compress_runs(runs)
+
+
+def encode_runs(data):
+    """Linear-time equivalent of process_runs_python, returning a list of ints."""
+    values = np.asarray(data)
+    if len(values) == 0:
+        return []
+
+    # Start index, length and value of every run
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(values)) + 1])
+    lengths = np.diff(np.append(starts, len(values)))
+    num_runs = len(starts)
+
+    # Switch to raw values at the first run where the rest of the series plus
+    # the 0 marker takes fewer numbers than its (count, value) pairs
+    remaining = np.cumsum(lengths[::-1])[::-1]
+    remaining_pairs = 2 * (num_runs - np.arange(num_runs))
+    switch = np.flatnonzero(remaining + 1 < remaining_pairs)
+
+    if len(switch) == 0:
+        pairs = np.empty(2 * num_runs, dtype=values.dtype)
+        pairs[0::2] = lengths
+        pairs[1::2] = values[starts]
+        return pairs.tolist()
+
+    k = switch[0]
+    pairs = np.empty(2 * k, dtype=values.dtype)
+    pairs[0::2] = lengths[:k]
+    pairs[1::2] = values[starts[:k]]
+    return pairs.tolist() + [0] + values[starts[k] :].tolist()
+
+
+def decode_runs(data):
+    """Expands an encoded series back into its values, like readCases."""
+    result = []
+    i = 0
+    while i < len(data):
+        if data[i] == 0:
+            return result + list(data[i + 1 :])
+        result.extend([data[i + 1]] * data[i])
+        i += 2
+    return result
+
+
+def display_nums(nums):
+    return ",".join([str(num) for num in nums])
@@ -0,0 +1,147 @@
+# Split v2 output: the geometry and fixed date ranges of the time series in
+# separate content-hashed files under public/data, listed in a small
+# public/output.manifest.json
+#
+# A data refresh that only appends days rewrites the manifest and the newest
+# series chunk; the geometry and every earlier chunk keep their names, so
+# CDN and browser caches can hold on to them indefinitely.
+#
+# The geometry file is a v2 file without any metric sections. Each series
+# chunk is a v2 file whose header counts series instead of records, holding
+# a meta section (firstDay, days, series encoding, metrics, scales and
+# noRate) and one section per metric for its days, laid out like the full v2
+# sections.
+# Varint chunks start their deltas from 0, so each decodes on its own.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from artifacts import compressors
+from binary_format import encode_metric, write_file, write_v2
+from derived import metric_meta
+
+# Days per series chunk, counted from the first date
+CHUNK_DAYS = 28
+
+DATA_DIR = "data"
+MANIFEST = "output.manifest.json"
+
+
+def store(data_dir, kind, tmp_fn, compress):
+    """Moves a freshly written file to its content-hashed name, returning
+    its manifest entry."""
+    with open(tmp_fn, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    fn = f"{kind}-{digest[:16]}.bin"
+    path = os.path.join(data_dir, fn)
+    if os.path.exists(path):
+        # Unchanged since a previous build
+        os.remove(tmp_fn)
+    else:
+        os.replace(tmp_fn, path)
+        if compress:
+            for suffix, compress_data in compressors():
+                with open(path + suffix, "wb") as f:
+                    f.write(compress_data(data))
+    return {"file": f"{DATA_DIR}/{fn}", "bytes": len(data), "sha256": digest}
+
+
+def referenced_files(manifest):
+    entries = [manifest["geometry"]] + manifest["series"]
+    return {os.path.basename(entry["file"]) for entry in entries}
+
+
+def write_split(
+    public_dir,
+    last_updated,
+    first_date,
+    records,
+    lod_tolerances=(),
+    geometry_encoding="polygons",
+    series_encoding="int32",
+    metrics=("cases", "deaths"),
+    chunk_days=CHUNK_DAYS,
+    compress=True,
+    attributes=(),
+):
+    """Writes records as split output under public_dir, returning the
+    manifest."""
+    data_dir = os.path.join(public_dir, DATA_DIR)
+    os.makedirs(data_dir, exist_ok=True)
+    manifest_fn = os.path.join(public_dir, MANIFEST)
+    try:
+        with open(manifest_fn) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = None
+
+    # lastUpdated only goes in the manifest, so that the geometry file stays
+    # the same from one data refresh to the next
+    tmp_fn = os.path.join(data_dir, "output.tmp")
+    write_v2(
+        tmp_fn,
+        None,
+        first_date,
+        records,
+        lod_tolerances,
+        geometry_encoding,
+        metrics=(),
+        series_encoding=series_encoding,
+        attributes=attributes,
+    )
+    geometry = store(data_dir, "geometry", tmp_fn, compress)
+
+    series = {
+        metric: np.array(
+            [record[metric] for record in records if record["type"] == "county"]
+        )
+        for metric in metrics
+    }
+    num_series, num_days = series[metrics[0]].shape
+    chunks = []
+    for start in range(0, num_days, chunk_days):
+        end = min(start + chunk_days, num_days)
+        meta = {
+            "firstDay": start,
+            "days": end - start,
+            "series": series_encoding,
+            "metrics": list(metrics),
+            **metric_meta(metrics),
+        }
+        contents = {"meta": json.dumps(meta).encode("utf8")}
+        for metric in metrics:
+            contents[metric] = encode_metric(
+                series[metric][:, start:end], series_encoding
+            )
+        write_file(tmp_fn, contents, num_series, end - start)
+        chunks.append(
+            {"start": start, "end": end, **store(data_dir, "series", tmp_fn, compress)}
+        )
+
+    manifest = {
+        "lastUpdated": last_updated,
+        "firstDate": first_date,
+        "days": num_days,
+        "records": len(records),
+        "geometry": geometry,
+        "seriesEncoding": series_encoding,
+        "series": chunks,
+    }
+    with open(manifest_fn + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_fn + ".tmp", manifest_fn)
+
+    # Keep the files of the previous manifest around for clients that
+    # fetched it just before this build, and drop anything older
+    keep = referenced_files(manifest)
+    if previous is not None:
+        keep |= referenced_files(previous)
+    for fn in os.listdir(data_dir):
+        name = fn.split(".bin")[0] + ".bin"
+        if fn.startswith(("geometry-", "series-")) and name not in keep:
+            os.remove(os.path.join(data_dir, fn))
+    return manifest
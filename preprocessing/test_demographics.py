@@ -0,0 +1,87 @@
+# Tests for the compiled demographic table, on the census and ACS sources
+# kept in the repository
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import demographics
+from demographics import (
+    INCOME_CSV,
+    MISSING,
+    NYC,
+    POPULATION_CSV,
+    PR,
+    PR_POPULATION,
+    combine_incomes,
+    compile_demographics,
+    load_demographics,
+    lookup,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope="module")
+def table():
+    return compile_demographics(HERE)
+
+
+def row(table, fips):
+    i = lookup(table, fips)
+    return {name: table[name][i].item() for name in table}
+
+
+def test_rows(table):
+    assert (np.sort(table["fips"]) == table["fips"]).all()
+    assert lookup(table, "99999") is None
+    # Renamed counties only appear under their new FIPS codes
+    assert lookup(table, "02270") is None
+    assert lookup(table, "02158") is not None
+    assert row(table, "36")["name"] == "New York"
+
+    boroughs = [row(table, fips) for fips in demographics.COMPOSITES[NYC]]
+    nyc = row(table, NYC)
+    assert nyc["population"] == sum(b["population"] for b in boroughs)
+    assert nyc["households"] == sum(b["households"] for b in boroughs)
+    mean = sum(b["households"] * b["mean_income"] for b in boroughs)
+    assert nyc["mean_income"] == round(mean / nyc["households"])
+
+    assert row(table, PR)["population"] == PR_POPULATION
+    assert row(table, "72")["households"] == row(table, PR)["households"] > 0
+
+
+def test_combine_incomes():
+    incomes = {"a": (100, 50000, 60000), "b": (300, 30000, 40000)}
+    assert combine_incomes(["a", "b"], incomes) == (400, 35000, 45000)
+    assert combine_incomes(["a", "c"], incomes) == (MISSING,) * 3
+    incomes["c"] = (10, MISSING, 1000)
+    assert combine_incomes(["a", "c"], incomes) == (MISSING,) * 3
+    assert combine_incomes([], incomes) == (MISSING,) * 3
+
+
+def test_load_recompiles_when_sources_change(tmp_path, monkeypatch, table):
+    for fn in (POPULATION_CSV, INCOME_CSV):
+        os.makedirs(tmp_path / os.path.dirname(fn), exist_ok=True)
+        shutil.copy(os.path.join(HERE, fn), tmp_path / fn)
+    loaded = load_demographics(str(tmp_path))
+    assert all((loaded[name] == table[name]).all() for name in table)
+
+    compiles = []
+
+    def counting_compile(working_dir):
+        compiles.append(working_dir)
+        return compile_demographics(working_dir)
+
+    monkeypatch.setattr(demographics, "compile_demographics", counting_compile)
+    load_demographics(str(tmp_path))
+    assert compiles == []
+
+    # Without the incomes, the table is recompiled with them missing
+    os.remove(tmp_path / INCOME_CSV)
+    loaded = load_demographics(str(tmp_path))
+    assert len(compiles) == 1
+    assert (loaded["population"] == table["population"]).all()
+    assert (loaded["median_income"] == MISSING).all()
@@ -0,0 +1,54 @@
+# Tests for the derived metrics
+
+import numpy as np
+
+from binary_format import write_v2
+from derived import DERIVED_METRICS, NO_RATE, SCALE, derive_metrics
+from reader import OutputReader
+
+
+def test_derive_metrics_matches_loop():
+    # Against a straightforward per-place loop
+    rng = np.random.default_rng(0)
+    cases = np.cumsum(rng.integers(-2, 50, size=(40, 30)), axis=1)
+    deaths = cases // 20
+    populations = [
+        None if i % 7 == 0 else int(rng.integers(1, 10**6)) for i in range(40)
+    ]
+    derived = derive_metrics(cases, deaths, populations)
+    for i in range(40):
+        new = [cases[i, 0]] + [cases[i, d] - cases[i, d - 1] for d in range(1, 30)]
+        assert derived["new_cases"][i].tolist() == new
+        for d in range(30):
+            average = sum(new[max(0, d - 6) : d + 1]) / 7
+            assert derived["new_cases_avg7"][i, d] == round(average * SCALE)
+            if populations[i] is None:
+                assert derived["cases_per_100k"][i, d] == NO_RATE
+            else:
+                rate = cases[i, d] * 100000 / populations[i]
+                assert derived["cases_per_100k"][i, d] == round(rate * SCALE)
+
+
+def test_reader_unscales_metrics(tmp_path):
+    cases = np.array([[0, 3, 10], [1, 1, 2]])
+    derived = derive_metrics(cases, cases // 2, [200000, None])
+    records = [{"type": "state", "name": "State", "fips": "01", "polygon": b""}]
+    for i in range(2):
+        records.append(
+            {
+                "type": "county",
+                "name": f"County {i}",
+                "fips": f"0100{i}",
+                "polygon": b"",
+                **{metric: derived[metric][i] for metric in DERIVED_METRICS},
+            }
+        )
+    fn = tmp_path / "output.bin"
+    write_v2(str(fn), "", "1/21/2020", records, metrics=DERIVED_METRICS)
+
+    with OutputReader(str(fn)) as reader:
+        assert reader.values(0, "cases_per_100k") is None
+        assert reader.values(1, "cases_per_100k").tolist() == [0, 1.5, 5]
+        assert reader.values(1, "new_cases_avg7").tolist() == [0, 0.43, 1.43]
+        assert np.isnan(reader.values(2, "cases_per_100k")).all()
+        assert reader.values(2, "new_cases").tolist() == [1, 0, 1]
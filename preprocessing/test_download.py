@@ -0,0 +1,108 @@
+# Tests for the conditional and incremental downloads, against a local
+# fixture server standing in for the NYT hosts
+
+import pytest
+
+from download import DownloadError, fetch, retry
+from fixture_server import serve
+from nyt_process import load_historical_cache, read_nyt
+
+HEADER = "date,county,state,fips,cases,deaths\n"
+DAY_1 = "2020-03-01,Autauga,Alabama,01001,1,0\n2020-03-01,Baldwin,Alabama,01003,2,0\n"
+DAY_2 = "2020-03-02,Autauga,Alabama,01001,3,1\n"
+LIVE = HEADER + "2020-03-03,Autauga,Alabama,01001,4,1\n"
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    """(fixture directory served over HTTP, working directory, base URL)."""
+    served = tmp_path / "served"
+    working = tmp_path / "working"
+    served.mkdir()
+    working.mkdir()
+    (working / "live.csv").write_text(LIVE)
+    server = serve(str(served))
+    yield served, working, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def fetch_historical(served, working, url, contents):
+    (served / "historical.csv").write_text(contents)
+    return fetch(
+        url + "/historical.csv", str(working / "historical.csv"), conditional=True
+    )
+
+
+def assert_same(a, b):
+    assert a["places"] == b["places"]
+    assert (a["cases"] == b["cases"]).all()
+    assert (a["deaths"] == b["deaths"]).all()
+
+
+def test_unchanged_file_is_not_modified(dirs):
+    served, working, url = dirs
+    first = fetch_historical(served, working, url, HEADER + DAY_1)
+    assert first["changed"]
+    second = fetch_historical(served, working, url, HEADER + DAY_1)
+    assert not second["changed"]
+    assert second["sha256"] == first["sha256"]
+
+
+def test_append_resumes_at_prefix_size(dirs):
+    served, working, url = dirs
+    fetch_historical(served, working, url, HEADER + DAY_1)
+    read_nyt(str(working), incremental=True)
+
+    metadata = fetch_historical(served, working, url, HEADER + DAY_1 + DAY_2)
+    assert metadata["prefix_size"] == len(HEADER + DAY_1)
+    _, _, offset = load_historical_cache(str(working), str(working / "historical.csv"))
+    assert offset == metadata["prefix_size"]
+    assert_same(read_nyt(str(working), incremental=True), read_nyt(str(working)))
+
+
+def test_rewrite_falls_back_to_full_parse(dirs):
+    served, working, url = dirs
+    fetch_historical(served, working, url, HEADER + DAY_1)
+    read_nyt(str(working), incremental=True)
+
+    # A corrected earlier row changes the file's existing contents
+    rewritten = HEADER + DAY_1.replace(",2,0", ",5,0") + DAY_2
+    metadata = fetch_historical(served, working, url, rewritten)
+    assert metadata["prefix_size"] is None
+    assert load_historical_cache(str(working), str(working / "historical.csv")) is None
+    data = read_nyt(str(working), incremental=True)
+    assert_same(data, read_nyt(str(working)))
+    assert data["cases"][1, 40] == 5
+
+
+def test_retries_server_errors(tmp_path):
+    (tmp_path / "live.csv").write_text(LIVE)
+    server = serve(str(tmp_path), failures=2)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/live.csv"
+        attempts = []
+
+        def attempt(i):
+            attempts.append(i)
+            return fetch(url, str(tmp_path / "out.csv"))
+
+        assert retry(attempt, retries=3, backoff=0)["size"] == len(LIVE)
+        assert attempts == [0, 1, 2]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_does_not_retry_client_errors(dirs):
+    _, working, url = dirs
+    attempts = []
+
+    def attempt(i):
+        attempts.append(i)
+        return fetch(url + "/missing.csv", str(working / "missing.csv"))
+
+    with pytest.raises(DownloadError) as error:
+        retry(attempt, retries=3, backoff=0)
+    assert error.value.status == 404
+    assert attempts == [0]
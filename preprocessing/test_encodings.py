@@ -0,0 +1,302 @@
+# Round-trip and equivalence tests for the output encodings
+#
+#   cd preprocessing && python -m pytest -q
+
+import json
+import math
+import os
+import random
+import struct
+
+import numpy as np
+import pytest
+
+from binary_format import write_v2
+from geometry import MAX_COORD, geometry_rings, load_map, pack_map
+from instrumentation import Stages
+from process import write_v1
+from reader import METRICS, OutputReader
+from runs import decode_runs, encode_runs, process_runs_python
+from topology import (
+    build_topology,
+    decode_arcs,
+    decode_ring,
+    decode_shape,
+    encode_arcs,
+    encode_shape,
+    polygon_rings,
+)
+from varints import (
+    decode_series,
+    decode_varints,
+    encode_series,
+    encode_varints,
+    unzigzag,
+    zigzag,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def random_series(rng, length, big=False):
+    series = []
+    value = 0
+    for _ in range(length):
+        r = rng.random()
+        if r < 0.3:
+            value += rng.randrange(1, 1 << rng.randrange(1, 24) if big else 1000)
+        elif r < 0.35:
+            value = max(0, value - rng.randrange(0, 50)) if big else rng.randrange(5)
+        series.append(value)
+    return series
+
+
+# Packing
+
+
+def reference_pack(coords, bounds):
+    """The original per-vertex packer, one feature at a time."""
+    [x_min, x_max, y_min, y_max] = bounds
+    max_scale = max(x_max - x_min, y_max - y_min)
+    result = []
+    for ring, is_hole in geometry_rings(coords):
+        total = 0
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+            total += (x2 - x1) * (y2 + y1)
+        # Outer rings clockwise, holes counter-clockwise
+        if (total >= 0) == is_hole:
+            ring = ring[::-1]
+        if ring[0] != ring[-1]:
+            ring = ring + ring[:1]
+        for x, y in ring:
+            result.append(
+                struct.pack(
+                    "2H",
+                    math.floor((x - x_min) / max_scale * MAX_COORD),
+                    math.floor((y - y_min) / max_scale * MAX_COORD),
+                )
+            )
+    return b"".join(result)
+
+
+def check_pack_map(path):
+    with open(path) as f:
+        features = json.load(f)["features"]
+    geometry = load_map(str(path))
+    coords = geometry.coords
+    bounds = [
+        coords[:, 0].min(),
+        coords[:, 0].max(),
+        coords[:, 1].min(),
+        coords[:, 1].max(),
+    ]
+    packed = pack_map(geometry, bounds)
+    for feature, result in zip(features, packed):
+        if feature["geometry"] is None:
+            assert result is None
+        else:
+            expected = reference_pack(feature["geometry"]["coordinates"], bounds)
+            assert result == expected, feature["properties"]
+
+
+def test_pack_map_matches_reference(tmp_path):
+    square = [[0, 0], [0, 4], [4, 4], [4, 0], [0, 0]]
+    hole = [[1, 1], [1, 2], [2, 2], [2, 1]]
+    features = [
+        {"type": "Polygon", "coordinates": [square, hole]},
+        {"type": "Polygon", "coordinates": [square[::-1], hole[::-1]]},
+        {
+            "type": "MultiPolygon",
+            "coordinates": [[square], [[[5, 5], [6, 5], [5.5, 7.25]]]],
+        },
+        None,
+    ]
+    path = tmp_path / "map.json"
+    path.write_text(
+        json.dumps(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {"type": "Feature", "properties": {"i": i}, "geometry": g}
+                    for i, g in enumerate(features)
+                ],
+            }
+        )
+    )
+    check_pack_map(path)
+
+
+def test_pack_map_matches_reference_on_states():
+    check_pack_map(os.path.join(HERE, "geo", "states.json"))
+
+
+# Run-length encoding
+
+
+def test_encode_runs_matches_reference():
+    rng = random.Random(0)
+    for _ in range(20000):
+        series = random_series(rng, rng.randrange(0, 60))
+        expected = process_runs_python(series)
+        for data in [series, np.array(series, dtype=np.int32)]:
+            assert encode_runs(data) == expected, series
+        assert decode_runs(expected) == series
+
+
+# Varints
+
+
+def test_varints_round_trip_extremes():
+    values = np.array([0, 1, -1, 63, 64, -65, 1 << 40, -(1 << 62)])
+    assert (unzigzag(decode_varints(encode_varints(zigzag(values)))) == values).all()
+
+
+def test_series_round_trip_against_runs():
+    rng = random.Random(0)
+    rows = [random_series(rng, 90, big=True) for _ in range(2000)]
+    data, offsets = encode_series(rows)
+    for i, series in enumerate(rows):
+        decoded = decode_series(data[offsets[i] : offsets[i + 1]], len(series))[0]
+        assert decoded.tolist() == decode_runs(encode_runs(series))
+    assert (decode_series(data, 90) == np.array(rows)).all()
+
+
+# Shared arcs
+
+
+def test_arcs_and_shapes_round_trip():
+    rng = np.random.default_rng(0)
+    arcs = [
+        rng.integers(0, MAX_COORD + 1, (rng.integers(2, 9), 2)).astype(np.uint16)
+        for _ in range(50)
+    ]
+    decoded = decode_arcs(encode_arcs(arcs))
+    assert len(decoded) == len(arcs)
+    assert all((a == b).all() for a, b in zip(arcs, decoded))
+    assert decode_arcs(encode_arcs([])) == []
+    for _ in range(500):
+        rings = [
+            (
+                [int(i) if rng.random() < 0.5 else ~int(i) for i in refs],
+                int(rng.integers(0, 3)) * int(rng.integers(0, 1000)),
+            )
+            for refs in (
+                rng.integers(0, 100000, rng.integers(0, 6))
+                for _ in range(rng.integers(0, 4))
+            )
+        ]
+        assert decode_shape(encode_shape(rings)) == rings
+
+
+def check_topology(polygons):
+    arcs, shapes = build_topology(polygons)
+    arcs = decode_arcs(encode_arcs(arcs))
+    for polygon, shape in zip(polygons, shapes):
+        shape = decode_shape(encode_shape(shape))
+        rings = [decode_ring(arcs, refs, start) for refs, start in shape]
+        assert np.concatenate(rings).tobytes() == polygon
+
+
+def test_topology_rebuilds_rings():
+    # Two squares sharing an edge, the second with a triangle hole
+    left = [(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)]
+    right = [(2, 0), (2, 2), (4, 2), (4, 0), (2, 0)]
+    hole = [(3, 1), (2, 1), (3, 0), (3, 1)]
+    check_topology(
+        [
+            np.array(left, dtype=np.uint16).tobytes(),
+            np.array(right + hole, dtype=np.uint16).tobytes(),
+        ]
+    )
+
+
+def test_topology_keeps_degenerate_rings():
+    square = [(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)]
+    # A ring the client only finds the end of at the end of the polygon, a
+    # single vertex, and a ring touching itself at a junction vertex
+    unclosed = [(5, 5), (5, 7), (7, 7), (7, 5)]
+    single = [(9, 9)]
+    pinched = [(2, 2), (3, 3), (4, 2), (3, 1), (2, 0), (2, 1), (1, 1), (2, 2)]
+    polygons = [
+        np.array(square + single + unclosed, dtype=np.uint16).tobytes(),
+        np.array(single + square, dtype=np.uint16).tobytes(),
+        np.array(pinched, dtype=np.uint16).tobytes(),
+    ]
+    check_topology(polygons)
+    for polygon in polygons:
+        lengths = [len(ring) for ring in polygon_rings(polygon)]
+        assert sum(lengths) * 4 == len(polygon)
+
+
+# Reader
+
+
+def sample_records(num_days=30):
+    rng = random.Random(0)
+    records = []
+    for s in range(3):
+        records.append(
+            {
+                "type": "state",
+                "name": f"State {s}",
+                "fips": f"{s + 1:02d}",
+                "population": rng.randrange(10**6, 10**7),
+                "polygon": polygon(rng, 2),
+            }
+        )
+        for c in range(4):
+            cases = random_series(rng, num_days)
+            records.append(
+                {
+                    "type": "county",
+                    "name": f"County {c}",
+                    "fips": f"{s + 1:02d}{c + 1:03d}",
+                    "population": rng.randrange(1000, 10**6),
+                    "polygon": polygon(rng, 1 + c % 2),
+                    "cases": cases,
+                    "deaths": [value // 20 for value in cases],
+                }
+            )
+    return records
+
+
+def polygon(rng, num_rings):
+    rings = []
+    for _ in range(num_rings):
+        ring = [
+            (rng.randrange(MAX_COORD), rng.randrange(MAX_COORD))
+            for _ in range(rng.randrange(3, 10))
+        ]
+        rings.extend(ring + ring[:1])
+    return np.array(rings, dtype=np.uint16).tobytes()
+
+
+@pytest.mark.parametrize("series_encoding", ["int32", "varint"])
+def test_reader_v1_matches_v2(tmp_path, series_encoding):
+    records = sample_records()
+    v1 = tmp_path / "v1.bin"
+    v2 = tmp_path / "v2.bin"
+    write_v1(str(v1), "4/5/2020", "1/21/2020", records, Stages())
+    write_v2(str(v2), "4/5/2020", "1/21/2020", records, series_encoding=series_encoding)
+
+    with OutputReader(str(v1)) as a, OutputReader(str(v2)) as b:
+        assert (a.version, b.version) == (1, 2)
+        assert len(a.regions) == len(b.regions) == len(records)
+        assert (a.last_updated, a.first_date) == (b.last_updated, b.first_date)
+        for record, x, y in zip(records, a.regions, b.regions):
+            for region in (x, y):
+                assert region["type"] == record["type"]
+                assert region["name"] == record["name"]
+                assert region["population"] == record["population"]
+            assert x["state"] == y["state"]
+            assert y["fips"] == record["fips"]
+            assert a.polygon(x).tobytes() == record["polygon"]
+            assert b.polygon(y).tobytes() == record["polygon"]
+            for metric in METRICS:
+                if record["type"] == "state":
+                    assert a.series(x, metric) is None
+                    assert b.series(y, metric) is None
+                else:
+                    assert a.series(x, metric).tolist() == record[metric]
+                    assert b.series(y, metric).tolist() == record[metric]
+        assert b.find("County 2", state="State 1")["fips"] == "02003"
@@ -0,0 +1,106 @@
+# Tests for the simplified levels of detail
+
+import os
+
+import numpy as np
+
+from geometry import (
+    LOD_TOLERANCES,
+    MapGeometry,
+    load_map,
+    ring_stretches,
+    simplify_maps,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_map(polygons):
+    """MapGeometry of polygons given as lists of closed rings, outer first."""
+    rings = [ring for polygon in polygons for ring in polygon]
+    return MapGeometry(
+        [None] * len(polygons),
+        np.concatenate([np.array(ring, dtype=np.float64) for ring in rings]),
+        np.cumsum([0] + [len(ring) for ring in rings]),
+        np.array([i != 0 for polygon in polygons for i in range(len(polygon))]),
+        np.cumsum([0] + [len(polygon) for polygon in polygons]),
+    )
+
+
+def all_rings(maps):
+    return [
+        ring
+        for m in maps
+        for i in range(len(m.features))
+        for ring in m.feature_rings(i)
+    ]
+
+
+def check_borders(maps, tolerance):
+    """Simplifies maps, checking that every vertex on an edge shared by
+    several rings is either kept by all of them or by none. Returns the
+    simplified rings."""
+    original = all_rings(maps)
+    simplified = all_rings(simplify_maps(maps, tolerance))
+    assert len(simplified) == len(original)
+    _, shared, _ = ring_stretches([ring[:-1] for ring in original])
+    kept_by = {}
+    for ring, counts, result in zip(original, shared, simplified):
+        assert (result[0] == result[-1]).all()
+        kept = {tuple(point) for point in result.tolist()}
+        on_border = (counts > 1) | (np.roll(counts, 1) > 1)
+        for point in ring[:-1][on_border].tolist():
+            kept_by.setdefault(tuple(point), set()).add(tuple(point) in kept)
+    assert all(len(flags) == 1 for flags in kept_by.values())
+    return simplified
+
+
+def test_rings_keep_a_triangle():
+    tiny_square = [(10, 10), (10, 10.1), (10.1, 10.1), (10.1, 10), (10, 10)]
+    tiny_triangle = [(20, 20), (20, 20.1), (20.1, 20), (20, 20)]
+    line = [(0, 0), (0, 1), (0, 2), (0, 3), (3, 3), (3, 0), (0, 0)]
+    simplified = check_borders(
+        [make_map([[tiny_square], [tiny_triangle], [line]])], 1.0
+    )
+    assert len(simplified[0]) == 4
+    assert len(np.unique(simplified[0], axis=0)) == 3
+    assert simplified[1].tolist() == [list(point) for point in tiny_triangle]
+    # The points along a straight side go
+    assert simplified[2].tolist() == [[0, 0], [0, 3], [3, 3], [3, 0], [0, 0]]
+
+
+def test_borders_match_at_junctions():
+    # Two regions side by side with a wiggly border, below a third spanning
+    # both, so three rings meet at (10, 10)
+    border = [(10 + 0.1 * (y % 2), y) for y in range(11)]
+    border[5] = (12, 5)
+    left = [(0, 0), (0, 10)] + border[::-1][:-1] + [(10, 0), (0, 0)]
+    right = border + [(20, 10), (20, 0), (10, 0)]
+    top = [(0, 10), (0, 15), (20, 15), (20, 10), (10, 10), (0, 10)]
+    simplified = check_borders([make_map([[left], [right], [top]])], 1.0)
+    for ring in simplified:
+        assert [10, 10] in ring.tolist()
+    # The bump survives in both regions, the wiggles in neither
+    left_border = {p for p in map(tuple, simplified[0].tolist()) if p[0] >= 10}
+    right_border = {p for p in map(tuple, simplified[1].tolist()) if p[0] < 20}
+    assert left_border == right_border
+    assert {(10, 0), (12, 5), (10, 10)} <= left_border
+    assert all(x != 10.1 for x, _ in left_border)
+
+
+def test_holes_match_their_islands():
+    # A tiny island filling a hole simplifies below a triangle on both sides
+    island = [(5, 5), (5, 5.1), (5.05, 5.15), (5.1, 5.1), (5.1, 5), (5, 5)]
+    outer = [(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]
+    simplified = check_borders([make_map([[outer, island[::-1]], [island]])], 1.0)
+    hole, simplified_island = simplified[1], simplified[2]
+    assert len(np.unique(hole, axis=0)) >= 3
+    assert sorted(hole.tolist()[:-1]) == sorted(simplified_island.tolist()[:-1])
+
+
+def test_states_borders_match():
+    states = load_map(os.path.join(HERE, "geo", "states.json"))
+    for tolerance in LOD_TOLERANCES:
+        simplified = check_borders([states], tolerance)
+        assert sum(map(len, simplified)) < len(states.coords)
+        assert min(len(np.unique(ring, axis=0)) for ring in simplified) >= 3
@@ -0,0 +1,95 @@
+# Tests for the precomputed labels against the client's own grouping
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from geo.topojson import geometry
+from geometry import load_map, pack_map
+from labels import partition, region_label
+from topology import polygon_rings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def client_grouping(rings):
+    """Transliteration of the grouping loop in getCentroid
+    (src/processing/processCovidData.js)."""
+
+    def is_clockwise(poly):
+        total = 0
+        for i in range(len(poly)):
+            x1, y1 = poly[i]
+            x2, y2 = poly[(i + 1) % len(poly)]
+            total += (x2 - x1) * (y2 + y1)
+        return total >= 0
+
+    groups = []
+    current = []
+    for i, ring in enumerate(rings):
+        if not is_clockwise(ring.tolist()):
+            if current:
+                groups.append(current)
+            current = []
+        current.append(i)
+    if current:
+        groups.append(current)
+    return groups
+
+
+@pytest.fixture(scope="module")
+def counties(tmp_path_factory):
+    """Packed polygons of a few real counties, by FIPS code."""
+    with open(os.path.join(HERE, "geo", "counties.topo.json")) as f:
+        topology = json.load(f)
+    transform = topology["transform"]
+    features = []
+    for obj in topology["objects"]["counties"]["geometries"]:
+        properties = obj["properties"]
+        fips = properties["STATE"] + properties["COUNTY"]
+        # Augusta has two holes, Monroe twelve separate parts
+        if fips in ("51015", "12087"):
+            features.append(
+                {
+                    "type": "Feature",
+                    "properties": {"fips": fips},
+                    "geometry": geometry(
+                        obj,
+                        topology["arcs"],
+                        transform["scale"],
+                        transform["translate"],
+                    ),
+                }
+            )
+    path = tmp_path_factory.mktemp("map") / "counties.json"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    geometry_map = load_map(str(path))
+    coords = geometry_map.coords
+    bounds = [
+        coords[:, 0].min(),
+        coords[:, 0].max(),
+        coords[:, 1].min(),
+        coords[:, 1].max(),
+    ]
+    packed = pack_map(geometry_map, bounds)
+    return {f["properties"]["fips"]: p for f, p in zip(features, packed)}
+
+
+@pytest.mark.parametrize("fips,num_rings", [("51015", 3), ("12087", 12)])
+def test_partition_matches_client(counties, fips, num_rings):
+    rings = polygon_rings(counties[fips])
+    assert len(rings) == num_rings
+    assert partition(rings) == client_grouping(rings)
+
+
+def test_region_label_parts(counties):
+    label = region_label(counties["51015"])
+    # The client makes each of Augusta's holes a polygon of its own
+    assert len(label["parts"]) == 3
+    x, y, d = label["label"]
+    x_min, y_min, x_max, y_max = label["bbox"]
+    assert x_min <= x <= x_max and y_min <= y <= y_max and d > 0
+    points = np.frombuffer(counties["51015"], dtype=np.uint16).reshape(-1, 2)
+    assert (x_min, y_min) == tuple(points.min(axis=0))
@@ -0,0 +1,15 @@
+# Tests for the NYT CSV parsing
+
+import numpy as np
+
+from nyt_process import SeriesMatrix
+
+
+def test_matrix_grows_from_empty():
+    empty = np.zeros((0, 0), dtype=np.int32)
+    matrix = SeriesMatrix.from_data({"places": [], "cases": empty, "deaths": empty})
+    matrix.set(("Autauga", "Alabama", "01001"), 2, 5, 1)
+    data = matrix.finish()
+    assert data["places"] == [("Autauga", "Alabama", "01001")]
+    assert data["cases"].tolist() == [[0, 0, 5]]
+    assert data["deaths"].tolist() == [[0, 0, 1]]
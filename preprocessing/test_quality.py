@@ -0,0 +1,141 @@
+# Tests for the data-quality checks and repairs
+
+import numpy as np
+import pytest
+
+from quality import QUIET_DAYS, SPIKE_MINIMUM, resolve_policies, validate
+
+# Small hand-made cases: rows a to d are checked, the last one isn't
+CASES = np.array(
+    [
+        [0, 1, 2, 2, 2, 2, 60, 61],
+        [5, 5, 4, 6, 7, 8, 9, 10],
+        [0, 0, 3, 0, 4, 4, 0, 5],
+        [0, 100, 100, 0, 0, 0, 200, 200],
+        [9, 9, 9, 9, 9, 9, 9, 9],
+    ]
+)
+DEATHS = np.array(
+    [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 6, 1, 1, 1, 1, 1, 1],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [10, 10, 10, 10, 10, 10, 10, 10],
+    ]
+)
+PLACES = ["a", "b", "c", "d", "unknown"]
+CHECKED = [True, True, True, True, False]
+
+
+def test_default_policies():
+    fixed_cases, fixed_deaths, summary = validate(CASES, DEATHS, PLACES, CHECKED)
+    assert (fixed_cases == CASES).all()
+    assert fixed_deaths[1].tolist() == [0, 5, 1, 1, 1, 1, 1, 1]
+    assert (fixed_deaths[4] == DEATHS[4]).all()
+    assert summary["deaths_over_cases"]["cells"] == 1
+    assert summary["gaps"]["cells"] == 5
+    assert summary["cases_decreases"]["cells"] == 4
+    # Row a is quiet for 3 days before 58 new cases; row c's increases are
+    # too small to be backlogs and row d's comeback follows a gap
+    assert summary["late_reports"]["cells"] == 1
+    assert summary["late_reports"]["quiet_days"] == 3
+    # Only row d's first 100 cases
+    assert summary["spikes"]["cells"] == 1
+
+
+def test_repair_policies():
+    fixed_cases, _, summary = validate(
+        CASES,
+        DEATHS,
+        PLACES,
+        CHECKED,
+        {"gaps": "fill", "decreases": "carry", "late_reports": "spread"},
+    )
+    assert fixed_cases[0].tolist() == [0, 1, 2, 16, 30, 44, 60, 61]
+    assert fixed_cases[1].tolist() == [5, 5, 5, 6, 7, 8, 9, 10]
+    assert fixed_cases[2].tolist() == [0, 0, 3, 3, 4, 4, 4, 5]
+    # With its gap filled, row d's last 100 cases are a backlog
+    assert fixed_cases[3].tolist() == [0, 100, 120, 140, 160, 180, 200, 200]
+    assert (fixed_cases[4] == CASES[4]).all()
+    assert summary["cases_decreases"]["cells"] == 1
+
+
+def test_late_report_thresholds():
+    cases = np.array(
+        [
+            # QUIET_DAYS quiet days, then exactly SPIKE_MINIMUM new cases
+            [10, 10, 10, 10, 10 + SPIKE_MINIMUM, 60, 60, 60, 60],
+            # One case short of SPIKE_MINIMUM
+            [10, 10, 10, 10, 9 + SPIKE_MINIMUM, 59, 59, 59, 59],
+            # One quiet day short
+            [10, 10, 10, 60, 60, 60, 60, 60, 60],
+            # Not over BACKLOG_FACTOR times the trailing week's average
+            [0, 100, 200, 300, 400, 400, 400, 400, 500],
+        ]
+    )
+    assert QUIET_DAYS == 3
+    places = ["a", "b", "c", "d"]
+    checked = [True] * 4
+    _, _, summary = validate(cases, np.zeros_like(cases), places, checked)
+    late_reports = summary["late_reports"]
+    assert late_reports["cells"] == 1
+    assert late_reports["examples"] == [{"place": "a", "day": 4, "amount": 50}]
+    assert late_reports["quiet_days"] == 3
+
+    fixed_cases, _, summary = validate(
+        cases, np.zeros_like(cases), places, checked, {"late_reports": "spread"}
+    )
+    # 50 cases over 4 days, the remainder on the day they were reported
+    assert fixed_cases[0].tolist() == [10, 22, 34, 46, 60, 60, 60, 60, 60]
+    assert (fixed_cases[1:] == cases[1:]).all()
+    assert summary["late_reports"]["repaired"] == 1
+
+
+def test_gaps():
+    cases = np.array(
+        [
+            # Zeros before the first case aren't gaps
+            [0, 0, 5, 0, 7],
+            # Neither is a day that still reports deaths
+            [0, 4, 0, 6, 6],
+            # Nor anything in a row that isn't checked
+            [3, 0, 3, 3, 3],
+        ]
+    )
+    deaths = np.array([[0, 0, 1, 0, 1], [0, 0, 1, 1, 1], [0, 0, 0, 0, 0]])
+    places = ["a", "b", "unknown"]
+    checked = [True, True, False]
+
+    fixed_cases, _, summary = validate(cases, deaths, places, checked)
+    assert summary["gaps"]["cells"] == 1
+    assert summary["gaps"]["examples"][0] == {"place": "a", "day": 3, "amount": 1}
+    assert summary["gaps"]["repaired"] == 0
+    assert (fixed_cases == cases).all()
+
+    fixed_cases, fixed_deaths, summary = validate(
+        cases, deaths, places, checked, {"gaps": "fill"}
+    )
+    assert summary["gaps"]["repaired"] == 1
+    assert fixed_cases[0].tolist() == [0, 0, 5, 5, 7]
+    assert fixed_deaths[0].tolist() == [0, 0, 1, 1, 1]
+    assert (fixed_cases[1:] == cases[1:]).all()
+    # Filled, row a no longer goes down
+    assert summary["cases_decreases"]["places"] == 1
+
+
+def test_deaths_over_cases_ignore():
+    _, fixed_deaths, summary = validate(
+        CASES, DEATHS, PLACES, CHECKED, {"deaths_over_cases": "ignore"}
+    )
+    assert (fixed_deaths == DEATHS).all()
+    assert summary["deaths_over_cases"]["cells"] == 1
+    assert summary["deaths_over_cases"]["repaired"] == 0
+
+
+@pytest.mark.parametrize(
+    "policies", [{"gap": "fill"}, {"gaps": "carry"}, {"spikes": "ignore"}]
+)
+def test_unknown_policies(policies):
+    with pytest.raises(ValueError):
+        resolve_policies(policies)
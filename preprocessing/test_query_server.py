@@ -0,0 +1,158 @@
+# Tests for the query server, over real connections to a build on disk
+
+import asyncio
+import json
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from binary_format import write_v2
+from load_test import request
+from query_server import QueryServer, serve
+
+SQUARE = np.array([(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)], dtype=np.uint16)
+
+
+def write_build(fn, cases):
+    records = [
+        {
+            "type": "state",
+            "name": "Alabama",
+            "fips": "01",
+            "population": 100,
+            "polygon": SQUARE.tobytes(),
+        },
+        {
+            "type": "county",
+            "name": "Autauga",
+            "fips": "01001",
+            "population": 10,
+            "polygon": SQUARE.tobytes(),
+            "cases": cases,
+            "deaths": [0] * len(cases),
+        },
+    ]
+    write_v2(str(fn), "today", "1/21/2020", records)
+
+
+@pytest.fixture
+def build(tmp_path):
+    fn = tmp_path / "output.bin"
+    write_build(fn, [1, 2, 3])
+    return fn
+
+
+def run_requests(fn, targets, setup=None):
+    """Serves fn and sends each target on one keep-alive connection,
+    returning the (status, headers, body) responses."""
+
+    async def main():
+        query_server, server = await serve(str(fn), interval=3600)
+        if setup is not None:
+            setup(query_server)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            return [
+                await request(reader, writer, f"127.0.0.1:{port}", target)
+                for target in targets
+            ]
+        finally:
+            writer.close()
+            server.watch_task.cancel()
+            server.close()
+            await server.wait_closed()
+            query_server.snapshot.close()
+
+    return asyncio.run(main())
+
+
+def test_errors_answer_500_and_keep_the_connection(build):
+    def setup(query_server):
+        def broken(region, metric="cases"):
+            raise ValueError("corrupt series")
+
+        query_server.snapshot.reader.series = broken
+
+    responses = run_requests(
+        build, ["/regions/01001/series/cases", "/regions/01001/polygon"], setup
+    )
+    assert [status for status, _, _ in responses] == [500, 200]
+    assert responses[0][2] == b"Internal Server Error\n"
+
+
+def test_endpoints(build):
+    targets = [
+        "/meta",
+        "/states",
+        "/states/Alabama/counties",
+        "/states/01/counties",
+        "/regions/01001",
+        "/regions/01001/series/cases",
+        "/regions/01001/series/cases?format=bin",
+        "/regions/01/polygon",
+        "/regions/01/series/cases",
+        "/regions/99999",
+    ]
+    responses = dict(zip(targets, run_requests(build, targets)))
+    assert {target: status for target, (status, _, _) in responses.items()} == {
+        **{target: 200 for target in targets[:-2]},
+        "/regions/01/series/cases": 404,
+        "/regions/99999": 404,
+    }
+
+    def body(target):
+        return json.loads(responses[target][2])
+
+    assert body("/meta")["lastUpdated"] == "today"
+    assert body("/meta")["days"] == 3
+    assert body("/states") == [{"name": "Alabama", "fips": "01"}]
+    county = body("/regions/01001")
+    assert county["cases"] == [1, 2, 3] and county["state"] == "Alabama"
+    assert body("/states/Alabama/counties") == body("/states/01/counties")
+    assert body("/states/01/counties")[0]["cases"] == 3
+    assert body("/regions/01001/series/cases") == [1, 2, 3]
+    assert responses["/regions/01001/series/cases?format=bin"][2] == struct.pack(
+        "<3i", 1, 2, 3
+    )
+    assert responses["/regions/01/polygon"][2] == SQUARE.tobytes()
+
+
+def test_unchanged_queries_get_304(build):
+    server = QueryServer(str(build))
+    try:
+        status, headers, _ = server.handle_request("GET", "/regions/01001", {})
+        assert status == 200
+        status, _, body = server.handle_request(
+            "GET", "/regions/01001", {"if-none-match": headers["ETag"]}
+        )
+        assert (status, body) == (304, b"")
+    finally:
+        server.snapshot.close()
+
+
+def test_hot_reload(build, tmp_path):
+    server = QueryServer(str(build))
+    try:
+        _, old_headers, _ = server.handle_request("GET", "/regions/01001", {})
+        assert not server.reload()
+
+        # A half-written build keeps the old one serving
+        tmp_fn = tmp_path / "output.tmp"
+        write_build(tmp_fn, [1, 2, 3, 5])
+        partial_fn = tmp_path / "partial.tmp"
+        partial_fn.write_bytes(tmp_fn.read_bytes()[:100])
+        os.replace(partial_fn, build)
+        assert not server.reload()
+        _, _, body = server.handle_request("GET", "/regions/01001/series/cases", {})
+        assert json.loads(body) == [1, 2, 3]
+
+        os.replace(tmp_fn, build)
+        assert server.reload()
+        _, headers, body = server.handle_request("GET", "/regions/01001", {})
+        assert json.loads(body)["cases"] == [1, 2, 3, 5]
+        assert headers["ETag"] != old_headers["ETag"]
+    finally:
+        server.snapshot.close()
@@ -0,0 +1,124 @@
+# Tests for the content-hashed split output
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from binary_format import read_sections
+from reader import OutputReader
+from split_output import DATA_DIR, write_split
+from varints import decode_series
+
+SQUARE = np.array([(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)], dtype=np.uint16)
+
+
+def sample_records(num_days):
+    records = [
+        {
+            "type": "state",
+            "name": "Alabama",
+            "fips": "01",
+            "population": 100,
+            "polygon": SQUARE.tobytes(),
+        }
+    ]
+    for c in range(3):
+        cases = [day * (c + 1) for day in range(num_days)]
+        records.append(
+            {
+                "type": "county",
+                "name": f"County {c}",
+                "fips": f"0100{c}",
+                "population": 10,
+                "polygon": SQUARE.tobytes(),
+                "cases": cases,
+                "deaths": [value // 3 for value in cases],
+            }
+        )
+    return records
+
+
+def read_chunk(public_dir, entry, series_encoding):
+    """{metric: (series, day) matrix} of a series chunk."""
+    with open(os.path.join(public_dir, entry["file"]), "rb") as f:
+        data = f.read()
+    header, sections = read_sections(data)
+    offset, size = sections["meta"]
+    meta = json.loads(data[offset : offset + size])
+    assert (meta["firstDay"], meta["days"]) == (entry["start"], header["days"])
+    result = {}
+    for metric in meta["metrics"]:
+        offset, size = sections[metric]
+        if series_encoding == "varint":
+            start = offset + 4 * (header["records"] + 1)
+            values = decode_series(data[start : offset + size], header["days"])
+        else:
+            values = np.frombuffer(data, "<i4", size // 4, offset)
+        result[metric] = values.reshape(header["records"], header["days"])
+    return result
+
+
+@pytest.mark.parametrize("series_encoding", ["int32", "varint"])
+def test_chunks_rebuild_series(tmp_path, series_encoding):
+    records = sample_records(10)
+    manifest = write_split(
+        str(tmp_path),
+        "today",
+        "1/21/2020",
+        records,
+        series_encoding=series_encoding,
+        chunk_days=4,
+        compress=False,
+    )
+    assert [(c["start"], c["end"]) for c in manifest["series"]] == [
+        (0, 4),
+        (4, 8),
+        (8, 10),
+    ]
+    chunks = [read_chunk(tmp_path, c, series_encoding) for c in manifest["series"]]
+    for metric in ("cases", "deaths"):
+        expected = [r[metric] for r in records if r["type"] == "county"]
+        values = np.concatenate([chunk[metric] for chunk in chunks], axis=1)
+        assert values.tolist() == expected
+
+    with OutputReader(str(tmp_path / manifest["geometry"]["file"])) as reader:
+        assert reader.metrics == ()
+        assert reader.last_updated is None
+        assert [region["name"] for region in reader.regions] == [
+            record["name"] for record in records
+        ]
+        assert reader.polygon(1).tobytes() == SQUARE.tobytes()
+
+
+def test_appended_days_reuse_files(tmp_path):
+    def build(num_days):
+        return write_split(
+            str(tmp_path),
+            f"day {num_days}",
+            "1/21/2020",
+            sample_records(num_days),
+            chunk_days=4,
+        )
+
+    first = build(6)
+    second = build(7)
+    assert second["lastUpdated"] == "day 7"
+    # Only the chunk that gained a day changes name
+    assert second["geometry"] == first["geometry"]
+    assert second["series"][0] == first["series"][0]
+    assert second["series"][1]["file"] != first["series"][1]["file"]
+
+    names = set(os.listdir(tmp_path / DATA_DIR))
+    assert os.path.basename(first["series"][1]["file"]) in names
+    for entry in [second["geometry"], *second["series"]]:
+        for suffix in ("", ".gz", ".br"):
+            assert os.path.basename(entry["file"]) + suffix in names
+
+    # Files of the manifest before the previous one are cleaned up
+    third = build(9)
+    names = set(os.listdir(tmp_path / DATA_DIR))
+    assert os.path.basename(first["series"][1]["file"]) not in names
+    assert os.path.basename(second["series"][1]["file"]) in names
+    assert len(third["series"]) == 3
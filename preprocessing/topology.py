@@ -0,0 +1,149 @@
+# Shared-arc encoding of the packed polygons, after TopoJSON
+#
+# Every border between two regions is stored once in an arc table, and each
+# ring becomes a list of arc references, ~i meaning arc i walked backwards.
+# Consecutive arcs of a ring share their joining vertex, so decoding drops the
+# first vertex of every arc after the first. Rings that aren't closed (e.g.
+# single vertices) aren't loops, so each is stored whole as an arc of its own
+# and comes back exactly as it was. A closed ring's arcs start at a junction
+# rather than at its first vertex, so each ring also records the vertex its
+# arcs start from, and decoding rotates it back. Both the arc table and the
+# references are written as delta-coded varints, since the deltas between
+# neighbouring vertices and between a ring's arc indexes are mostly small.
+
+import numpy as np
+
+from geometry import is_reversed, ring_stretches
+from varints import decode_varints, encode_varints, unzigzag, zigzag
+
+
+def polygon_rings(polygon):
+    """Splits a packed polygon into its rings the way the client does: a ring
+    ends when its first vertex comes round again."""
+    points = np.frombuffer(polygon, dtype=np.uint16).reshape(-1, 2)
+    rings = []
+    start = 0
+    while start < len(points):
+        repeats = (points[start + 1 :] == points[start]).all(axis=1)
+        end = start + 2 + int(np.argmax(repeats)) if repeats.any() else len(points)
+        rings.append(points[start:end])
+        start = end
+    return rings
+
+
+def build_topology(polygons):
+    """Returns (arcs, shapes) for a list of packed polygons: arcs as (n, 2)
+    uint16 arrays and, per polygon, a (arc references, start) pair per ring,
+    start being the vertex of the ring its first arc starts from."""
+    rings = []
+    owners = []
+    closed = []
+    for i, polygon in enumerate(polygons):
+        for ring in polygon_rings(polygon):
+            is_closed = len(ring) > 1 and (ring[0] == ring[-1]).all()
+            rings.append(ring[:-1] if is_closed else ring)
+            owners.append(i)
+            closed.append(is_closed)
+    # Only closed rings take part in finding shared borders
+    ids, _, stretches = ring_stretches(
+        [ring if is_closed else ring[:0] for ring, is_closed in zip(rings, closed)]
+    )
+
+    arcs = []
+    arc_indexes = {}
+    shapes = [[] for _ in polygons]
+    for r, ring in enumerate(rings):
+        if not closed[r]:
+            shapes[owners[r]].append(([len(arcs)], 0))
+            arcs.append(ring)
+            continue
+        refs = []
+        for stretch in stretches[r]:
+            backwards = is_reversed(ids[r], stretch)
+            if backwards:
+                stretch = stretch[::-1]
+            key = ids[r][stretch].tobytes()
+            if key not in arc_indexes:
+                arc_indexes[key] = len(arcs)
+                arcs.append(ring[stretch])
+            refs.append(~arc_indexes[key] if backwards else arc_indexes[key])
+        shapes[owners[r]].append((refs, int(stretches[r][0][0])))
+    return arcs, shapes
+
+
+def decode_ring(arcs, refs, start=0):
+    """Returns the (n, 2) ring for a list of arc references, rotated back so
+    it begins at its original first vertex."""
+    points = []
+    for i, ref in enumerate(refs):
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        points.append(arc if i == 0 else arc[1:])
+    if not points:
+        return np.empty((0, 2), dtype=np.uint16)
+    ring = np.concatenate(points)
+    if start:
+        loop = np.roll(ring[:-1], start, axis=0)
+        ring = np.concatenate([loop, loop[:1]])
+    return ring
+
+
+def encode_arcs(arcs):
+    """Packs the arc table as varints (see varints.py): the arc count, the
+    vertex count of each arc, then the x and y of every vertex as a zigzag
+    delta from the vertex before it, the arcs running on one after another."""
+    lengths = [len(arc) for arc in arcs]
+    if arcs:
+        points = np.concatenate(arcs).astype(np.int64)
+        deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    else:
+        deltas = np.zeros((0, 2), dtype=np.int64)
+    header = np.array([len(arcs)] + lengths, dtype=np.uint64)
+    return encode_varints(header) + encode_varints(zigzag(deltas.ravel()))
+
+
+def decode_arcs(data):
+    values = decode_varints(data)
+    num_arcs = int(values[0])
+    lengths = values[1 : 1 + num_arcs].astype(np.int64)
+    deltas = unzigzag(values[1 + num_arcs :]).reshape(-1, 2)
+    points = np.cumsum(deltas, axis=0).astype(np.uint16)
+    return np.split(points, np.cumsum(lengths)[:-1]) if num_arcs else []
+
+
+def encode_shape(rings):
+    """Packs a shape's (references, start) rings as varints: for each ring
+    twice its reference count, plus one if it has a start other than 0, then
+    that start and its references. Arcs are numbered in the order rings first
+    use them, so each reference is stored as the zigzag difference from the
+    previous arc index, doubled, plus one if the arc is walked backwards."""
+    refs = np.array([ref for ring, _ in rings for ref in ring], dtype=np.int64)
+    indexes = np.where(refs >= 0, refs, ~refs)
+    codes = 2 * zigzag(np.diff(indexes, prepend=0)) + (refs < 0).astype(np.uint64)
+    headers = []
+    positions = []
+    position = 0
+    for ring, start in rings:
+        header = [2 * len(ring) + 1, start] if start else [2 * len(ring)]
+        headers += header
+        positions += [position] * len(header)
+        position += len(ring)
+    return encode_varints(np.insert(codes, positions, headers))
+
+
+def decode_shape(data):
+    values = decode_varints(data).tolist()
+    rings = []
+    previous = 0
+    i = 0
+    while i < len(values):
+        count = values[i] >> 1
+        start = values[i + 1] if values[i] & 1 else 0
+        i += 1 + (values[i] & 1)
+        refs = []
+        for value in values[i : i + count]:
+            delta = value >> 1
+            previous += (delta >> 1) ^ -(delta & 1)
+            refs.append(~previous if value & 1 else previous)
+        rings.append((refs, start))
+        i += count
+    return rings
@@ -0,0 +1,70 @@
+# Delta-encoded time series stored as zigzag varints
+#
+# Cumulative counts barely change from one day to the next, so each series is
+# stored as its day-over-day differences (the first day against 0). The
+# differences are zigzag-mapped to unsigned integers (0, -1, 1, -2, ... ->
+# 0, 1, 2, 3, ...) so the occasional downward correction stays small, then
+# written as LEB128 varints: 7 bits per byte, least significant first, with
+# the high bit set on every byte but the last.
+
+import numpy as np
+
+
+def zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def unzigzag(values):
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(
+        np.int64
+    )
+
+
+def varint_lengths(values):
+    """Number of bytes each unsigned value takes as a varint."""
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= np.uint64(1 << shift)
+    return lengths
+
+
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = varint_lengths(values)
+    owners = np.repeat(np.arange(len(values)), lengths)
+    # Position of every output byte within its value
+    shifts = np.arange(len(owners)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    data = (values[owners] >> (7 * shifts).astype(np.uint64)) & np.uint64(0x7F)
+    data |= (shifts < lengths[owners] - 1).astype(np.uint64) << np.uint64(7)
+    return data.astype(np.uint8).tobytes()
+
+
+def decode_varints(data):
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts + 1
+    shifts = np.arange(len(data)) - np.repeat(starts, lengths)
+    parts = (data & 0x7F).astype(np.uint64) << (7 * shifts).astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+def encode_series(rows):
+    """Encodes a (series, day) matrix of counts, returning the varint bytes and
+    the byte offset of every series (plus a final end offset)."""
+    rows = np.asarray(rows, dtype=np.int64).reshape(len(rows), -1)
+    deltas = zigzag(np.diff(rows, axis=1, prepend=0))
+    lengths = varint_lengths(deltas.ravel()).reshape(deltas.shape)
+    offsets = np.concatenate([[0], np.cumsum(lengths.sum(axis=1))])
+    return encode_varints(deltas.ravel()), offsets
+
+
+def decode_series(data, num_days):
+    """Decodes the bytes of one or more consecutive series back into a
+    (series, day) matrix of int64 counts."""
+    deltas = unzigzag(decode_varints(data)).reshape(-1, num_days)
+    return np.cumsum(deltas, axis=1)